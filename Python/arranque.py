@@ -0,0 +1,80 @@
+# arranque.py — Medición del tiempo de arranque (hasta que la ventana responde)
+# Importar primero en el punto de entrada: el reloj empieza al importar este módulo.
+# Cada arranque agrega una línea a arranque.jsonl; con FARMACIA_ARRANQUE=1 además se imprime
+# el detalle y la comparación con la mediana de los arranques anteriores.
+
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+ARRANQUE_RUTA   = "arranque.jsonl"
+ARRANQUE_HIST   = 20      # arranques anteriores contra los que se compara
+
+_T0 = time.perf_counter()
+_marcas: List[Tuple[str, float]] = []
+_duraciones: Dict[str, float] = {}
+_guardados = set()
+
+
+def marcar(nombre: str):
+    """Registra un hito (ms desde el inicio)."""
+    _marcas.append((nombre, (time.perf_counter() - _T0) * 1000))
+
+
+def duracion(nombre: str, ms: float):
+    """Registra cuánto tardó algo puntual (p. ej. armar una pestaña), aparte de los hitos."""
+    _duraciones[nombre] = round(ms, 1)
+
+
+def marcas() -> Dict[str, float]:
+    return {n: round(ms, 1) for n, ms in _marcas}
+
+
+def listo(nombre: str = "interactivo", ruta: str = ARRANQUE_RUTA) -> Dict[str, float]:
+    """
+    Marca el momento en que una ventana ya responde y guarda el informe (una vez por nombre).
+    Llamar desde after_idle(), así cuenta el primer dibujado.
+    """
+    marcar(nombre)
+    informe = {"fecha": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": sys.version.split()[0],
+               "hasta": nombre, "modulos": len(sys.modules), "marcas": marcas(), "duraciones": dict(_duraciones)}
+    if nombre in _guardados:
+        return informe
+    _guardados.add(nombre)
+    previos = _historial(ruta)
+    try:
+        with open(ruta, "a", encoding="utf-8") as f:
+            f.write(json.dumps(informe) + "\n")
+    except OSError:
+        pass   # sin permiso de escritura: la medición no puede impedir el arranque
+    if os.environ.get("FARMACIA_ARRANQUE"):
+        imprimir(informe, previos)
+    return informe
+
+
+def _historial(ruta: str) -> List[Dict]:
+    try:
+        with open(ruta, encoding="utf-8") as f:
+            return [json.loads(l) for l in f if l.strip()][-ARRANQUE_HIST:]
+    except (OSError, ValueError):
+        return []
+
+
+def _mediana(valores: List[float]) -> Optional[float]:
+    if not valores:
+        return None
+    v = sorted(valores)
+    m = len(v) // 2
+    return v[m] if len(v) % 2 else (v[m - 1] + v[m]) / 2
+
+
+def imprimir(informe: Dict, previos: Optional[List[Dict]] = None):
+    previos = previos if previos is not None else _historial(ARRANQUE_RUTA)
+    print(f"Arranque hasta {informe['hasta']} ({informe['modulos']} módulos cargados):", file=sys.stderr)
+    for grupo in ("marcas", "duraciones"):
+        for nombre, ms in informe.get(grupo, {}).items():
+            med = _mediana([p[grupo][nombre] for p in previos if nombre in p.get(grupo, {})])
+            extra = f"   mediana anterior {med:8.1f} ms ({(ms - med) / med * 100:+.0f}%)" if med else ""
+            print(f"  {nombre:<24} {ms:8.1f} ms{extra}", file=sys.stderr)
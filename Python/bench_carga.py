@@ -0,0 +1,381 @@
+# bench_carga.py — Generador de datos sintéticos y prueba de carga de la API de negocio de db.py
+# Uso: python bench_carga.py local [segundos] [cajeros] [receptores] [productos] [años]
+#      python bench_carga.py sqlserver [segundos] [cajeros] [receptores] [productos] [años]
+#      python bench_carga.py comparar [archivo]
+#      python bench_carga.py reintentos [cajeros] [ventas por cajero] [productos]
+# "local" corre contra db_local.BDLocal (SQLite, sin red: apto para CI) con años de historial de ventas.
+# "sqlserver" usa db.py (carga productos y lotes con compra_crear) y ¡graba datos reales!:
+# ejecutar solo contra una BD de pruebas.
+# Cada corrida agrega una línea a bench_resultados.jsonl para comparar contra corridas anteriores.
+# "reintentos" vende contra BDLocal con fallas inyectadas (deadlocks y respuestas perdidas) pasando
+# por db.con_reintentos y verifica que no se duplique ni se pierda ninguna venta.
+
+import datetime as dt
+import json
+import random
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import db_local
+
+CARGA_PREFIJO   = "CARGA-"
+CARGA_CLAVE     = "carga"                     # clave de los usuarios sintéticos
+CARGA_LOTE      = 5000                        # filas por carga masiva
+RESULTADOS      = "bench_resultados.jsonl"
+
+# Mezcla de operaciones por rol: (operación, peso). Un cajero busca varias veces por venta.
+MEZCLA_CAJERO   = (("sugerir", 60), ("venta", 30), ("get", 8), ("login", 2))
+MEZCLA_RECEPTOR = (("compra", 70), ("sugerir", 25), ("login", 5))
+PAUSA_MS        = (0, 0)                      # espera aleatoria entre operaciones (tiempo de tipeo)
+
+_PALABRAS = ("paracetamol", "ibuprofeno", "amoxicilina", "omeprazol", "loratadina", "diclofenac",
+             "metformina", "losartan", "salbutamol", "cetirizina", "ranitidina", "clonazepam")
+_FORMAS = ("comprimidos", "jarabe", "gotas", "crema", "cápsulas", "ampolla")
+
+
+# ===================== Datos sintéticos =====================
+
+class DatosSinteticos:
+    """
+    Describe un juego de datos reproducible (misma semilla => mismos datos).
+    Los métodos devuelven generadores, así se pueden pedir años de ventas sin tenerlos en memoria.
+    """
+
+    def __init__(self, productos: int = 2000, lotes_por_producto: int = 3, clientes: int = 500,
+                 anios: int = 1, ventas_por_dia: int = 150, cajeros: int = 4, receptores: int = 1, semilla: int = 7):
+        self.productos = productos
+        self.lotes_por_producto = lotes_por_producto
+        self.clientes = clientes
+        self.anios = anios
+        self.ventas_por_dia = ventas_por_dia
+        self.usuarios = [f"cajero{i:02d}" for i in range(cajeros)] + [f"deposito{i:02d}" for i in range(receptores)]
+        self.semilla = semilla
+
+    def codigo(self, i: int) -> str:
+        return f"{CARGA_PREFIJO}{i:06d}"
+
+    def descripcion(self, i: int) -> str:
+        r = random.Random(self.semilla * 1_000_003 + i)
+        return f"{r.choice(_PALABRAS)} {r.choice((100, 250, 400, 500, 750, 1000))} mg {r.choice(_FORMAS)} #{i}"
+
+    def iter_productos(self) -> Iterator[Tuple[str, str, float, int, int]]:
+        """(Codigo, Descripcion, Precio, StockMin, RequiereReceta)."""
+        r = random.Random(self.semilla)
+        for i in range(self.productos):
+            yield (self.codigo(i), self.descripcion(i), float(r.randrange(2000, 150000, 500)),
+                   r.randint(0, 20), int(r.random() < 0.15))
+
+    def iter_lotes(self, hoy: dt.date) -> Iterator[Tuple[int, str, str, int]]:
+        """(IdProducto, Lote, Vence, StockLote); IdProducto es la posición 1..n del producto."""
+        r = random.Random(self.semilla + 1)
+        for i in range(self.productos):
+            for k in range(self.lotes_por_producto):
+                vence = hoy + dt.timedelta(days=r.randint(-30, 720))
+                yield (i + 1, f"L{i:06d}-{k}", vence.isoformat(), r.randint(200, 2000))
+
+    def iter_clientes(self) -> Iterator[Tuple[str, str]]:
+        for i in range(self.clientes):
+            yield (f"{4_000_000 + i}", f"Cliente sintético {i}")
+
+    def iter_ventas(self, hoy: dt.date) -> Iterator[Tuple[dt.datetime, Optional[int], List[Dict[str, Any]]]]:
+        """Historial de `anios` años: (fecha, cliente, items). Popularidad de productos tipo Zipf."""
+        r = random.Random(self.semilla + 2)
+        dias = 365 * self.anios
+        for d in range(dias, 0, -1):
+            dia = dt.datetime.combine(hoy - dt.timedelta(days=d), dt.time(8))
+            for _ in range(self.ventas_por_dia):
+                fecha = dia + dt.timedelta(seconds=r.randrange(12 * 3600))
+                cliente = r.randint(1, self.clientes) if self.clientes and r.random() < 0.3 else None
+                yield fecha, cliente, self.carrito(r)
+
+    def carrito(self, r: random.Random) -> List[Dict[str, Any]]:
+        tam = min(1 + int(r.expovariate(1 / 2.5)), 40)
+        return [{"codigo": self.codigo(self.popular(r)), "cant": r.randint(1, 3), "punit": 1000.0}
+                for _ in range(tam)]
+
+    def popular(self, r: random.Random) -> int:
+        """Índice de producto con sesgo: pocos productos concentran la mayoría de las ventas."""
+        return min(int(r.paretovariate(1.16)) - 1, self.productos - 1)
+
+    def termino(self, r: random.Random) -> str:
+        """Lo que tipea un cajero: parte de una palabra, o el comienzo de un código."""
+        if r.random() < 0.3:
+            return self.codigo(self.popular(r))[:len(CARGA_PREFIJO) + 4]
+        return r.choice(_PALABRAS)[:r.randint(3, 6)]
+
+
+def poblar(bd, datos: DatosSinteticos, historial: bool = True) -> Dict[str, float]:
+    """
+    Carga `datos` en `bd` (BDLocal o el módulo db). Devuelve segundos por etapa.
+    En BDLocal se usa carga masiva y el historial se graba tal cual (ya ocurrió: no toca el stock).
+    Contra SQL Server los productos y lotes pasan por compra_crear y no se graba historial.
+    """
+    hoy = dt.date.today()
+    tiempos: Dict[str, float] = {}
+    t0 = time.perf_counter()
+    if not isinstance(bd, db_local.BDLocal):
+        import db
+        prov = bd.proveedores_listar()
+        if not prov:
+            raise ValueError("Se necesita al menos un proveedor para poblar la base.")
+        r = random.Random(datos.semilla + 1)
+        items = ({"codigo": c, "desc": d, "cant": r.randint(200, 2000), "punit": p,
+                  "vence": (hoy + dt.timedelta(days=r.randint(30, 720))).isoformat()}
+                 for c, d, p, _, _ in datos.iter_productos() for _ in range(datos.lotes_por_producto))
+        for bloque in db.en_bloques(items, CARGA_LOTE):
+            bd.compra_crear(1, prov[0][0], bloque)
+        tiempos["productos_y_lotes"] = time.perf_counter() - t0
+        return tiempos
+
+    bd.cargar_masivo("Roles", ("IdRol", "Nombre"), [(1, "ADMIN"), (2, "CAJERO"), (3, "DEPOSITO")])
+    bd.cargar_masivo("Usuarios", ("Usuario", "ClaveHash", "RolId"),
+                     [(u, db_local.clave_hash(CARGA_CLAVE), 2 if u.startswith("cajero") else 3) for u in datos.usuarios])
+    bd.cargar_masivo("Proveedores", ("Ruc", "RazonSocial"), [("80000001-1", "Proveedor sintético")])
+    bd.cargar_masivo("Clientes", ("Documento", "Nombre"), datos.iter_clientes())
+    bd.cargar_masivo("Productos", ("Codigo", "Descripcion", "Precio", "StockMin", "RequiereReceta"),
+                     datos.iter_productos())
+    tiempos["productos"] = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    bd.cargar_masivo("Lotes", ("IdProducto", "Lote", "Vence", "StockLote"), datos.iter_lotes(hoy))
+    bd.ejecutar("UPDATE Productos SET Stock = (SELECT IFNULL(SUM(StockLote), 0) FROM Lotes l "
+                "WHERE l.IdProducto = Productos.IdProducto);")
+    tiempos["lotes"] = time.perf_counter() - t0
+
+    if historial:
+        t0 = time.perf_counter()
+        base = len(CARGA_PREFIJO)
+        cab: List[Tuple] = []
+        det: List[Tuple] = []
+        for idv, (fecha, cliente, items) in enumerate(datos.iter_ventas(hoy), 1):
+            cab.append((idv, fecha.isoformat(sep=" "), f"H-{idv:08d}", cliente,
+                        sum(i["cant"] * i["punit"] for i in items), 1))
+            det.extend((idv, int(i["codigo"][base:]) + 1, i["cant"], i["punit"]) for i in items)
+            if len(det) >= CARGA_LOTE:
+                bd.cargar_masivo("Ventas", ("IdVenta", "Fecha", "NroComprobante", "IdCliente", "Total", "UsuarioId"), cab)
+                bd.cargar_masivo("VentaDetalle", ("IdVenta", "IdProducto", "Cantidad", "PrecioUnit"), det)
+                cab, det = [], []
+        if cab:
+            bd.cargar_masivo("Ventas", ("IdVenta", "Fecha", "NroComprobante", "IdCliente", "Total", "UsuarioId"), cab)
+            bd.cargar_masivo("VentaDetalle", ("IdVenta", "IdProducto", "Cantidad", "PrecioUnit"), det)
+        tiempos["historial"] = time.perf_counter() - t0
+    return tiempos
+
+
+# ===================== Generador de carga =====================
+
+def _percentil(valores: List[float], p: float) -> float:
+    if not valores:
+        return 0.0
+    orden = sorted(valores)
+    k = min(len(orden) - 1, max(0, int(round(p / 100 * (len(orden) - 1)))))
+    return orden[k]
+
+
+def _elegir(r: random.Random, mezcla) -> str:
+    total = sum(p for _, p in mezcla)
+    x = r.uniform(0, total)
+    for op, peso in mezcla:
+        x -= peso
+        if x <= 0:
+            return op
+    return mezcla[-1][0]
+
+
+def _operaciones(bd, datos: DatosSinteticos, usuario: str, usuario_id: int, proveedor_id: int,
+                 r: random.Random) -> Dict[str, Callable[[], Any]]:
+    def compra():
+        # la mitad de lo que entra repone a los productos que más se venden
+        items = [{"codigo": datos.codigo(datos.popular(r) if r.random() < 0.5 else r.randrange(datos.productos)),
+                  "cant": r.randint(10, 200),
+                  "punit": 1000.0, "vence": (dt.date.today() + dt.timedelta(days=r.randint(60, 720))).isoformat()}
+                 for _ in range(r.randint(10, 40))]
+        return bd.compra_crear(usuario_id, proveedor_id, items)
+
+    return {
+        "sugerir": lambda: bd.productos_sugerir(datos.termino(r)),
+        "get": lambda: bd.producto_get_por_codigo(datos.codigo(datos.popular(r))),
+        "venta": lambda: bd.venta_crear(usuario_id, None, datos.carrito(r)),
+        "compra": compra,
+        "login": lambda: bd.validar_usuario(usuario, CARGA_CLAVE),
+    }
+
+
+def correr_carga(bd, datos: DatosSinteticos, segundos: float = 30, cajeros: int = 4, receptores: int = 1,
+                 pausa_ms: Tuple[int, int] = PAUSA_MS) -> Dict[str, Any]:
+    """
+    Simula `cajeros` y `receptores` trabajando a la vez durante `segundos`.
+    Devuelve por operación: cantidad, rechazos (ValueError de negocio), errores, ops/s y
+    latencias p50/p95/p99/máx en ms.
+    """
+    prov = bd.proveedores_listar()
+    if not prov:
+        raise ValueError("Se necesita al menos un proveedor para la prueba de carga.")
+    lat: Dict[str, List[float]] = {}
+    cuentas: Dict[str, Dict[str, int]] = {}
+    lock = threading.Lock()
+    fin = time.monotonic() + segundos
+    roles = [(f"cajero{i:02d}", MEZCLA_CAJERO) for i in range(cajeros)] + \
+            [(f"deposito{i:02d}", MEZCLA_RECEPTOR) for i in range(receptores)]
+
+    def trabajador(n: int, usuario: str, mezcla):
+        r = random.Random(datos.semilla * 7919 + n)
+        ok, _, uid = bd.validar_usuario(usuario, CARGA_CLAVE)
+        ops = _operaciones(bd, datos, usuario, uid if ok else 1, prov[0][0], r)
+        propias: Dict[str, List[float]] = {}
+        estado: Dict[str, Dict[str, int]] = {}
+        while time.monotonic() < fin:
+            op = _elegir(r, mezcla)
+            c = estado.setdefault(op, {"ok": 0, "rechazos": 0, "errores": 0})
+            t0 = time.perf_counter()
+            try:
+                ops[op]()
+                c["ok"] += 1
+            except ValueError:
+                c["rechazos"] += 1
+            except Exception:
+                c["errores"] += 1
+            propias.setdefault(op, []).append((time.perf_counter() - t0) * 1000)
+            if pausa_ms[1]:
+                time.sleep(r.randint(*pausa_ms) / 1000)
+        with lock:
+            for op, v in propias.items():
+                lat.setdefault(op, []).extend(v)
+            for op, c in estado.items():
+                tot = cuentas.setdefault(op, {"ok": 0, "rechazos": 0, "errores": 0})
+                for k in tot:
+                    tot[k] += c[k]
+
+    t0 = time.perf_counter()
+    hilos = [threading.Thread(target=trabajador, args=(n, u, m), name=f"carga-{u}") for n, (u, m) in enumerate(roles)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    dur = time.perf_counter() - t0
+
+    ops: Dict[str, Dict[str, float]] = {}
+    for op, v in sorted(lat.items()):
+        ops[op] = dict(cuentas[op], n=len(v), ops_s=round(len(v) / dur, 2),
+                       p50=round(_percentil(v, 50), 2), p95=round(_percentil(v, 95), 2),
+                       p99=round(_percentil(v, 99), 2), max=round(max(v), 2))
+    return {"fecha": dt.datetime.now().isoformat(timespec="seconds"), "segundos": round(dur, 2),
+            "cajeros": cajeros, "receptores": receptores, "productos": datos.productos, "ops": ops}
+
+
+# ===================== Reintentos con fallas inyectadas =====================
+
+def probar_reintentos(datos: DatosSinteticos, cajeros: int = 4, ventas: int = 300,
+                      antes: float = 0.05, despues: float = 0.02) -> Dict[str, Any]:
+    """
+    Ventas concurrentes contra un BDLocal envuelto en FallasInyectadas, con clave de idempotencia
+    y db.con_reintentos como en db.venta_crear. Al final compara las ventas grabadas con las que
+    se le confirmaron al cajero: 'duplicadas' debe dar 0 y solo puede haber 'huerfanas' (grabadas
+    sin confirmar) entre las 'abortadas' cuyo último intento perdió la respuesta; esas se
+    recuperan reenviando la misma clave (lo que hace el diario local).
+    """
+    import db
+    bd = db_local.BDLocal()
+    try:
+        poblar(bd, datos, historial=False)
+        fallas = db_local.FallasInyectadas(bd, antes, despues, datos.semilla)
+        confirmadas: List[int] = []
+        cuentas = {"rechazos": 0, "abortadas": 0}
+        lock = threading.Lock()
+
+        def cajero(n: int):
+            r = random.Random(datos.semilla * 31 + n)
+            propias: List[int] = []
+            for _ in range(ventas):
+                items, clave = datos.carrito(r), db.nueva_clave()
+                try:
+                    propias.append(db.con_reintentos(
+                        "venta_local", lambda: fallas.venta_crear(1, None, items, clave=clave)))
+                except ValueError:
+                    with lock:
+                        cuentas["rechazos"] += 1
+                except Exception:
+                    with lock:
+                        cuentas["abortadas"] += 1
+            with lock:
+                confirmadas.extend(propias)
+
+        t0 = time.perf_counter()
+        hilos = [threading.Thread(target=cajero, args=(n,), name=f"reintentos-{n}") for n in range(cajeros)]
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+        grabadas = {int(r[0]) for r in bd.consultar("SELECT IdVenta FROM Ventas;")}
+        return {"segundos": round(time.perf_counter() - t0, 2), "intentadas": cajeros * ventas,
+                "confirmadas": len(confirmadas), "grabadas": len(grabadas),
+                "duplicadas": len(confirmadas) - len(set(confirmadas)),
+                "huerfanas": len(grabadas - set(confirmadas)), **cuentas,
+                "inyectadas": dict(fallas.inyectadas), "reintentos": db.reintentos_stats().get("venta_local", {})}
+    finally:
+        bd.cerrar(borrar=True)
+
+
+def imprimir(res: Dict[str, Any]):
+    print(f"{res['cajeros']} cajeros, {res['receptores']} receptores, {res['productos']} productos, {res['segundos']} s")
+    print(f"{'operación':<10} {'n':>7} {'ops/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'máx ms':>8} {'rech.':>6} {'err.':>5}")
+    for op, m in res["ops"].items():
+        print(f"{op:<10} {m['n']:>7} {m['ops_s']:>8.1f} {m['p50']:>8.1f} {m['p95']:>8.1f} {m['p99']:>8.1f} "
+              f"{m['max']:>8.1f} {m['rechazos']:>6} {m['errores']:>5}")
+
+
+def guardar(res: Dict[str, Any], backend: str, ruta: str = RESULTADOS):
+    with open(ruta, "a", encoding="utf-8") as f:
+        f.write(json.dumps(dict(res, backend=backend)) + "\n")
+
+
+def comparar(ruta: str = RESULTADOS):
+    """Compara las dos últimas corridas del mismo backend (variación de ops/s y p95)."""
+    with open(ruta, encoding="utf-8") as f:
+        corridas = [json.loads(l) for l in f if l.strip()]
+    if not corridas:
+        print("No hay corridas guardadas.")
+        return
+    ultima = corridas[-1]
+    previas = [c for c in corridas[:-1] if c.get("backend") == ultima.get("backend")]
+    if not previas:
+        print("Solo hay una corrida de este backend.")
+        return
+    ant = previas[-1]
+    print(f"{ant['fecha']} -> {ultima['fecha']} ({ultima.get('backend')})")
+    print(f"{'operación':<10} {'ops/s antes':>12} {'ahora':>8} {'p95 antes':>10} {'ahora':>8} {'var p95':>8}")
+    for op, m in ultima["ops"].items():
+        a = ant["ops"].get(op)
+        if not a:
+            continue
+        var = (m["p95"] - a["p95"]) / a["p95"] * 100 if a["p95"] else 0.0
+        print(f"{op:<10} {a['ops_s']:>12.1f} {m['ops_s']:>8.1f} {a['p95']:>10.1f} {m['p95']:>8.1f} {var:>+7.0f}%")
+
+
+if __name__ == "__main__":
+    modo = sys.argv[1] if len(sys.argv) > 1 else "local"
+    if modo == "comparar":
+        comparar(*sys.argv[2:3])
+        sys.exit(0)
+    if modo == "reintentos":
+        cajeros, ventas, productos = ([int(a) for a in sys.argv[2:]] + [4, 300, 2000][len(sys.argv[2:]):])[:3]
+        res = probar_reintentos(DatosSinteticos(productos=productos, anios=0, cajeros=cajeros), cajeros, ventas)
+        print(json.dumps(res, indent=2, ensure_ascii=False))
+        sys.exit(0 if res["duplicadas"] == 0 and res["huerfanas"] <= res["abortadas"] else 1)
+    segundos, cajeros, receptores, productos, anios = ([int(a) for a in sys.argv[2:]] + [30, 4, 1, 2000, 1][len(sys.argv[2:]):])[:5]
+    datos = DatosSinteticos(productos=productos, anios=anios, cajeros=cajeros, receptores=receptores)
+    if modo == "sqlserver":
+        import db
+        bd = db
+    else:
+        bd = db_local.BDLocal()
+    etapas = poblar(bd, datos, historial=anios > 0)
+    print("carga de datos:", {k: round(v, 2) for k, v in etapas.items()})
+    res = correr_carga(bd, datos, segundos, cajeros, receptores)
+    imprimir(res)
+    guardar(res, modo)
+    if isinstance(bd, db_local.BDLocal):
+        bd.cerrar(borrar=True)
+    else:
+        print(bd.pool_stats())
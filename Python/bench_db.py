@@ -0,0 +1,292 @@
+# bench_db.py — Mediciones de rendimiento de los helpers de db.py
+# Uso: python bench_db.py ventas [repeticiones]
+#      python bench_db.py numeracion [terminales] [hilos por terminal] [números por hilo]
+#      python bench_db.py busqueda [productos] [repeticiones]
+#      python bench_db.py fefo [cajas] [ventas por caja] [productos]
+#      python bench_db.py catalogo [filas] [filas por upsert]
+# ¡Graba datos reales! Ejecutar solo contra una BD de pruebas.
+
+import datetime as dt
+import random
+import sys
+import threading
+import time
+from typing import List, Dict, Any, Tuple
+
+import pyodbc
+
+import db
+
+BENCH_PREFIJO = "BENCH-"
+TAMANOS_CARRITO = (1, 5, 10, 30, 60)
+
+
+def _preparar_productos(n: int, usuario_id: int = 1) -> List[str]:
+    """Asegura n productos BENCH-xxxx con stock de sobra. Devuelve sus códigos."""
+    codigos = [f"{BENCH_PREFIJO}{i:04d}" for i in range(n)]
+    prov = db.proveedores_listar()
+    if not prov:
+        raise ValueError("Se necesita al menos un proveedor para preparar el benchmark.")
+    items = [{"codigo": c, "desc": f"Producto benchmark {c}", "cant": 1_000_000, "punit": 1000} for c in codigos]
+    db.compra_crear(usuario_id, prov[0][0], items)
+    return codigos
+
+
+def _carrito(codigos: List[str], tam: int) -> List[Dict[str, Any]]:
+    return [{"codigo": codigos[i % len(codigos)], "cant": 1, "punit": 1000} for i in range(tam)]
+
+
+def _medir(fn, reps: int) -> float:
+    """Devuelve milisegundos promedio por llamada."""
+    t0 = time.perf_counter()
+    for _ in range(reps):
+        fn()
+    return (time.perf_counter() - t0) * 1000 / reps
+
+
+def bench_ventas(reps: int = 20, tamanos=TAMANOS_CARRITO, usuario_id: int = 1):
+    """Compara venta_crear (lote único) contra la ruta anterior por línea, por tamaño de carrito."""
+    codigos = _preparar_productos(max(tamanos), usuario_id)
+    print(f"{'ítems':>6} {'por línea ms':>13} {'lote ms':>10} {'mejora':>8}")
+    for tam in tamanos:
+        items = _carrito(codigos, tam)
+        viejo = _medir(lambda: db._venta_crear_por_linea(usuario_id, None, items), reps)
+        nuevo = _medir(lambda: db.venta_crear(usuario_id, None, items), reps)
+        print(f"{tam:>6} {viejo:>13.1f} {nuevo:>10.1f} {viejo / nuevo:>7.1f}x")
+
+
+def estres_numeracion(terminales: int = 4, hilos: int = 8, por_hilo: int = 250, reservar=None) -> int:
+    """
+    Varios Numerador (uno por terminal simulada) con muchos hilos pidiendo números a la vez.
+    Verifica que no se repita ninguno. reservar=None usa las secuencias reales de la BD.
+    Devuelve la cantidad de números entregados.
+    """
+    nums = [db.Numerador(reservar or db._reservar_rango) for _ in range(terminales)]
+    vistos: List[str] = []
+    lock = threading.Lock()
+
+    def trabajar(num):
+        propios = [num.siguiente("FAC") for _ in range(por_hilo)]
+        with lock:
+            vistos.extend(propios)
+
+    t0 = time.perf_counter()
+    ts = [threading.Thread(target=trabajar, args=(n,)) for n in nums for _ in range(hilos)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    seg = time.perf_counter() - t0
+
+    repetidos = len(vistos) - len(set(vistos))
+    reservas = sum(n.reservas for n in nums)
+    print(f"{len(vistos)} números, {reservas} reservas a la BD, {repetidos} repetidos, {len(vistos) / seg:,.0f} nros/s")
+    if repetidos:
+        raise AssertionError(f"Numeración duplicada: {repetidos} repetidos.")
+    return len(vistos)
+
+
+_DROGAS = ["Amoxicilina", "Paracetamol", "Ibuprofeno", "Diclofenac", "Omeprazol", "Loratadina",
+           "Metformina", "Losartán", "Atorvastatina", "Azitromicina", "Cefalexina", "Clonazepam",
+           "Dipirona", "Ketorolac", "Ranitidina", "Salbutamol", "Prednisona", "Enalapril"]
+_FORMAS = ["comprimidos", "cápsulas", "jarabe", "suspensión", "gotas", "inyectable", "crema", "óvulos"]
+_MARCAS = ["Lasca", "Catedral", "Indufar", "Quimfa", "Bagó", "Roemmers", "Eticos", "Sanofi"]
+
+# (término que escribe el cajero, texto que debería aparecer entre los resultados)
+_TERMINOS = [("amoxi", "amoxicilina"), ("paracetamol", "paracetamol"), ("losartan", "losartán"),
+             ("ibuprofneo", "ibuprofeno"), ("omeprasol", "omeprazol"), ("capsulas", "cápsulas"),
+             ("DICLOFENAC", "diclofenac"), ("salbutamo", "salbutamol")]
+
+
+def generar_catalogo(n: int, semilla: int = 7):
+    """Genera n productos sintéticos {codigo, desc, cant, punit} (nombres con tildes y marcas)."""
+    rnd = random.Random(semilla)
+    for i in range(n):
+        desc = (f"{rnd.choice(_DROGAS)} {rnd.choice((5, 10, 20, 50, 100, 250, 500, 850))}mg "
+                f"{rnd.choice(_FORMAS)} x{rnd.choice((10, 20, 30, 60))} {rnd.choice(_MARCAS)}")
+        yield {"codigo": f"{BENCH_PREFIJO}S{i:06d}", "desc": desc, "cant": 10, "punit": rnd.randint(10, 900) * 100}
+
+
+def bench_busqueda(productos: int = 40000, reps: int = 20, usuario_id: int = 1):
+    """
+    Compara el LIKE '%term%' anterior de sp_productos_sugerir contra sp_productos_buscar (trigramas)
+    sobre un catálogo generado. Informa ms promedio y si el producto esperado aparece (errores de tipeo).
+    """
+    cnx = db.conectar()
+    try:
+        with cnx.cursor() as cur:
+            cur.execute("SELECT COUNT(*) FROM dbo.Productos WHERE Codigo LIKE ?;", (BENCH_PREFIJO + "S%",))
+            existentes = int(cur.fetchone()[0])
+    finally:
+        cnx.close()
+    if existentes < productos:
+        prov = db.proveedores_listar()[0][0]
+        db.compra_crear(usuario_id, prov, (it for i, it in enumerate(generar_catalogo(productos)) if i >= existentes))
+
+    def like(term):
+        cnx = db.conectar()
+        try:
+            with cnx.cursor() as cur:
+                cur.execute("""
+                    SELECT TOP (10) Codigo, Descripcion, Precio, Stock
+                    FROM dbo.Productos
+                    WHERE Codigo LIKE ? OR Descripcion LIKE ?
+                    ORDER BY CASE WHEN Codigo LIKE ? THEN 0 ELSE 1 END, Descripcion
+                """, (term + "%", "%" + term + "%", term + "%"))
+                return cur.fetchall()
+        finally:
+            cnx.close()
+
+    print(f"{'término':<14} {'LIKE ms':>8} {'trigr. ms':>10} {'LIKE ok':>8} {'trigr. ok':>10}")
+    for term, esperado in _TERMINOS:
+        t_like = _medir(lambda: like(term), reps)
+        t_tri = _medir(lambda: db.productos_buscar(term), reps)
+        ok_like = any(esperado in str(r[1]).lower() for r in like(term))
+        ok_tri = any(esperado in str(r[1]).lower() for r in db.productos_buscar(term))
+        print(f"{term:<14} {t_like:>8.1f} {t_tri:>10.1f} {'sí' if ok_like else 'no':>8} {'sí' if ok_tri else 'no':>10}")
+
+
+def _percentil(valores: List[float], p: float) -> float:
+    if not valores:
+        return 0.0
+    orden = sorted(valores)
+    return orden[min(len(orden) - 1, int(round(p / 100 * (len(orden) - 1))))]
+
+
+def _stock_lotes(codigos: List[str]) -> Dict[str, Tuple[int, int]]:
+    """Por código: (SUM(StockLote), MIN(StockLote)) de sus lotes."""
+    cnx = db.conectar()
+    try:
+        with cnx.cursor() as cur:
+            cur.execute("""
+                SELECT p.Codigo, SUM(l.StockLote), MIN(l.StockLote)
+                FROM dbo.Productos p JOIN dbo.Lotes l ON l.IdProducto = p.IdProducto
+                WHERE p.Codigo LIKE ? GROUP BY p.Codigo;
+            """, (BENCH_PREFIJO + "F%",))
+            res = {str(r[0]): (int(r[1]), int(r[2])) for r in cur.fetchall()}
+    finally:
+        cnx.close()
+    return {c: res.get(c, (0, 0)) for c in codigos}
+
+
+def _vendido_de_lotes(ids_venta: List[int]) -> Dict[str, int]:
+    """Unidades que las ventas indicadas descontaron de lotes (IdLote informado), por código."""
+    if not ids_venta:
+        return {}
+    ids = set(ids_venta)
+    vendido: Dict[str, int] = {}
+    cnx = db.conectar()
+    try:
+        with cnx.cursor() as cur:
+            cur.execute("""
+                SELECT d.IdVenta, p.Codigo, d.Cantidad
+                FROM dbo.VentaDetalle d JOIN dbo.Productos p ON p.IdProducto = d.IdProducto
+                WHERE d.IdVenta BETWEEN ? AND ? AND d.IdLote IS NOT NULL AND p.Codigo LIKE ?;
+            """, (min(ids), max(ids), BENCH_PREFIJO + "F%"))
+            for idv, codigo, cant in cur.fetchall():
+                if int(idv) in ids:
+                    vendido[str(codigo)] = vendido.get(str(codigo), 0) + int(cant)
+    finally:
+        cnx.close()
+    return vendido
+
+
+def bench_fefo(cajas: int = 8, ventas: int = 50, productos: int = 3, usuario_id: int = 1):
+    """
+    Varias cajas vendiendo a la vez los mismos productos (con varios lotes cada uno).
+    Informa ventas/s, p50/p95 de latencia y deadlocks, y verifica que el stock por lotes cuadre:
+    por producto, SUM(StockLote) = antes + comprado - vendido de lotes, y ningún lote negativo.
+    Si no cuadra lanza AssertionError.
+    """
+    prov = db.proveedores_listar()[0][0]
+    hoy = dt.date.today()
+    codigos = [f"{BENCH_PREFIJO}F{i:02d}" for i in range(productos)]
+    por_lote = cajas * ventas * 2
+    antes = _stock_lotes(codigos)
+    db.compra_crear(usuario_id, prov, [
+        {"codigo": c, "desc": f"Producto FEFO {c}", "cant": por_lote, "punit": 1000,
+         "vence": (hoy + dt.timedelta(days=30 * (k + 1))).isoformat()}
+        for c in codigos for k in range(4)])
+
+    latencias: List[float] = []
+    ids_venta: List[int] = []
+    deadlocks = [0]
+    lock = threading.Lock()
+
+    def caja(n):
+        rnd = random.Random(n)
+        for _ in range(ventas):
+            items = [{"codigo": c, "cant": rnd.randint(1, 3), "punit": 1000}
+                     for c in rnd.sample(codigos, rnd.randint(1, len(codigos)))]
+            t0 = time.perf_counter()
+            try:
+                idv = db.venta_crear(usuario_id, None, items)
+            except pyodbc.Error as e:
+                if "1205" not in str(e) and "deadlock" not in str(e).lower():
+                    raise
+                with lock:
+                    deadlocks[0] += 1
+                continue
+            with lock:
+                latencias.append((time.perf_counter() - t0) * 1000)
+                ids_venta.append(idv)
+
+    t0 = time.perf_counter()
+    hilos = [threading.Thread(target=caja, args=(n,)) for n in range(cajas)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    seg = time.perf_counter() - t0
+    print(f"{len(latencias)} ventas en {seg:.1f}s ({len(latencias) / seg:.1f}/s), "
+          f"p50 {_percentil(latencias, 50):.1f} ms, p95 {_percentil(latencias, 95):.1f} ms, deadlocks {deadlocks[0]}")
+
+    despues = _stock_lotes(codigos)
+    vendido = _vendido_de_lotes(ids_venta)
+    errores = []
+    for c in codigos:
+        total, minimo = despues[c]
+        esperado = antes[c][0] + 4 * por_lote - vendido.get(c, 0)
+        print(f"  {c}: stock en lotes {total} (esperado {esperado}), mínimo por lote {minimo}")
+        if total != esperado:
+            errores.append(f"{c}: SUM(StockLote) {total} <> {esperado} (antes {antes[c][0]} + comprado "
+                           f"{4 * por_lote} - vendido {vendido.get(c, 0)})")
+        if minimo < 0:
+            errores.append(f"{c}: lote con StockLote {minimo}")
+    if errores:
+        raise AssertionError("El stock por lotes no cuadra:\n" + "\n".join(errores))
+
+
+def bench_catalogo(filas: int = 50000, muestra: int = 500):
+    """
+    Importa una lista de precios generada con catalogo_importar (alta y luego la misma lista con
+    precios cambiados) y estima cuánto tardaría producto_upsert fila por fila sobre una muestra.
+    """
+    def lista(n: int, ajuste: float):
+        for i, it in enumerate(generar_catalogo(n, semilla=11)):
+            yield {"codigo": f"{BENCH_PREFIJO}C{i:06d}", "descripcion": it["desc"],
+                   "precio": round(it["punit"] * ajuste, 2), "stockmin": 5}
+
+    for etapa, ajuste in (("alta", 1.0), ("actualización", 1.07)):
+        r = db.catalogo_importar(lista(filas, ajuste))
+        print(f"{etapa:<14} {r['filas']:>7} filas en {r['seg']:>6.2f} s  ({r['filas'] / max(r['seg'], 1e-9):,.0f} filas/s)  "
+              f"ins {r['insertados']}  act {r['actualizados']}  precio {r['precio_cambiado']}  rech {r['rechazados']}")
+    t = _medir(lambda: [db.producto_upsert(f["codigo"], f["descripcion"], f["precio"], f["stockmin"])
+                        for f in lista(muestra, 1.1)], 1)
+    print(f"producto_upsert: {t / muestra:.2f} ms por fila -> {t / muestra * filas / 1000:,.1f} s estimados para {filas} filas")
+
+
+if __name__ == "__main__":
+    modo = sys.argv[1] if len(sys.argv) > 1 else "ventas"
+    args = [int(a) for a in sys.argv[2:]]
+    if modo == "numeracion":
+        estres_numeracion(*args)
+    elif modo == "busqueda":
+        bench_busqueda(*args)
+    elif modo == "fefo":
+        bench_fefo(*args)
+    elif modo == "catalogo":
+        bench_catalogo(*args)
+    else:
+        bench_ventas(*args)
+    print(db.pool_stats())
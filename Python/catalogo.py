@@ -0,0 +1,286 @@
+# catalogo.py — Copia local del catálogo de Productos con sincronización incremental
+# Carga todo una vez y luego trae solo las filas cambiadas (columna RowVer ROWVERSION).
+# La carga y los deltas corren solo en un hilo de fondo: una consulta nunca espera a la BD
+# por un refresco, y con la BD caída se sigue sirviendo la última copia hasta CATALOGO_VIGENCIA
+# seg.: pasado eso un precio o stock se confirma en la BD o se informa CatalogoDesactualizado.
+# Uso: catalogo.iniciar() al abrir la app; la venta busca con catalogo.producto_por_codigo().
+
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import db
+
+CATALOGO_MAX_EDAD  = 30      # seg. de desfase buscados: el hilo pide un delta cada max_edad/2
+CATALOGO_RECARGA   = 3600    # seg. entre recargas completas (cubre bajas de productos)
+CATALOGO_LOTE      = 5000    # filas por fetchmany
+CATALOGO_AUSENTE   = 60      # seg. que se recuerda que un código no existe
+CATALOGO_ESPERA_MAX = 120    # seg. máximos entre intentos mientras la BD falla (se duplica)
+CATALOGO_VIGENCIA  = 300     # seg. máximos de desfase que se sirven de memoria sin confirmar
+
+_COLS = "IdProducto, Codigo, Descripcion, Precio, Stock, StockMin, RequiereReceta"
+
+_SQL_CARGA = f"""
+SET NOCOUNT ON;
+SELECT CAST(MIN_ACTIVE_ROWVERSION() AS BIGINT);
+SELECT {_COLS} FROM dbo.Productos;
+"""
+
+_SQL_DELTA = f"""
+SET NOCOUNT ON;
+DECLARE @desde BIGINT = ?;
+SELECT CAST(MIN_ACTIVE_ROWVERSION() AS BIGINT);
+SELECT {_COLS} FROM dbo.Productos WHERE RowVer >= CAST(@desde AS BINARY(8));
+"""
+
+
+class CatalogoDesactualizado(RuntimeError):
+    """La copia supera la vigencia y la BD no responde: no hay precio/stock confiable que dar."""
+
+    def __init__(self, codigo: str, edad: float):
+        super().__init__(f"El catálogo lleva {edad:.0f} s sin actualizarse y la base de datos no responde: "
+                         f"no se puede confirmar el producto {codigo}.")
+        self.codigo = codigo
+        self.edad = edad
+
+
+class _Producto:
+    __slots__ = ("id", "codigo", "descripcion", "precio", "stock", "stock_min", "receta")
+
+    def __init__(self, r):
+        self.id, self.codigo, self.descripcion = int(r[0]), str(r[1]), str(r[2])
+        self.precio, self.stock, self.stock_min = float(r[3]), int(r[4]), int(r[5])
+        self.receta = bool(r[6])
+
+    def tupla(self) -> Tuple:
+        return (self.id, self.codigo, self.descripcion, self.precio, self.stock, self.stock_min, self.receta)
+
+
+class CatalogoProductos:
+    """
+    Catálogo en memoria indexado por Codigo.
+    - get(codigo) responde de memoria; solo un código desconocido va a la BD (una fila) y, si
+      no existe, se recuerda `ausente` seg. para no repetir la consulta en cada escaneo.
+    - cargar/refrescar los llama el hilo de iniciar_auto (deltas con RowVer >= marca anterior).
+    - Si la BD no responde se sigue sirviendo la última copia y los intentos se espacian
+      (ver stats()['errores'] y ['espera_seg']), pero nunca más allá de `vigencia` seg.: con
+      la copia más vieja, get() confirma la fila en la BD o lanza CatalogoDesactualizado.
+    """
+
+    def __init__(self, max_edad: float = CATALOGO_MAX_EDAD, recarga: float = CATALOGO_RECARGA,
+                 ausente: float = CATALOGO_AUSENTE, espera_max: float = CATALOGO_ESPERA_MAX,
+                 vigencia: float = CATALOGO_VIGENCIA):
+        self.max_edad = max_edad
+        self.vigencia = vigencia
+        self.recarga = recarga
+        self.ausente = ausente
+        self.espera_max = espera_max
+        self._por_codigo: Dict[str, _Producto] = {}
+        self._por_id: Dict[int, _Producto] = {}
+        self._ausentes: Dict[str, float] = {}   # codigo -> time.monotonic() en que la BD dijo que no existe
+        self._espera = 0.0                     # seg. de espera actual tras errores (0 = BD respondiendo)
+        self._no_antes = 0.0                   # time.monotonic() antes del cual no se consulta la BD
+        self._error: Optional[Exception] = None   # último error de BD (mientras se espera)
+        self._marca: Optional[int] = None     # MIN_ACTIVE_ROWVERSION de la última sincronización
+        self._sincronizado = 0.0              # time.monotonic() de la última sincronización
+        self._cargado = 0.0
+        self._lock = threading.RLock()
+        self._hilo: Optional[threading.Thread] = None
+        self._detener = threading.Event()
+        self._stats = {"aciertos": 0, "fallos": 0, "vencidos": 0, "ausentes": 0, "sin_bd": 0,
+                       "deltas": 0, "filas_delta": 0, "cargas": 0, "errores": 0}
+
+    # --- sincronización ---
+    def cargar(self):
+        """Lectura masiva inicial (o recarga completa)."""
+        cnx = db.conectar()
+        try:
+            with cnx.cursor() as cur:
+                cur.execute(_SQL_CARGA)
+                marca = int(cur.fetchone()[0])
+                cur.nextset()
+                por_codigo: Dict[str, _Producto] = {}
+                while True:
+                    filas = cur.fetchmany(CATALOGO_LOTE)
+                    if not filas:
+                        break
+                    for r in filas:
+                        p = _Producto(r)
+                        por_codigo[p.codigo] = p
+        finally:
+            cnx.close()
+        with self._lock:
+            self._por_codigo = por_codigo
+            self._por_id = {p.id: p for p in por_codigo.values()}
+            self._ausentes.clear()
+            self._marca = marca
+            self._sincronizado = self._cargado = time.monotonic()
+            self._stats["cargas"] += 1
+
+    def refrescar(self) -> int:
+        """Aplica los cambios desde la última sincronización. Devuelve filas actualizadas."""
+        if self._marca is None or time.monotonic() - self._cargado >= self.recarga:
+            self.cargar()
+            return len(self._por_codigo)
+        cnx = db.conectar()
+        try:
+            with cnx.cursor() as cur:
+                cur.execute(_SQL_DELTA, (self._marca,))
+                marca = int(cur.fetchone()[0])
+                cur.nextset()
+                filas = cur.fetchall()
+        finally:
+            cnx.close()
+        with self._lock:
+            for r in filas:
+                self._poner(_Producto(r))
+            self._marca = marca
+            self._sincronizado = time.monotonic()
+            self._stats["deltas"] += 1
+            self._stats["filas_delta"] += len(filas)
+        return len(filas)
+
+    def _poner(self, p: _Producto):
+        viejo = self._por_id.get(p.id)
+        if viejo is not None and viejo.codigo != p.codigo:
+            self._por_codigo.pop(viejo.codigo, None)
+        self._por_id[p.id] = p
+        self._por_codigo[p.codigo] = p
+        self._ausentes.pop(p.codigo, None)
+
+    def _bd_ok(self):
+        with self._lock:
+            self._espera = 0.0
+            self._no_antes = 0.0
+            self._error = None
+
+    def _bd_fallo(self, e: Exception, base: float) -> float:
+        """Registra un error de BD y devuelve los seg. a esperar antes del próximo intento."""
+        with self._lock:
+            self._stats["errores"] += 1
+            self._error = e
+            self._espera = min(self.espera_max, self._espera * 2 if self._espera else base)
+            self._no_antes = time.monotonic() + self._espera
+            return self._espera
+
+    # --- consultas ---
+    def get(self, codigo: str) -> Optional[Tuple]:
+        """
+        (IdProducto, Codigo, Descripcion, Precio, Stock, StockMin, RequiereReceta) o None,
+        igual que db.producto_get_por_codigo. Si no está en memoria consulta la BD una vez
+        (salvo que el código figure como ausente o la BD esté fallando: entonces None, o el
+        error si todavía no hay ninguna copia cargada).
+        Si la copia tiene más de `vigencia` seg. la fila se relee de la BD; si la BD está
+        fallando lanza CatalogoDesactualizado en vez de devolver un precio sin cota de desfase.
+        """
+        codigo = codigo.strip()
+        with self._lock:
+            p = self._por_codigo.get(codigo)
+            if p is not None and self.edad() <= self.vigencia:
+                self._stats["aciertos"] += 1
+                return p.tupla()
+            self._stats["fallos" if p is None else "vencidos"] += 1
+            ahora = time.monotonic()
+            visto = self._ausentes.get(codigo)
+            if p is None and visto is not None and ahora - visto < self.ausente:
+                self._stats["ausentes"] += 1
+                return None
+            if ahora < self._no_antes:
+                self._stats["sin_bd"] += 1
+                if p is not None:
+                    raise CatalogoDesactualizado(codigo, self.edad())
+                if self._marca is None and self._error is not None:
+                    raise self._error
+                return None
+        try:
+            r = db.producto_get_por_codigo(codigo)
+        except Exception as e:
+            self._bd_fallo(e, max(1.0, self.max_edad / 2))
+            if p is not None:
+                raise CatalogoDesactualizado(codigo, self.edad()) from e
+            if self._marca is None:
+                raise
+            return None
+        self._bd_ok()
+        with self._lock:
+            if r is None:
+                self._ausentes[codigo] = time.monotonic()
+                return None
+            p = _Producto(r)
+            self._poner(p)
+        return p.tupla()
+
+    def precio(self, codigo: str) -> Optional[float]:
+        r = self.get(codigo)
+        return r[3] if r else None
+
+    def stock(self, codigo: str) -> Optional[int]:
+        r = self.get(codigo)
+        return r[4] if r else None
+
+    def todos(self) -> List[Tuple]:
+        return [p.tupla() for p in self._por_codigo.values()]
+
+    def edad(self) -> float:
+        """Segundos desde la última sincronización exitosa (cota de desfase de los datos)."""
+        return time.monotonic() - self._sincronizado if self._marca is not None else float("inf")
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            d: Dict[str, float] = dict(self._stats)
+            d.update(productos=len(self._por_codigo), edad_seg=round(self.edad(), 3),
+                     ausentes_memo=len(self._ausentes), espera_seg=self._espera)
+            return d
+
+    # --- refresco en segundo plano ---
+    def iniciar_auto(self, intervalo: Optional[float] = None):
+        """
+        Carga (si hace falta) y refresca cada `intervalo` seg. en un hilo demonio. Tras un error
+        espera el doble cada vez, hasta `espera_max`, y vuelve al intervalo al primer éxito.
+        """
+        if self._hilo is not None:
+            return
+        intervalo = intervalo or max(1.0, self.max_edad / 2)
+
+        def ciclo():
+            espera = 0.0 if self._marca is None else intervalo
+            while not self._detener.wait(espera):
+                try:
+                    self.refrescar()
+                    self._bd_ok()
+                    espera = intervalo
+                except Exception as e:
+                    espera = self._bd_fallo(e, intervalo)
+
+        self._hilo = threading.Thread(target=ciclo, name="catalogo-sync", daemon=True)
+        self._hilo.start()
+
+    def detener(self, esperar: float = 5.0):
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join(esperar)
+            self._hilo = None
+        self._detener.clear()
+
+
+_catalogo: Optional[CatalogoProductos] = None
+_catalogo_lock = threading.Lock()
+
+def catalogo() -> CatalogoProductos:
+    """Catálogo compartido del proceso; la carga masiva corre en su hilo (no bloquea)."""
+    global _catalogo
+    if _catalogo is None:
+        with _catalogo_lock:
+            if _catalogo is None:
+                c = CatalogoProductos()
+                c.iniciar_auto()
+                _catalogo = c
+    return _catalogo
+
+def iniciar() -> CatalogoProductos:
+    """Arranca el catálogo compartido (idempotente). Llamarlo al abrir la ventana principal."""
+    return catalogo()
+
+def producto_por_codigo(codigo: str) -> Optional[Tuple]:
+    """Búsqueda de la venta: como db.producto_get_por_codigo, pero desde el catálogo en memoria."""
+    return catalogo().get(codigo)
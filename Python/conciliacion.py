@@ -0,0 +1,176 @@
+# conciliacion.py — Conciliación por tramos de Productos.Stock contra Lotes.StockLote
+# Uso: python conciliacion.py            (solo informe)
+#      python conciliacion.py reparar    (recorta los lotes con exceso)
+# Regla: el stock en lotes nunca puede superar al stock del producto (la diferencia positiva es
+# stock sin lote, válido). Si SUM(StockLote) > Stock, el exceso se descuenta de los lotes que
+# vencen primero, igual que lo habría hecho una venta FEFO.
+# Se trabaja por tramos de IdProducto: un checksum por tramo decide qué revisar; cada tramo se
+# procesa en su propia transacción corta, con LOCK_TIMEOUT y prioridad baja ante deadlocks,
+# así puede correr en horario de atención sin trabar las cajas.
+
+import csv
+import datetime as dt
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import pyodbc
+
+import db
+
+TRAMO_PRODUCTOS    = 500   # IdProducto por tramo (checksum y transacción)
+TRAMOS_POR_CORRIDA = 200   # tope de tramos revisados por corrida (None = todos)
+ESPERA_BLOQUEO_MS  = 2000  # LOCK_TIMEOUT: si una caja tiene el producto, se saltea el tramo
+PAUSA_TRAMOS       = 0.05  # seg. entre tramos, para dejar pasar a las ventas
+
+_SQL_CHECKSUMS = """
+SET NOCOUNT ON;
+DECLARE @tam INT = ?;
+SELECT COALESCE(p.Rango, l.Rango) AS Rango, ISNULL(p.Chk, 0), ISNULL(l.Chk, 0), c.ChkProductos, c.ChkLotes
+FROM (SELECT IdProducto / @tam AS Rango, CHECKSUM_AGG(CHECKSUM(IdProducto, Stock)) AS Chk
+      FROM dbo.Productos GROUP BY IdProducto / @tam) p
+FULL JOIN (SELECT IdProducto / @tam AS Rango, CHECKSUM_AGG(CHECKSUM(IdLote, IdProducto, StockLote)) AS Chk
+           FROM dbo.Lotes GROUP BY IdProducto / @tam) l ON l.Rango = p.Rango
+LEFT JOIN dbo.ConciliacionRangos c ON c.Tam = @tam AND c.Rango = COALESCE(p.Rango, l.Rango)
+ORDER BY Rango;
+"""
+
+# Un tramo: detecta, (opcionalmente) repara y guarda el checksum nuevo, todo en una transacción.
+_SQL_TRAMO = """
+SET NOCOUNT ON;
+DECLARE @tam INT = ?, @rango INT = ?, @reparar BIT = ?;
+DECLARE @desde INT = @rango * @tam, @hasta INT = (@rango + 1) * @tam;
+
+DECLARE @dif TABLE(IdProducto INT PRIMARY KEY, Stock INT NOT NULL, EnLotes INT NOT NULL);
+INSERT INTO @dif(IdProducto, Stock, EnLotes)
+SELECT p.IdProducto, p.Stock, SUM(l.StockLote)
+FROM dbo.Productos p
+JOIN dbo.Lotes l ON l.IdProducto = p.IdProducto
+WHERE p.IdProducto >= @desde AND p.IdProducto < @hasta
+GROUP BY p.IdProducto, p.Stock
+HAVING SUM(l.StockLote) > p.Stock;
+
+IF @reparar = 1 AND EXISTS (SELECT 1 FROM @dif)
+BEGIN
+    -- relee con bloqueo solo los productos con diferencia (una venta pudo cambiarlos recién);
+    -- mismo orden que venta_crear: primero el producto, después sus lotes
+    UPDATE d SET Stock = p.Stock, EnLotes = x.EnLotes
+    FROM @dif d
+    JOIN dbo.Productos p WITH (UPDLOCK, ROWLOCK) ON p.IdProducto = d.IdProducto
+    CROSS APPLY (SELECT ISNULL(SUM(StockLote), 0) AS EnLotes
+                 FROM dbo.Lotes WITH (UPDLOCK, ROWLOCK) WHERE IdProducto = d.IdProducto) x;
+    DELETE FROM @dif WHERE EnLotes <= Stock;
+
+    -- el exceso ocupa las primeras unidades de los lotes ordenados por vencimiento
+    ;WITH lot AS (
+        SELECT lo.IdLote, lo.StockLote, d.EnLotes - d.Stock AS Exceso,
+               SUM(lo.StockLote) OVER (PARTITION BY lo.IdProducto ORDER BY lo.Vence, lo.IdLote ROWS UNBOUNDED PRECEDING) AS Hasta
+        FROM @dif d
+        JOIN dbo.Lotes lo ON lo.IdProducto = d.IdProducto
+        WHERE lo.StockLote > 0
+    )
+    UPDATE lo SET StockLote = lo.StockLote
+        - CASE WHEN x.Hasta <= x.Exceso THEN x.StockLote ELSE x.Exceso - (x.Hasta - x.StockLote) END
+    FROM dbo.Lotes lo
+    JOIN lot x ON x.IdLote = lo.IdLote
+    WHERE x.Hasta - x.StockLote < x.Exceso;
+END
+
+-- sin diferencias pendientes el tramo queda registrado y no se vuelve a mirar hasta que cambie
+DECLARE @n INT = (SELECT COUNT(*) FROM @dif);
+IF @reparar = 1 OR @n = 0
+    MERGE dbo.ConciliacionRangos AS T
+    USING (SELECT @tam AS Tam, @rango AS Rango,
+                  ISNULL((SELECT CHECKSUM_AGG(CHECKSUM(IdProducto, Stock)) FROM dbo.Productos
+                          WHERE IdProducto >= @desde AND IdProducto < @hasta), 0) AS ChkP,
+                  ISNULL((SELECT CHECKSUM_AGG(CHECKSUM(IdLote, IdProducto, StockLote)) FROM dbo.Lotes
+                          WHERE IdProducto >= @desde AND IdProducto < @hasta), 0) AS ChkL) AS S
+    ON T.Tam = S.Tam AND T.Rango = S.Rango
+    WHEN MATCHED THEN UPDATE SET ChkProductos = S.ChkP, ChkLotes = S.ChkL, Revisado = SYSDATETIME(),
+                                 Diferencias = @n
+    WHEN NOT MATCHED THEN INSERT(Tam, Rango, ChkProductos, ChkLotes, Revisado, Diferencias)
+                          VALUES (S.Tam, S.Rango, S.ChkP, S.ChkL, SYSDATETIME(), @n);
+
+SELECT d.IdProducto, p.Codigo, p.Descripcion, d.Stock, d.EnLotes
+FROM @dif d JOIN dbo.Productos p ON p.IdProducto = d.IdProducto
+ORDER BY d.IdProducto;
+"""
+
+
+def tramos_cambiados(tam: int = TRAMO_PRODUCTOS) -> List[int]:
+    """Tramos cuyo checksum (productos o lotes) difiere del guardado en la última corrida."""
+    cnx = db.conectar()
+    try:
+        with cnx.cursor() as cur:
+            cur.execute(_SQL_CHECKSUMS, (int(tam),))
+            return [int(r[0]) for r in cur.fetchall() if (r[1], r[2]) != (r[3], r[4])]
+    finally:
+        cnx.close()
+
+
+def _revisar_tramo(rango: int, tam: int, reparar: bool) -> List[Dict[str, Any]]:
+    cnx = db.conectar()
+    try:
+        with cnx.cursor() as cur:
+            cur.execute(f"SET LOCK_TIMEOUT {int(ESPERA_BLOQUEO_MS)}; SET DEADLOCK_PRIORITY LOW;")
+            try:
+                cur.execute(_SQL_TRAMO, (int(tam), int(rango), 1 if reparar else 0))
+                filas = cur.fetchall()
+                cnx.commit()
+            finally:
+                cur.execute("SET LOCK_TIMEOUT -1; SET DEADLOCK_PRIORITY NORMAL;")   # la conexión vuelve al pool
+        return [{"tramo": rango, "id_producto": int(r[0]), "codigo": r[1], "descripcion": r[2],
+                 "stock": int(r[3]), "en_lotes": int(r[4]), "exceso": int(r[4]) - int(r[3]),
+                 "reparado": reparar} for r in filas]
+    except:
+        cnx.rollback()
+        raise
+    finally:
+        cnx.close()
+
+
+def conciliar(reparar: bool = False, tam: int = TRAMO_PRODUCTOS,
+              max_tramos: Optional[int] = TRAMOS_POR_CORRIDA) -> Dict[str, Any]:
+    """
+    Revisa los tramos cambiados (hasta `max_tramos`) y devuelve
+    {'diferencias': [...], 'tramos_cambiados', 'tramos_revisados', 'tramos_omitidos', 'quedan', 'seg'}.
+    Un tramo omitido (bloqueo o deadlock) no se marca como revisado: vuelve en la próxima corrida.
+    """
+    t0 = time.perf_counter()
+    cambiados = tramos_cambiados(tam)
+    lote = cambiados if max_tramos is None else cambiados[:max_tramos]
+    diferencias: List[Dict[str, Any]] = []
+    omitidos: List[Dict[str, Any]] = []
+    for n, rango in enumerate(lote):
+        if n:
+            time.sleep(PAUSA_TRAMOS)
+        try:
+            diferencias.extend(_revisar_tramo(rango, tam, reparar))
+        except pyodbc.Error as e:
+            omitidos.append({"tramo": rango, "error": str(e)})
+    return {"fecha": dt.datetime.now().isoformat(timespec="seconds"), "reparar": reparar,
+            "tramos_cambiados": len(cambiados), "tramos_revisados": len(lote) - len(omitidos),
+            "tramos_omitidos": omitidos, "quedan": len(cambiados) - len(lote),
+            "diferencias": diferencias, "seg": round(time.perf_counter() - t0, 2)}
+
+
+def exportar_csv(informe: Dict[str, Any], ruta: str):
+    """Escribe las diferencias del informe en CSV (separador ;, abre directo en Excel)."""
+    campos = ["tramo", "id_producto", "codigo", "descripcion", "stock", "en_lotes", "exceso", "reparado"]
+    with open(ruta, "w", encoding="utf-8-sig", newline="") as f:
+        w = csv.DictWriter(f, fieldnames=campos, delimiter=";")
+        w.writeheader()
+        w.writerows(informe["diferencias"])
+
+
+if __name__ == "__main__":
+    inf = conciliar(reparar=len(sys.argv) > 1 and sys.argv[1] == "reparar")
+    print(f"Tramos cambiados: {inf['tramos_cambiados']}, revisados: {inf['tramos_revisados']}, "
+          f"omitidos: {len(inf['tramos_omitidos'])}, quedan: {inf['quedan']} ({inf['seg']} s)")
+    for d in inf["diferencias"]:
+        estado = "recortado" if d["reparado"] else "a revisar"
+        print(f"  {d['codigo']:<20} stock {d['stock']:>7}  en lotes {d['en_lotes']:>7}  exceso {d['exceso']:>6}  {estado}")
+    if inf["diferencias"]:
+        ruta = f"conciliacion_{dt.date.today():%Y%m%d}.csv"
+        exportar_csv(inf, ruta)
+        print(f"Detalle en {ruta}")
@@ -1,17 +1,32 @@
 # db.py — Conexión MSSQL + helpers de negocio
 # Requiere: pip install pyodbc
 
+import csv
+import json
+import random
+import re
+import threading
+import time
+import uuid
 import pyodbc
-from typing import List, Tuple, Optional, Dict, Any
+import db_async
+import instrumentacion
+from typing import List, Tuple, Optional, Dict, Any, Callable, Iterable, Iterator
 
 # ==== CONFIGURA TU ENTORNO ====
 SERVER   = r"DESKTOP-VS9VM60\SQLEXPRESS"   # <--- ajusta a tu instancia real
 DATABASE = "Farmacia3H"
 DRIVER   = "{ODBC Driver 18 for SQL Server}"
 
-def conectar():
+# ==== POOL DE CONEXIONES ====
+POOL_MAX          = 8     # conexiones abiertas como máximo
+POOL_ESPERA       = 10    # seg. máximos esperando una conexión libre
+POOL_INACTIVIDAD  = 300   # seg. sin uso antes de cerrar una conexión libre
+POOL_VALIDAR_TRAS = 5     # seg. de inactividad a partir de los cuales se verifica antes de reusar
+
+def _conectar_directo():
     """
-    Abre una conexión a SQL Server. Si no usas SQL Browser, podrías usar SERVER='127.0.0.1,1433'.
+    Abre una conexión nueva a SQL Server. Si no usas SQL Browser, podrías usar SERVER='127.0.0.1,1433'.
     """
     conn_str = (
         f"DRIVER={DRIVER};"
@@ -24,6 +39,247 @@ def conectar():
     )
     return pyodbc.connect(conn_str)
 
+
+class _ConexionPool:
+    """
+    Envoltura de una conexión prestada por el pool. Se usa igual que la conexión real,
+    pero close() la devuelve al pool en vez de cerrarla.
+    Con instrumentacion.INSTRUMENTAR, cursor() mide cada sentencia y close() registra la
+    llamada de negocio (`llamada`) con su duración y cantidad de sentencias.
+    """
+    __slots__ = ("_pool", "_cnx", "_devuelta", "_llamada", "_t0", "_cuenta")
+
+    def __init__(self, pool: "PoolConexiones", cnx, llamada: str = "?"):
+        object.__setattr__(self, "_pool", pool)
+        object.__setattr__(self, "_cnx", cnx)
+        object.__setattr__(self, "_devuelta", False)
+        object.__setattr__(self, "_llamada", llamada)
+        object.__setattr__(self, "_t0", time.perf_counter())
+        object.__setattr__(self, "_cuenta", [0])
+
+    def __getattr__(self, nombre):
+        if self._devuelta:
+            raise pyodbc.ProgrammingError("La conexión ya fue devuelta al pool.")
+        return getattr(self._cnx, nombre)
+
+    def __setattr__(self, nombre, valor):
+        setattr(self._cnx, nombre, valor)
+
+    def cursor(self):
+        if self._devuelta:
+            raise pyodbc.ProgrammingError("La conexión ya fue devuelta al pool.")
+        cur = self._cnx.cursor()
+        db_async.registrar_cursor(cur)   # cancelable si la llamada corre en una tarea de db_async
+        if instrumentacion.INSTRUMENTAR:
+            return instrumentacion.CursorMedido(cur, self._llamada, self._cuenta)
+        return cur
+
+    def close(self):
+        if not self._devuelta:
+            object.__setattr__(self, "_devuelta", True)
+            self._pool._devolver(self._cnx)
+            if self._cuenta[0]:
+                instrumentacion.instrumentacion().llamada(
+                    self._llamada, (time.perf_counter() - self._t0) * 1000, self._cuenta[0])
+
+
+class PoolConexiones:
+    """
+    Pool acotado de conexiones con préstamo por hilo.
+    - fabrica: callable que abre una conexión nueva (pyodbc, o un sustituto con la misma
+      interfaz en pruebas).
+    - Antes de reusar una conexión que estuvo inactiva más de `validar_tras` seg. se ejecuta
+      `sql_vida`; si falla, se descarta y se abre otra.
+    - Las conexiones libres por más de `inactividad` seg. se cierran.
+    """
+
+    def __init__(self, fabrica: Callable[[], Any], max_conexiones: int = POOL_MAX,
+                 espera: float = POOL_ESPERA, inactividad: float = POOL_INACTIVIDAD,
+                 validar_tras: float = POOL_VALIDAR_TRAS, sql_vida: str = "SELECT 1;"):
+        self.fabrica = fabrica
+        self.max_conexiones = max(1, int(max_conexiones))
+        self.espera = espera
+        self.inactividad = inactividad
+        self.validar_tras = validar_tras
+        self.sql_vida = sql_vida
+        self._cond = threading.Condition()
+        self._libres: List[Tuple[Any, float]] = []   # (cnx, último uso) — pila LIFO
+        self._prestadas: Dict[int, int] = {}          # id(cnx) -> hilo que la tiene
+        self._abiertas = 0
+        self._cerrado = False
+        self._stats = {"checkouts": 0, "creadas": 0, "reusadas": 0, "esperas": 0,
+                       "espera_ms": 0, "timeouts": 0, "descartadas": 0, "expulsadas": 0}
+
+    # --- préstamo / devolución ---
+    def obtener(self, llamada: str = "?") -> _ConexionPool:
+        limite = time.monotonic() + self.espera
+        esperó = False
+        while True:
+            cnx, ultimo, crear = None, 0.0, False
+            with self._cond:
+                viejas = self._expulsar_inactivas()
+                while not self._libres and self._abiertas >= self.max_conexiones:
+                    resto = limite - time.monotonic()
+                    if resto <= 0:
+                        self._stats["timeouts"] += 1
+                        raise pyodbc.OperationalError(
+                            "HYT00", "Timeout expired: no hay conexiones libres en el pool.")
+                    if not esperó:
+                        esperó = True
+                        self._stats["esperas"] += 1
+                    t0 = time.monotonic()
+                    self._cond.wait(resto)
+                    self._stats["espera_ms"] += int((time.monotonic() - t0) * 1000)
+                if self._libres:
+                    cnx, ultimo = self._libres.pop()
+                else:
+                    self._abiertas += 1
+                    crear = True
+            self._cerrar_todas(viejas)
+
+            if crear:
+                t0 = time.perf_counter()
+                try:
+                    cnx = self.fabrica()
+                except Exception as e:
+                    instrumentacion.instrumentacion().conexion((time.perf_counter() - t0) * 1000, e)
+                    self._baja(None)
+                    raise
+                instrumentacion.instrumentacion().conexion((time.perf_counter() - t0) * 1000)
+                with self._cond:
+                    self._stats["creadas"] += 1
+            elif time.monotonic() - ultimo >= self.validar_tras and not self._viva(cnx):
+                self._baja(cnx, "descartadas")
+                continue
+            else:
+                with self._cond:
+                    self._stats["reusadas"] += 1
+
+            with self._cond:
+                self._stats["checkouts"] += 1
+                self._prestadas[id(cnx)] = threading.get_ident()
+            return _ConexionPool(self, cnx, llamada)
+
+    def _devolver(self, cnx):
+        try:
+            cnx.rollback()   # descarta cualquier transacción que haya quedado abierta
+        except Exception:
+            self._baja(cnx, "descartadas")
+            return
+        if self._cerrado:
+            self._baja(cnx)
+            return
+        with self._cond:
+            self._prestadas.pop(id(cnx), None)
+            self._libres.append((cnx, time.monotonic()))
+            self._cond.notify()
+
+    def _viva(self, cnx) -> bool:
+        try:
+            cur = cnx.cursor()
+            try:
+                cur.execute(self.sql_vida)
+                cur.fetchone()
+            finally:
+                cur.close()
+            return True
+        except Exception:
+            return False
+
+    def _baja(self, cnx, motivo: Optional[str] = None):
+        """Quita una conexión del pool (rota o no se pudo abrir) y libera su lugar."""
+        if cnx is not None:
+            self._cerrar_todas([cnx])
+        with self._cond:
+            if cnx is not None:
+                self._prestadas.pop(id(cnx), None)
+            self._abiertas -= 1
+            if motivo:
+                self._stats[motivo] += 1
+            self._cond.notify()
+
+    def _expulsar_inactivas(self) -> List[Any]:
+        # se llama con el lock tomado; devuelve las conexiones a cerrar fuera del lock
+        corte = time.monotonic() - self.inactividad
+        viejas = [c for c, t in self._libres if t < corte]
+        if viejas:
+            self._libres = [(c, t) for c, t in self._libres if t >= corte]
+            self._abiertas -= len(viejas)
+            self._stats["expulsadas"] += len(viejas)
+        return viejas
+
+    @staticmethod
+    def _cerrar_todas(conexiones):
+        for c in conexiones:
+            try:
+                c.close()
+            except Exception:
+                pass
+
+    # --- mantenimiento ---
+    def purgar(self):
+        """Cierra las conexiones libres que superaron el tiempo de inactividad."""
+        with self._cond:
+            viejas = self._expulsar_inactivas()
+        self._cerrar_todas(viejas)
+
+    def cerrar(self):
+        """Cierra todas las conexiones libres (las prestadas se cierran al devolverse)."""
+        with self._cond:
+            self._cerrado = True
+            libres = [c for c, _ in self._libres]
+            self._libres = []
+            self._abiertas -= len(libres)
+        self._cerrar_todas(libres)
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            d = dict(self._stats)
+            d.update(abiertas=self._abiertas, libres=len(self._libres),
+                     prestadas=len(self._prestadas), hilos=len(set(self._prestadas.values())),
+                     max=self.max_conexiones)
+            return d
+
+
+_pool: Optional[PoolConexiones] = None
+_pool_lock = threading.Lock()
+
+def configurar_pool(fabrica: Optional[Callable[[], Any]] = None, **opciones) -> PoolConexiones:
+    """
+    (Re)crea el pool global. Sin fabrica usa SQL Server. Otra fábrica debe dar conexiones con
+    la interfaz de pyodbc: todo db.py usa `with cnx.cursor() as cur`, que los cursores de
+    sqlite3 no soportan (para probar sin servidor está db_local.BDLocal).
+    opciones: max_conexiones, espera, inactividad, validar_tras, sql_vida.
+    """
+    global _pool
+    with _pool_lock:
+        anterior = _pool
+        _pool = PoolConexiones(fabrica or _conectar_directo, **opciones)
+    if anterior is not None:
+        anterior.cerrar()
+    return _pool
+
+def pool_stats() -> Dict[str, int]:
+    """Contadores del pool: checkouts, creadas, reusadas, esperas, timeouts, descartadas, etc."""
+    return _pool.stats() if _pool is not None else {}
+
+def metricas() -> Dict[str, Any]:
+    """Snapshot de instrumentacion (sentencias, llamadas, conexiones, lentas), estado del pool y reintentos."""
+    return dict(instrumentacion.snapshot(), pool=pool_stats(), reintentos=reintentos_stats())
+
+def conectar():
+    """
+    Presta una conexión del pool (se crea el pool la primera vez).
+    Se usa como antes: cnx.close() la devuelve al pool en vez de cerrarla.
+    Las métricas quedan a nombre de la función que llamó (ver instrumentacion.py).
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PoolConexiones(_conectar_directo)
+    return _pool.obtener(instrumentacion.quien_llama() if instrumentacion.INSTRUMENTAR else "?")
+
 # ===================== Básicos =====================
 
 def ping() -> str:
@@ -62,28 +318,62 @@ def validar_usuario(usuario: str, clave: str):
 
 # ===================== Productos =====================
 
-def productos_listar(buscar: str = "") -> List[Tuple]:
+PAGINA_PRODUCTOS = 200   # filas por página (keyset) al recorrer el catálogo
+_FETCH_LOTE      = 100   # filas por fetchmany dentro de una página
+
+def productos_pagina(buscar: str = "", despues: Optional[Tuple[str, int]] = None,
+                     tam: int = PAGINA_PRODUCTOS) -> List[Tuple]:
     """
-    Lista productos. Si buscar != '', filtra por código o descripción.
+    Una página de productos ordenada por (Descripcion, IdProducto), paginación keyset:
+    `despues` es la clave (Descripcion, IdProducto) de la última fila de la página anterior.
+    Si buscar != '', filtra por código (prefijo) o descripción (índice de trigramas).
     """
     sql = """
-        SELECT IdProducto, Codigo, Descripcion, Precio, Stock, StockMin, RequiereReceta
+        SELECT TOP (?) IdProducto, Codigo, Descripcion, Precio, Stock, StockMin, RequiereReceta
         FROM dbo.Productos
+        WHERE 1 = 1
     """
-    params: Tuple[Any, ...] = ()
+    params: List[Any] = [int(tam)]
+    if despues is not None:
+        sql += " AND (Descripcion > ? OR (Descripcion = ? AND IdProducto > ?))"
+        params += [despues[0], despues[0], int(despues[1])]
     if buscar:
-        sql += " WHERE Codigo LIKE ? OR Descripcion LIKE ?"
-        like = f"%{buscar}%"
-        params = (like, like)
-    sql += " ORDER BY Descripcion"
+        sql += " AND (Codigo LIKE ? OR IdProducto IN (SELECT IdProducto FROM dbo.fn_productos_coinciden(?)))"
+        params += [buscar + "%", buscar]
+    sql += " ORDER BY Descripcion, IdProducto"
     cnx = conectar()
     try:
         with cnx.cursor() as cur:
             cur.execute(sql, params)
-            return cur.fetchall()
+            filas: List[Tuple] = []
+            while True:
+                lote = cur.fetchmany(_FETCH_LOTE)
+                if not lote:
+                    return filas
+                filas.extend(lote)
     finally:
         cnx.close()
 
+def productos_iter(buscar: str = "", tam: int = PAGINA_PRODUCTOS) -> Iterator[Tuple]:
+    """
+    Recorre los productos página a página (keyset) sin cargarlos todos en memoria.
+    Cada página usa su propia conexión del pool, así el generador no retiene una conexión.
+    """
+    despues: Optional[Tuple[str, int]] = None
+    while True:
+        filas = productos_pagina(buscar, despues, tam)
+        yield from filas
+        if len(filas) < tam:
+            return
+        despues = (filas[-1][2], int(filas[-1][0]))
+
+def productos_listar(buscar: str = "") -> List[Tuple]:
+    """
+    Lista productos. Si buscar != '', filtra por código (prefijo) o descripción (índice de trigramas).
+    Para catálogos grandes conviene productos_iter/productos_pagina.
+    """
+    return list(productos_iter(buscar))
+
 def producto_get_por_codigo(codigo: str) -> Optional[Tuple]:
     cnx = conectar()
     try:
@@ -99,6 +389,7 @@ def producto_get_por_codigo(codigo: str) -> Optional[Tuple]:
 def producto_upsert(codigo: str, descripcion: str, precio: float, stockmin: int = 0, requiere_receta: bool = False) -> int:
     """
     Crea o actualiza producto (por Código). Devuelve IdProducto.
+    Para listas de precios completas usar catalogo_importar (un MERGE por bloque).
     """
     cnx = conectar()
     try:
@@ -126,6 +417,111 @@ def producto_upsert(codigo: str, descripcion: str, precio: float, stockmin: int
     finally:
         cnx.close()
 
+def stock_ajustar(usuario_id: int, codigo: str, cantidad: int, motivo: str) -> int:
+    """
+    Ajuste manual de stock (+ entra, - sale) con registro en AjustesStock. Devuelve IdAjuste.
+    El stock no puede quedar negativo (CK_Productos_Stock).
+    Sin clave de idempotencia: solo se reintenta ante deadlock o bloqueo (ver con_reintentos).
+    """
+    return con_reintentos("stock_ajustar", lambda: _stock_ajustar_tx(usuario_id, codigo, cantidad, motivo),
+                          idempotente=False)
+
+def _stock_ajustar_tx(usuario_id: int, codigo: str, cantidad: int, motivo: str) -> int:
+    cnx = conectar()
+    try:
+        with cnx.cursor() as cur:
+            cur.execute("""
+                SET NOCOUNT ON;
+                DECLARE @codigo VARCHAR(40) = ?, @cant INT = ?, @motivo VARCHAR(200) = ?, @usuario INT = ?;
+                DECLARE @pid INT = (SELECT IdProducto FROM dbo.Productos WITH (UPDLOCK) WHERE Codigo = @codigo);
+                IF @pid IS NULL
+                BEGIN
+                    SELECT 0;
+                    RETURN;
+                END
+                UPDATE dbo.Productos SET Stock = Stock + @cant WHERE IdProducto = @pid;
+                INSERT INTO dbo.AjustesStock(Fecha, IdProducto, Cantidad, Motivo, UsuarioId)
+                VALUES (SYSDATETIME(), @pid, @cant, @motivo, @usuario);
+                SELECT SCOPE_IDENTITY();
+            """, (codigo.strip(), int(cantidad), motivo[:200], int(usuario_id)))
+            ida = int(cur.fetchone()[0])
+            if not ida:
+                raise ValueError(f"Código {codigo} no existe.")
+            cnx.commit()
+            return ida
+    except:
+        cnx.rollback()
+        raise
+    finally:
+        cnx.close()
+
+# Faltantes de una venta que ya salió del mostrador: se recalculan con los productos bloqueados
+# (en orden de Codigo, como la venta) y se ajusta solo lo que hoy no alcanza.
+# Devuelve (Codigo, NULL) por cada código inexistente, o una fila (NULL, productos ajustados).
+_SQL_AJUSTE_FALTANTES = """
+SET NOCOUNT ON;
+DECLARE @items NVARCHAR(MAX) = ?, @motivo VARCHAR(200) = ?, @usuario INT = ?;
+
+DECLARE @dem TABLE(Codigo VARCHAR(40) PRIMARY KEY, IdProducto INT NULL, Cant INT NOT NULL);
+INSERT INTO @dem(Codigo, IdProducto, Cant)
+SELECT j.Codigo, MAX(p.IdProducto), SUM(j.Cant)
+FROM OPENJSON(@items) WITH (Codigo VARCHAR(40) '$.c', Cant INT '$.q') j
+LEFT JOIN dbo.Productos p ON p.Codigo = j.Codigo
+GROUP BY j.Codigo;
+
+IF EXISTS (SELECT 1 FROM @dem WHERE IdProducto IS NULL)
+BEGIN
+    SELECT Codigo, NULL FROM @dem WHERE IdProducto IS NULL ORDER BY Codigo;
+    RETURN;
+END
+
+DECLARE @aj TABLE(IdProducto INT PRIMARY KEY, Cant INT NOT NULL);
+UPDATE p SET Stock = d.Cant
+OUTPUT inserted.IdProducto, inserted.Stock - deleted.Stock INTO @aj(IdProducto, Cant)
+FROM @dem d
+INNER LOOP JOIN dbo.Productos p ON p.IdProducto = d.IdProducto
+WHERE p.Stock < d.Cant
+OPTION (FORCE ORDER);
+
+INSERT INTO dbo.AjustesStock(Fecha, IdProducto, Cantidad, Motivo, UsuarioId)
+SELECT SYSDATETIME(), IdProducto, Cant, @motivo, @usuario FROM @aj;
+
+SELECT NULL, COUNT(*) FROM @aj;
+"""
+
+def stock_ajustar_faltantes(usuario_id: int, items: List[Dict[str, Any]], clave: str, motivo: str) -> int:
+    """
+    Ajuste de stock para que alcance una venta que ya se entregó (conflicto del diario local):
+    en una sola transacción suma, por código, solo lo que hoy le falta al stock para cubrir
+    items (demanda total menos stock actual). Con la clave de idempotencia un reenvío no
+    vuelve a ajustar. Devuelve la cantidad de productos ajustados (0 si ya alcanzaba).
+    ValueError si algún código no existe (no se ajusta nada).
+    """
+    return con_reintentos("stock_ajustar", lambda: _stock_ajustar_faltantes_tx(usuario_id, items, clave, motivo))
+
+def _stock_ajustar_faltantes_tx(usuario_id: int, items: List[Dict[str, Any]], clave: str, motivo: str) -> int:
+    cnx = conectar()
+    try:
+        with cnx.cursor() as cur:
+            previa = _clave_aplicada(cur, clave, "AJU")
+            if previa is not None:
+                cnx.commit()
+                return previa
+            cur.execute(_SQL_AJUSTE_FALTANTES, (_venta_items_json(items), motivo[:200], int(usuario_id)))
+            rows = cur.fetchall()
+            inexistentes = [str(r[0]) for r in rows if r[0] is not None]
+            if inexistentes:
+                raise ValueError(f"Código {', '.join(inexistentes)} no existe: no se puede ajustar.")
+            n = int(rows[0][1])
+            _clave_registrar(cur, clave, n)
+            cnx.commit()
+            return n
+    except:
+        cnx.rollback()
+        raise
+    finally:
+        cnx.close()
+
 # ===================== Proveedores =====================
 
 def proveedores_listar() -> List[Tuple[int, str]]:
@@ -162,72 +558,337 @@ def productos_sugerir(term: str) -> List[Tuple[str, str, float, int]]:
     finally:
         cnx.close()
 
+def productos_buscar(term: str, top: int = 10) -> List[Tuple[str, str, float, int, float]]:
+    """
+    Búsqueda tolerante a tildes, mayúsculas y errores de tipeo (sp_productos_buscar, trigramas).
+    Devuelve [(Codigo, Descripcion, Precio, Stock, Score)] ordenado por relevancia.
+    Si el sproc no existe cae a productos_sugerir (Score=1.0).
+    """
+    term = term.strip()
+    if not term:
+        return []
+    cnx = conectar()
+    try:
+        with cnx.cursor() as cur:
+            try:
+                cur.execute("EXEC dbo.sp_productos_buscar @term = ?, @top = ?;", (term, int(top)))
+                return [tuple(r) for r in cur.fetchall()]
+            except pyodbc.Error:
+                pass
+    finally:
+        cnx.close()
+    return [tuple(r) + (1.0,) for r in productos_sugerir(term)[:top]]
+
+# ===================== Numeración de comprobantes =====================
+
+NRO_BLOQUE = 20   # números que reserva cada terminal por viaje a la BD
+
+_NRO_SECUENCIAS = {"FAC": "dbo.seq_nro_venta", "OC": "dbo.seq_nro_compra"}
+
+_SQL_NRO_RANGO = """
+SET NOCOUNT ON;
+DECLARE @primero SQL_VARIANT;
+EXEC sys.sp_sequence_get_range @sequence_name = ?, @range_size = ?, @range_first_value = @primero OUTPUT;
+SELECT CAST(@primero AS BIGINT);
+"""
+
+def _reservar_rango(serie: str, cantidad: int) -> int:
+    """Reserva `cantidad` números consecutivos de la secuencia de la serie. Devuelve el primero."""
+    cnx = conectar()
+    try:
+        with cnx.cursor() as cur:
+            cur.execute(_SQL_NRO_RANGO, (_NRO_SECUENCIAS[serie], int(cantidad)))
+            primero = int(cur.fetchone()[0])
+            cnx.commit()
+            return primero
+    finally:
+        cnx.close()
+
+
+class Numerador:
+    """
+    Asigna números de comprobante (FAC-000123, OC-000045) por bloques hi/lo:
+    reserva NRO_BLOQUE números de la secuencia en un solo viaje y los entrega localmente.
+    Es seguro entre hilos; los números de un bloque sin usar al cerrar la app quedan como salto.
+    """
+
+    def __init__(self, reservar: Callable[[str, int], int] = _reservar_rango, bloque: int = NRO_BLOQUE):
+        self._reservar = reservar
+        self.bloque = max(1, int(bloque))
+        self._rangos: Dict[str, List[int]] = {}   # serie -> [siguiente, tope)
+        self._lock = threading.Lock()
+        self.reservas = 0
+
+    def siguiente(self, serie: str) -> str:
+        with self._lock:
+            r = self._rangos.get(serie)
+            if r is None or r[0] >= r[1]:
+                primero = int(self._reservar(serie, self.bloque))
+                r = self._rangos[serie] = [primero, primero + self.bloque]
+                self.reservas += 1
+            n = r[0]
+            r[0] += 1
+        return f"{serie}-{n:06d}"
+
+
+_numerador = Numerador()
+
+def nro_siguiente(serie: str) -> str:
+    """Próximo número de comprobante de la serie ('FAC' ventas, 'OC' compras)."""
+    return _numerador.siguiente(serie)
+
+# ===================== Idempotencia =====================
+# Operaciones reenviadas (diario local, reintentos) llevan una clave única: si ya se aplicó,
+# se devuelve el Id original en vez de grabarla dos veces.
+
+# La clave se inserta primero (IdRemoto provisorio 0) y la PK hace de guardia: un reenvío
+# simultáneo espera solo a esa fila y, si la primera confirmó, cae en la violación de PK y lee
+# su Id. Buscarla con UPDLOCK, HOLDLOCK bloqueaba el rango entre claves vecinas (uuid al azar)
+# durante toda la venta, y con la tabla casi vacía las cajas se esperaban entre sí.
+_SQL_CLAVE_TOMAR = """
+SET NOCOUNT ON;
+DECLARE @clave VARCHAR(40) = ?, @tipo CHAR(3) = ?;
+BEGIN TRY
+    INSERT INTO dbo.OperacionesAplicadas(Clave, Tipo, IdRemoto, Fecha) VALUES (@clave, @tipo, 0, SYSDATETIME());
+    SELECT CAST(NULL AS INT);
+END TRY
+BEGIN CATCH
+    IF ERROR_NUMBER() NOT IN (2627, 2601) THROW;
+    SELECT IdRemoto FROM dbo.OperacionesAplicadas WHERE Clave = @clave;
+END CATCH
+"""
+
+def _clave_aplicada(cur, clave: str, tipo: str) -> Optional[int]:
+    """Id de la operación ya aplicada con esa clave, o None tras reservarla hasta el commit."""
+    cur.execute(_SQL_CLAVE_TOMAR, (clave, tipo))
+    r = cur.fetchone()
+    return int(r[0]) if r and r[0] is not None else None
+
+def _clave_registrar(cur, clave: str, id_remoto: int):
+    cur.execute("UPDATE dbo.OperacionesAplicadas SET IdRemoto = ? WHERE Clave = ?;", (int(id_remoto), clave))
+
+# ===================== Reintentos =====================
+# Errores transitorios (deadlock, bloqueo, timeout, enlace caído): la transacción se deshizo y
+# se puede repetir entera. Si lo que se perdió fue la respuesta del commit, la clave de
+# idempotencia hace que el reintento devuelva la operación ya grabada en vez de duplicarla.
+
+REINTENTOS_MAX  = 4      # intentos totales por operación
+REINTENTO_BASE  = 0.05   # seg. de espera tras el primer fallo (se duplica en cada intento)
+REINTENTO_TOPE  = 1.0    # seg. máximos de espera entre intentos
+
+# número de error nativo de SQL Server -> causa
+_NATIVOS_TRANSITORIOS = {1205: "deadlock", 1222: "bloqueo", -2: "timeout",
+                         233: "conexion", 10053: "conexion", 10054: "conexion", 10060: "conexion"}
+# SQLSTATE (e.args[0] en pyodbc) -> causa; además cualquier clase 08 es "conexion"
+_SQLSTATE_TRANSITORIOS = {"40001": "deadlock", "HYT00": "timeout", "HYT01": "timeout"}
+# causas en las que el servidor seguro no grabó nada: se reintenta aunque no haya clave
+_CAUSAS_SIN_EFECTO = ("deadlock", "bloqueo")
+# pyodbc agrega el número nativo al mensaje: "... was deadlocked ... (1205) (SQLExecDirectW)"
+_RE_NATIVO = re.compile(r"\((-?\d+)\)\s*\(SQL\w+\)")
+
+_reintentos_lock = threading.Lock()
+_reintentos: Dict[str, Dict[str, int]] = {}
+
+def error_transitorio(e: BaseException) -> Optional[str]:
+    """'deadlock', 'bloqueo', 'timeout' o 'conexion' si vale la pena reintentar; None si no."""
+    if not isinstance(e, pyodbc.Error) or not e.args:
+        return None
+    for m in _RE_NATIVO.finditer(" ".join(map(str, e.args[1:]))):
+        causa = _NATIVOS_TRANSITORIOS.get(int(m.group(1)))
+        if causa:
+            return causa
+    estado = str(e.args[0]).upper()
+    if estado.startswith("08"):
+        return "conexion"
+    return _SQLSTATE_TRANSITORIOS.get(estado)
+
+def nueva_clave() -> str:
+    """Clave de idempotencia generada en el cliente (entra en OperacionesAplicadas.Clave)."""
+    return uuid.uuid4().hex
+
+def _contar(operacion: str, *campos: str):
+    with _reintentos_lock:
+        c = _reintentos.setdefault(operacion, {"llamadas": 0, "reintentos": 0, "recuperadas": 0, "abortadas": 0})
+        for campo in campos:
+            c[campo] = c.get(campo, 0) + 1
+
+def con_reintentos(operacion: str, fn: Callable[[], Any], idempotente: bool = True,
+                   intentos: int = REINTENTOS_MAX, dormir: Callable[[float], None] = time.sleep) -> Any:
+    """
+    Ejecuta fn() (una transacción completa) y la repite ante errores transitorios, con espera
+    exponencial con variación para que las cajas no vuelvan a chocar juntas.
+    idempotente=False (sin clave): solo se reintenta cuando el servidor seguro no grabó nada
+    (deadlock, bloqueo); ante timeout o caída de enlace el error sube como antes.
+    Cuenta llamadas, reintentos, recuperadas, abortadas y fallos por causa (ver reintentos_stats).
+    """
+    _contar(operacion, "llamadas")
+    for n in range(1, max(1, intentos) + 1):
+        try:
+            r = fn()
+        except Exception as e:
+            causa = error_transitorio(e)
+            if causa is None:
+                raise
+            _contar(operacion, causa)
+            if n >= intentos or not (idempotente or causa in _CAUSAS_SIN_EFECTO):
+                _contar(operacion, "abortadas")
+                raise
+            _contar(operacion, "reintentos")
+            dormir(min(REINTENTO_TOPE, REINTENTO_BASE * 2 ** (n - 1)) * random.uniform(0.5, 1.5))
+            continue
+        if n > 1:
+            _contar(operacion, "recuperadas")
+        return r
+
+def reintentos_stats() -> Dict[str, Dict[str, int]]:
+    """Por operación: llamadas, reintentos, recuperadas, abortadas y cantidad de fallos por causa."""
+    with _reintentos_lock:
+        return {op: dict(c) for op, c in _reintentos.items()}
+
 # ===================== Compras =====================
 
-def compra_crear(usuario_id: int, proveedor_id: int, items: List[Dict[str, Any]], nro: Optional[str] = None) -> int:
+COMPRA_LOTE_FILAS = 1000   # filas por envío (fast_executemany) al cargar el detalle
+
+_SQL_COMPRA_STAGE = """
+DROP TABLE IF EXISTS #compra_items;
+CREATE TABLE #compra_items(
+    Linea  INT NOT NULL PRIMARY KEY,
+    Codigo VARCHAR(40) NOT NULL,
+    Descr  VARCHAR(160) NOT NULL,
+    Cant   INT NOT NULL,
+    PUnit  DECIMAL(18,2) NOT NULL,
+    Vence  VARCHAR(10) NULL
+);
+"""
+
+# Aplica la compra completa desde #compra_items con sentencias de conjunto.
+_SQL_COMPRA_APLICAR = """
+SET NOCOUNT ON;
+DECLARE @nro VARCHAR(30) = ?, @prov INT = ?, @usuario INT = ?, @cuando DATETIME2 = ?;
+
+INSERT INTO dbo.Compras(Fecha, NroComprobante, IdProveedor, Total, UsuarioId)
+SELECT ISNULL(@cuando, SYSDATETIME()), @nro, @prov, SUM(Cant * PUnit), @usuario FROM #compra_items;
+DECLARE @idc INT = SCOPE_IDENTITY();
+
+-- productos: alta de nuevos, precio de lista = último punit, suma de stock
+;WITH src AS (
+    SELECT Codigo,
+           LAST_VALUE(Descr) OVER (PARTITION BY Codigo ORDER BY Linea ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING) AS Descr,
+           LAST_VALUE(PUnit) OVER (PARTITION BY Codigo ORDER BY Linea ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING) AS PUnit,
+           SUM(Cant) OVER (PARTITION BY Codigo) AS Cant,
+           ROW_NUMBER() OVER (PARTITION BY Codigo ORDER BY Linea) AS rn
+    FROM #compra_items
+)
+MERGE dbo.Productos WITH (HOLDLOCK) AS T
+USING (SELECT Codigo, Descr, PUnit, Cant FROM src WHERE rn = 1) AS S
+ON T.Codigo = S.Codigo
+WHEN MATCHED THEN UPDATE SET T.Precio = S.PUnit, T.Stock = T.Stock + S.Cant
+WHEN NOT MATCHED THEN
+    INSERT(Codigo, Descripcion, Precio, Stock, StockMin, RequiereReceta)
+    VALUES (S.Codigo, CASE WHEN S.Descr = '' THEN S.Codigo ELSE S.Descr END, S.PUnit, S.Cant, 0, 0);
+
+-- costo promedio ponderado (márgenes en reportes)
+MERGE dbo.ProductoCosto WITH (HOLDLOCK) AS T
+USING (
+    SELECT p.IdProducto, SUM(i.Cant) AS Cant, SUM(i.Cant * i.PUnit) AS Importe
+    FROM #compra_items i
+    JOIN dbo.Productos p ON p.Codigo = i.Codigo
+    GROUP BY p.IdProducto
+) AS S
+ON T.IdProducto = S.IdProducto
+WHEN MATCHED THEN UPDATE SET T.CostoProm = (T.CostoProm * T.CantComprada + S.Importe) / (T.CantComprada + S.Cant),
+                             T.CantComprada = T.CantComprada + S.Cant
+WHEN NOT MATCHED THEN INSERT(IdProducto, CostoProm, CantComprada) VALUES (S.IdProducto, S.Importe / S.Cant, S.Cant);
+
+-- lotes para las líneas con vencimiento
+INSERT INTO dbo.Lotes(IdProducto, Lote, Vence, StockLote)
+SELECT p.IdProducto, CONCAT('L-', @idc, '-', i.Codigo), CONVERT(DATE, i.Vence), i.Cant
+FROM #compra_items i
+JOIN dbo.Productos p ON p.Codigo = i.Codigo
+WHERE i.Vence IS NOT NULL
+ORDER BY i.Linea;
+
+INSERT INTO dbo.CompraDetalle(IdCompra, IdProducto, Cantidad, PrecioUnit)
+SELECT @idc, p.IdProducto, i.Cant, i.PUnit
+FROM #compra_items i
+JOIN dbo.Productos p ON p.Codigo = i.Codigo
+ORDER BY i.Linea;
+
+-- caja: si el usuario tiene una caja abierta, registra el pago. La apertura se relee por su
+-- clave con UPDLOCK, el mismo recurso que toma caja_cerrar: un cierre concurrente espera a esta
+-- compra, o la compra ve la caja ya cerrada y no registra el pago (en vez del THROW 50020).
+DECLARE @ap INT = (SELECT IdApertura FROM dbo.CajaAperturas WHERE UsuarioId = @usuario AND Estado = 'A');
+IF @ap IS NOT NULL
+    SET @ap = (SELECT IdApertura FROM dbo.CajaAperturas WITH (UPDLOCK, ROWLOCK)
+               WHERE IdApertura = @ap AND Estado = 'A');
+IF @ap IS NOT NULL
+    INSERT INTO dbo.CajaMov(IdApertura, Tipo, Monto, RefCompra)
+    SELECT @ap, 'COM', c.Total, @idc FROM dbo.Compras c WHERE c.IdCompra = @idc;
+
+DROP TABLE #compra_items;
+SELECT @idc;
+"""
+
+def en_bloques(filas: Iterable[Any], n: int) -> Iterator[List[Any]]:
+    """Agrupa un iterable en listas de hasta n elementos sin materializarlo completo."""
+    bloque: List[Any] = []
+    for f in filas:
+        bloque.append(f)
+        if len(bloque) >= n:
+            yield bloque
+            bloque = []
+    if bloque:
+        yield bloque
+
+def _compra_filas(items: Iterable[Dict[str, Any]]) -> Iterator[Tuple]:
+    for n, it in enumerate(items, 1):
+        codigo = str(it["codigo"]).strip()
+        vence  = (str(it.get("vence") or "").strip() or None)  # None o 'YYYY-MM-DD'
+        yield (n, codigo, str(it.get("desc") or "").strip(), int(it["cant"]), float(it["punit"]), vence)
+
+def compra_crear(usuario_id: int, proveedor_id: int, items: Iterable[Dict[str, Any]], nro: Optional[str] = None,
+                 clave: Optional[str] = None, fecha: Optional[Any] = None) -> int:
     """
     Crea cabecera de compra y detalle.
-    items: [{codigo, desc, cant, punit, vence:str|None}]
+    items: [{codigo, desc, cant, punit, vence:str|None}] — puede ser un generador (ver nota_entrega_leer).
     - Si el producto no existe, lo crea (precio tomado de punit, stockmin=0).
     - Aumenta Stock en Productos.
     - Crea lote si 'vence' viene informado (formato YYYY-MM-DD).
+    - Si el usuario tiene una caja abierta, registra el movimiento COM.
+    Los ítems se cargan en bloques a una tabla temporal (fast_executemany) y se aplican con
+    MERGE/INSERT de conjunto, todo en una sola transacción.
+    clave: clave de idempotencia (si ya se aplicó, devuelve esa compra sin grabar nada); si no
+           se informa se genera una, así un reintento nunca la graba dos veces.
+    fecha: fecha real de la compra si se graba después (diario local); None = ahora.
+    Ante deadlock/timeout/caída de enlace se reintenta (con_reintentos), salvo que items sea un
+    generador: no se puede releer, así que va un solo intento (compra_desde_nota relee el archivo).
     Devuelve IdCompra.
     """
+    nro, clave = nro or nro_siguiente("OC"), clave or nueva_clave()
+    return con_reintentos("compra_crear", lambda: _compra_crear_tx(usuario_id, proveedor_id, items, nro, clave, fecha),
+                          intentos=1 if isinstance(items, Iterator) else REINTENTOS_MAX)
+
+def _compra_crear_tx(usuario_id: int, proveedor_id: int, items: Iterable[Dict[str, Any]], nro: str,
+                     clave: str, fecha: Optional[Any]) -> int:
     cnx = conectar()
     try:
         with cnx.cursor() as cur:
-            total = sum(float(i["cant"]) * float(i["punit"]) for i in items)
-            if nro is None:
-                # genera algo tipo OC-<timestamp simple>
-                cur.execute("SELECT RIGHT('000000'+CONVERT(VARCHAR(6), ISNULL(MAX(IdCompra),0)+1), 6) FROM dbo.Compras;")
-                seq = cur.fetchone()[0]
-                nro = f"OC-{seq}"
+            previa = _clave_aplicada(cur, clave, "COM")
+            if previa is not None:
+                cnx.commit()
+                return previa
+            cur.execute(_SQL_COMPRA_STAGE)
+            cur.fast_executemany = True
+            cargadas = 0
+            for bloque in en_bloques(_compra_filas(items), COMPRA_LOTE_FILAS):
+                cur.executemany("INSERT INTO #compra_items(Linea, Codigo, Descr, Cant, PUnit, Vence) VALUES (?, ?, ?, ?, ?, ?);", bloque)
+                cargadas += len(bloque)
+            if not cargadas:
+                raise ValueError("La compra no tiene ítems.")
 
-            cur.execute("""
-                INSERT INTO dbo.Compras(Fecha, NroComprobante, IdProveedor, Total, UsuarioId)
-                VALUES (SYSDATETIME(), ?, ?, ?, ?);
-            """, (nro, int(proveedor_id), float(total), int(usuario_id)))
-            cur.execute("SELECT SCOPE_IDENTITY();")
+            cur.execute(_SQL_COMPRA_APLICAR, (nro, int(proveedor_id), int(usuario_id), fecha))
             idc = int(cur.fetchone()[0])
-
-            for it in items:
-                codigo = str(it["codigo"]).strip()
-                desc   = str(it.get("desc", "")).strip()
-                cant   = int(it["cant"])
-                punit  = float(it["punit"])
-                vence  = it.get("vence")  # None o 'YYYY-MM-DD'
-
-                # asegura producto
-                cur.execute("SELECT IdProducto FROM dbo.Productos WHERE Codigo=?;", (codigo,))
-                r = cur.fetchone()
-                if r:
-                    pid = int(r[0])
-                    # actualiza precio de lista a último punit (opcional)
-                    cur.execute("UPDATE dbo.Productos SET Precio=? WHERE IdProducto=?;", (punit, pid))
-                else:
-                    cur.execute("""
-                        INSERT INTO dbo.Productos(Codigo, Descripcion, Precio, Stock, StockMin, RequiereReceta)
-                        VALUES (?, ?, ?, 0, 0, 0);
-                    """, (codigo, desc if desc else codigo, punit))
-                    cur.execute("SELECT SCOPE_IDENTITY();")
-                    pid = int(cur.fetchone()[0])
-
-                # aumenta stock general
-                cur.execute("UPDATE dbo.Productos SET Stock = Stock + ? WHERE IdProducto=?;", (cant, pid))
-
-                # lote opcional
-                if vence:
-                    cur.execute("""
-                        INSERT INTO dbo.Lotes(IdProducto, Lote, Vence, StockLote)
-                        VALUES (?, ?, ?, ?);
-                    """, (pid, f"L-{idc}-{codigo}", vence, cant))
-
-                # detalle compra
-                cur.execute("""
-                    INSERT INTO dbo.CompraDetalle(IdCompra, IdProducto, Cantidad, PrecioUnit)
-                    VALUES (?, ?, ?, ?);
-                """, (idc, pid, cant, punit))
-
+            _clave_registrar(cur, clave, idc)
             cnx.commit()
             return idc
     except:
@@ -236,22 +897,440 @@ def compra_crear(usuario_id: int, proveedor_id: int, items: List[Dict[str, Any]]
     finally:
         cnx.close()
 
+def nota_entrega_leer(ruta: str) -> Iterator[Dict[str, Any]]:
+    """
+    Lee una nota de entrega fila por fila (sin cargarla entera en memoria).
+    - .csv: encabezado con codigo, desc, cant, punit, vence (separador , ; o tab).
+    - .jsonl: un objeto JSON por línea con las mismas claves.
+    """
+    if ruta.lower().endswith((".jsonl", ".ndjson")):
+        with open(ruta, encoding="utf-8") as f:
+            for linea in f:
+                if linea.strip():
+                    yield json.loads(linea)
+        return
+    with open(ruta, encoding="utf-8-sig", newline="") as f:
+        dialecto = csv.Sniffer().sniff(f.read(4096), delimiters=",;\t")
+        f.seek(0)
+        for fila in csv.DictReader(f, dialect=dialecto):
+            yield {k.strip().lower(): (v.strip() if isinstance(v, str) else v) for k, v in fila.items() if k}
+
+def compra_desde_nota(usuario_id: int, proveedor_id: int, ruta: str, nro: Optional[str] = None) -> int:
+    """Registra una compra leyendo el detalle directamente de una nota de entrega CSV/JSONL."""
+    nro, clave = nro or nro_siguiente("OC"), nueva_clave()
+    # cada intento vuelve a leer el archivo desde el principio
+    return con_reintentos("compra_crear", lambda: _compra_crear_tx(usuario_id, proveedor_id, nota_entrega_leer(ruta),
+                                                                   nro, clave, None))
+
+# ===================== Importación de catálogo =====================
+
+CATALOGO_LOTE_FILAS   = 5000   # filas por bloque: una carga a staging y un MERGE por bloque
+CATALOGO_DETALLE_MAX  = 1000   # rechazos / cambios de precio que se guardan con detalle en el resumen
+
+# columnas aceptadas en la lista (encabezado en minúsculas) -> campo
+_CATALOGO_ALIAS = {
+    "codigo": "codigo", "código": "codigo", "cod": "codigo", "ean": "codigo",
+    "descripcion": "desc", "descripción": "desc", "desc": "desc", "producto": "desc", "detalle": "desc",
+    "precio": "precio", "punit": "precio", "pvp": "precio", "precio lista": "precio",
+    "stockmin": "stockmin", "stock min": "stockmin", "minimo": "stockmin", "mínimo": "stockmin",
+    "receta": "receta", "requiere receta": "receta", "requiere_receta": "receta",
+}
+
+_SQL_CATALOGO_STAGE = """
+DROP TABLE IF EXISTS #catalogo_items;
+CREATE TABLE #catalogo_items(
+    Codigo   VARCHAR(40) NOT NULL PRIMARY KEY,
+    Descr    VARCHAR(160) NULL,
+    Precio   DECIMAL(18,2) NOT NULL,
+    StockMin INT NULL,
+    Receta   BIT NULL
+);
+"""
+
+# Un bloque: columnas sin informar (NULL) conservan el valor actual; el stock no se toca.
+_SQL_CATALOGO_MERGE = """
+SET NOCOUNT ON;
+DECLARE @max INT = ?;
+DECLARE @cambios TABLE(Accion NVARCHAR(10), Codigo VARCHAR(40), Antes DECIMAL(18,2) NULL, Despues DECIMAL(18,2));
+
+MERGE dbo.Productos WITH (HOLDLOCK) AS T
+USING #catalogo_items AS S
+ON T.Codigo = S.Codigo
+WHEN MATCHED AND (T.Precio <> S.Precio
+                  OR T.Descripcion <> ISNULL(S.Descr, T.Descripcion)
+                  OR T.StockMin <> ISNULL(S.StockMin, T.StockMin)
+                  OR T.RequiereReceta <> ISNULL(S.Receta, T.RequiereReceta)) THEN
+    UPDATE SET T.Precio = S.Precio,
+               T.Descripcion = ISNULL(S.Descr, T.Descripcion),
+               T.StockMin = ISNULL(S.StockMin, T.StockMin),
+               T.RequiereReceta = ISNULL(S.Receta, T.RequiereReceta)
+WHEN NOT MATCHED THEN
+    INSERT(Codigo, Descripcion, Precio, Stock, StockMin, RequiereReceta)
+    VALUES (S.Codigo, ISNULL(S.Descr, S.Codigo), S.Precio, 0, ISNULL(S.StockMin, 0), ISNULL(S.Receta, 0))
+OUTPUT $action, inserted.Codigo, deleted.Precio, inserted.Precio INTO @cambios;
+
+SELECT ISNULL(SUM(CASE WHEN Accion = 'INSERT' THEN 1 ELSE 0 END), 0),
+       ISNULL(SUM(CASE WHEN Accion = 'UPDATE' THEN 1 ELSE 0 END), 0),
+       ISNULL(SUM(CASE WHEN Accion = 'UPDATE' AND Antes <> Despues THEN 1 ELSE 0 END), 0)
+FROM @cambios;
+SELECT TOP (@max) Codigo, Antes, Despues FROM @cambios WHERE Accion = 'UPDATE' AND Antes <> Despues ORDER BY Codigo;
+TRUNCATE TABLE #catalogo_items;
+"""
+
+def _numero(v: Any) -> float:
+    """
+    Número de una planilla: acepta 1234.5, 1.234,50, 1,234.50, 15.000, 1.250.000 y '$ 1.234,50'.
+    Con un solo tipo de separador, si se repite o va seguido de exactamente tres dígitos es de
+    miles ('15.000' son quince mil guaraníes, no 15,00); salvo con parte entera 0 ('0,125').
+    """
+    if isinstance(v, (int, float)):
+        return float(v)
+    s = str(v).replace("$", "").replace(" ", "").strip()
+    if "," in s and "." in s:
+        s = s.replace(".", "").replace(",", ".") if s.rfind(",") > s.rfind(".") else s.replace(",", "")
+    elif "," in s or "." in s:
+        partes = s.split("," if "," in s else ".")
+        if len(partes) > 2 or (len(partes[1]) == 3 and partes[0].lstrip("+-").strip("0")):
+            if not all(len(p) == 3 and p.isdigit() for p in partes[1:]):
+                raise ValueError(f"separador de miles mal ubicado: {v!r}")
+            s = "".join(partes)
+        else:
+            s = ".".join(partes)
+    return float(s)
+
+def _catalogo_campos(fila: Dict[str, Any]) -> Dict[str, Any]:
+    """Fila con los encabezados traducidos por _CATALOGO_ALIAS y el código ya como texto."""
+    f = {_CATALOGO_ALIAS.get(str(k).strip().lower()): v for k, v in fila.items() if k is not None}
+    codigo = f.get("codigo")
+    if isinstance(codigo, float) and codigo.is_integer():
+        codigo = int(codigo)                       # EAN leído como número desde la planilla
+    f["codigo"] = str(codigo if codigo is not None else "").strip()
+    return f
+
+def _catalogo_fila(fila: Dict[str, Any]) -> Tuple:
+    """Valida y normaliza una fila de la lista. ValueError con el motivo si no sirve."""
+    f = _catalogo_campos(fila)
+    codigo = f["codigo"]
+    if not codigo:
+        raise ValueError("sin código")
+    if len(codigo) > 40:
+        raise ValueError("código de más de 40 caracteres")
+    if f.get("precio") in (None, ""):
+        raise ValueError("sin precio")
+    try:
+        precio = round(_numero(f["precio"]), 2)
+    except ValueError:
+        raise ValueError(f"precio inválido: {f['precio']!r}")
+    if not 0 <= precio < 1e16:
+        raise ValueError(f"precio fuera de rango: {precio}")
+    desc = " ".join(str(f.get("desc") or "").split())[:160] or None
+    stockmin = None
+    if f.get("stockmin") not in (None, ""):
+        try:
+            stockmin = int(_numero(f["stockmin"]))
+        except ValueError:
+            raise ValueError(f"stock mínimo inválido: {f['stockmin']!r}")
+        if stockmin < 0:
+            raise ValueError("stock mínimo negativo")
+    receta = None
+    if f.get("receta") not in (None, ""):
+        r = str(f["receta"]).strip().lower()
+        if r in ("1", "1.0", "si", "sí", "s", "true", "x"):
+            receta = 1
+        elif r in ("0", "0.0", "no", "n", "false"):
+            receta = 0
+        else:
+            raise ValueError(f"receta inválida: {f['receta']!r}")
+    return (codigo, desc, precio, stockmin, receta)
+
+def catalogo_leer(ruta: str) -> Iterator[Dict[str, Any]]:
+    """
+    Lee una lista de precios fila por fila: .csv / .jsonl como nota_entrega_leer y .xlsx
+    (primera hoja, encabezado en la primera fila) con openpyxl en modo solo lectura.
+    """
+    if not ruta.lower().endswith((".xlsx", ".xlsm")):
+        yield from nota_entrega_leer(ruta)
+        return
+    try:
+        import openpyxl   # opcional: solo hace falta para planillas
+    except ImportError:
+        raise ValueError("Para importar planillas .xlsx hace falta instalar openpyxl (pip install openpyxl).")
+    libro = openpyxl.load_workbook(ruta, read_only=True, data_only=True)
+    try:
+        filas = libro.worksheets[0].iter_rows(values_only=True)
+        encabezado = [str(c).strip().lower() if c is not None else None for c in next(filas, ())]
+        for fila in filas:
+            if any(v not in (None, "") for v in fila):
+                yield {k: (v.strip() if isinstance(v, str) else v) for k, v in zip(encabezado, fila) if k}
+    finally:
+        libro.close()
+
+def catalogo_importar(filas: Iterable[Dict[str, Any]], simular: bool = False) -> Dict[str, Any]:
+    """
+    Importa una lista de precios (iterable de dicts, p. ej. catalogo_leer) en bloques:
+    valida, carga #catalogo_items con fast_executemany y aplica un MERGE por bloque sobre
+    dbo.Productos, cada bloque en su propia transacción (una lista enorme no bloquea el
+    catálogo de punta a punta). Si un código se repite, vale la última fila.
+    simular=True hace todo igual pero deshace cada bloque: sirve para revisar el resumen antes.
+    Devuelve {'filas', 'insertados', 'actualizados', 'precio_cambiado', 'sin_cambios',
+              'repetidos', 'rechazados', 'detalle_rechazos', 'cambios_precio', 'bloques', 'seg'}.
+    """
+    t0 = time.perf_counter()
+    res: Dict[str, Any] = {"filas": 0, "insertados": 0, "actualizados": 0, "precio_cambiado": 0,
+                           "sin_cambios": 0, "repetidos": 0, "rechazados": 0, "bloques": 0,
+                           "detalle_rechazos": [], "cambios_precio": []}
+
+    def validas() -> Iterator[Tuple]:
+        for n, fila in enumerate(filas, 1):
+            res["filas"] = n
+            try:
+                yield _catalogo_fila(fila)
+            except ValueError as e:
+                res["rechazados"] += 1
+                if len(res["detalle_rechazos"]) < CATALOGO_DETALLE_MAX:
+                    res["detalle_rechazos"].append((n, _catalogo_campos(fila)["codigo"], str(e)))
+
+    cnx = conectar()
+    try:
+        with cnx.cursor() as cur:
+            cur.execute(_SQL_CATALOGO_STAGE)
+            cnx.commit()   # la tabla temporal sobrevive a los rollback de simular
+            cur.fast_executemany = True
+            for bloque in en_bloques(validas(), CATALOGO_LOTE_FILAS):
+                unicos = {f[0]: f for f in bloque}
+                res["repetidos"] += len(bloque) - len(unicos)
+                try:
+                    cur.executemany("INSERT INTO #catalogo_items(Codigo, Descr, Precio, StockMin, Receta) VALUES (?, ?, ?, ?, ?);",
+                                    list(unicos.values()))
+                    cur.execute(_SQL_CATALOGO_MERGE, (CATALOGO_DETALLE_MAX - len(res["cambios_precio"]),))
+                    ins, act, pre = (int(x) for x in cur.fetchone())
+                    cur.nextset()
+                    res["cambios_precio"].extend((c, float(a), float(d)) for c, a, d in cur.fetchall())
+                    if simular:
+                        cnx.rollback()
+                    else:
+                        cnx.commit()
+                except:
+                    cnx.rollback()
+                    raise
+                res["insertados"] += ins
+                res["actualizados"] += act
+                res["precio_cambiado"] += pre
+                res["sin_cambios"] += len(unicos) - ins - act
+                res["bloques"] += 1
+            cur.execute("DROP TABLE IF EXISTS #catalogo_items;")
+    finally:
+        cnx.close()
+    res["seg"] = round(time.perf_counter() - t0, 2)
+    return res
+
+def catalogo_desde_archivo(ruta: str, simular: bool = False) -> Dict[str, Any]:
+    """Importa una lista de precios CSV/JSONL/XLSX (ver catalogo_importar)."""
+    return catalogo_importar(catalogo_leer(ruta), simular)
+
 # ===================== Ventas =====================
 
-def venta_crear(usuario_id: int, cliente_id: Optional[int], items: List[Dict[str, Any]], nro: Optional[str] = None) -> int:
+# Lote único: el carrito viaja como JSON y se procesa en conjunto (OPENJSON, SQL Server 2016+).
+# Devuelve una sola tabla: (IdVenta, Codigo, Disponible, Pedido). IdVenta=0 => filas con faltantes.
+_SQL_VENTA_LOTE = """
+SET NOCOUNT ON;
+DECLARE @items NVARCHAR(MAX) = ?, @nro VARCHAR(30) = ?, @cliente INT = ?, @usuario INT = ?, @cuando DATETIME2 = ?;
+
+DECLARE @lin TABLE(Linea INT PRIMARY KEY, Codigo VARCHAR(40) NOT NULL, Cant INT NOT NULL, PUnit DECIMAL(18,2) NOT NULL);
+INSERT INTO @lin(Linea, Codigo, Cant, PUnit)
+SELECT Linea, Codigo, Cant, PUnit
+FROM OPENJSON(@items) WITH (Linea INT '$.l', Codigo VARCHAR(40) '$.c', Cant INT '$.q', PUnit DECIMAL(18,2) '$.p');
+
+-- demanda total por código (un mismo código puede venir en varias líneas)
+DECLARE @dem TABLE(Codigo VARCHAR(40) PRIMARY KEY, IdProducto INT NULL, Cant INT NOT NULL);
+INSERT INTO @dem(Codigo, IdProducto, Cant)
+SELECT l.Codigo, MAX(p.IdProducto), SUM(l.Cant)
+FROM @lin l LEFT JOIN dbo.Productos p ON p.Codigo = l.Codigo
+GROUP BY l.Codigo;
+
+-- descuento condicionado: solo baja el stock donde alcanza.
+-- Recorre @dem en orden de Codigo para que todas las cajas bloqueen productos en el mismo orden
+-- (sin deadlocks); el bloqueo del producto serializa además el acceso a sus lotes.
+DECLARE @ok TABLE(IdProducto INT PRIMARY KEY);
+UPDATE p SET Stock = p.Stock - d.Cant
+OUTPUT inserted.IdProducto INTO @ok(IdProducto)
+FROM @dem d
+INNER LOOP JOIN dbo.Productos p ON p.IdProducto = d.IdProducto
+WHERE p.Stock >= d.Cant
+OPTION (FORCE ORDER);
+
+IF EXISTS (SELECT 1 FROM @dem d WHERE NOT EXISTS (SELECT 1 FROM @ok o WHERE o.IdProducto = d.IdProducto))
+BEGIN
+    SELECT 0 AS IdVenta, d.Codigo, p.Stock AS Disponible, d.Cant AS Pedido
+    FROM @dem d
+    LEFT JOIN dbo.Productos p ON p.IdProducto = d.IdProducto
+    WHERE NOT EXISTS (SELECT 1 FROM @ok o WHERE o.IdProducto = d.IdProducto)
+    ORDER BY d.Codigo;
+    RETURN;
+END
+
+INSERT INTO dbo.Ventas(Fecha, NroComprobante, IdCliente, Total, UsuarioId)
+SELECT ISNULL(@cuando, SYSDATETIME()), @nro, @cliente, SUM(Cant * PUnit), @usuario FROM @lin;
+DECLARE @idv INT = SCOPE_IDENTITY();
+
+-- FEFO: cada línea ocupa un tramo [Hasta-Cant, Hasta) de la demanda del producto y cada lote
+-- un tramo [Hasta-StockLote, Hasta) de su stock ordenado por vencimiento; se asigna el solapamiento.
+DECLARE @asig TABLE(Linea INT NOT NULL, IdProducto INT NOT NULL, IdLote INT NULL, Cant INT NOT NULL);
+;WITH lin AS (
+    SELECT l.Linea, d.IdProducto, l.Cant,
+           SUM(l.Cant) OVER (PARTITION BY d.IdProducto ORDER BY l.Linea ROWS UNBOUNDED PRECEDING) AS Hasta
+    FROM @lin l JOIN @dem d ON d.Codigo = l.Codigo
+), lot AS (
+    SELECT lo.IdLote, lo.IdProducto, lo.StockLote,
+           SUM(lo.StockLote) OVER (PARTITION BY lo.IdProducto ORDER BY lo.Vence, lo.IdLote ROWS UNBOUNDED PRECEDING) AS Hasta
+    FROM @dem d
+    JOIN dbo.Lotes lo WITH (UPDLOCK, ROWLOCK) ON lo.IdProducto = d.IdProducto
+    WHERE lo.StockLote > 0
+      AND (lo.Vence IS NULL OR lo.Vence >= CAST(ISNULL(@cuando, SYSDATETIME()) AS DATE))   -- vencidos no se venden
+)
+INSERT INTO @asig(Linea, IdProducto, IdLote, Cant)
+SELECT lin.Linea, lin.IdProducto, lot.IdLote,
+       (CASE WHEN lin.Hasta < lot.Hasta THEN lin.Hasta ELSE lot.Hasta END)
+     - (CASE WHEN lin.Hasta - lin.Cant > lot.Hasta - lot.StockLote THEN lin.Hasta - lin.Cant ELSE lot.Hasta - lot.StockLote END)
+FROM lin
+JOIN lot ON lot.IdProducto = lin.IdProducto
+        AND lot.Hasta - lot.StockLote < lin.Hasta
+        AND lot.Hasta > lin.Hasta - lin.Cant;
+
+-- lo que no cubren los lotes vigentes sale del stock general sin lote
+INSERT INTO @asig(Linea, IdProducto, IdLote, Cant)
+SELECT l.Linea, d.IdProducto, NULL, l.Cant - ISNULL(SUM(a.Cant), 0)
+FROM @lin l
+JOIN @dem d ON d.Codigo = l.Codigo
+LEFT JOIN @asig a ON a.Linea = l.Linea
+GROUP BY l.Linea, d.IdProducto, l.Cant
+HAVING l.Cant - ISNULL(SUM(a.Cant), 0) > 0;
+
+UPDATE lo SET StockLote = lo.StockLote - a.Cant
+FROM dbo.Lotes lo
+JOIN (SELECT IdLote, SUM(Cant) AS Cant FROM @asig WHERE IdLote IS NOT NULL GROUP BY IdLote) a ON a.IdLote = lo.IdLote;
+
+INSERT INTO dbo.VentaDetalle(IdVenta, IdProducto, Cantidad, PrecioUnit, IdLote)
+SELECT @idv, a.IdProducto, a.Cant, l.PUnit, a.IdLote
+FROM @asig a JOIN @lin l ON l.Linea = a.Linea
+ORDER BY a.Linea, a.IdLote;
+
+-- acumulados para reportes (día / producto / usuario), en la misma transacción
+DECLARE @fecha DATE = CAST(ISNULL(@cuando, SYSDATETIME()) AS DATE);
+MERGE dbo.VentasDiaProducto WITH (HOLDLOCK) AS T
+USING (
+    SELECT d.IdProducto, SUM(l.Cant) AS Cant, SUM(l.Cant * l.PUnit) AS Importe,
+           SUM(l.Cant * ISNULL(c.CostoProm, 0)) AS Costo
+    FROM @lin l
+    JOIN @dem d ON d.Codigo = l.Codigo
+    LEFT JOIN dbo.ProductoCosto c ON c.IdProducto = d.IdProducto
+    GROUP BY d.IdProducto
+) AS S
+ON T.Fecha = @fecha AND T.IdProducto = S.IdProducto AND T.UsuarioId = @usuario
+WHEN MATCHED THEN UPDATE SET T.Cantidad = T.Cantidad + S.Cant, T.Importe = T.Importe + S.Importe,
+                             T.Costo = T.Costo + S.Costo, T.Tickets = T.Tickets + 1
+WHEN NOT MATCHED THEN INSERT(Fecha, IdProducto, UsuarioId, Cantidad, Importe, Costo, Tickets)
+                      VALUES (@fecha, S.IdProducto, @usuario, S.Cant, S.Importe, S.Costo, 1);
+
+MERGE dbo.VentasDiaUsuario WITH (HOLDLOCK) AS T
+USING (SELECT SUM(Cant * PUnit) AS Total FROM @lin) AS S
+ON T.Fecha = @fecha AND T.UsuarioId = @usuario
+WHEN MATCHED THEN UPDATE SET T.Tickets = T.Tickets + 1, T.Total = T.Total + S.Total
+WHEN NOT MATCHED THEN INSERT(Fecha, UsuarioId, Tickets, Total) VALUES (@fecha, @usuario, 1, S.Total);
+
+-- caja: si el usuario tiene una caja abierta, registra el cobro (el trigger mueve el saldo).
+-- Igual que en la compra, la apertura se bloquea por su clave antes de insertar: si caja_cerrar
+-- la cerró mientras tanto, la venta queda grabada sin movimiento de caja en lugar de fallar.
+DECLARE @ap INT = (SELECT IdApertura FROM dbo.CajaAperturas WHERE UsuarioId = @usuario AND Estado = 'A');
+IF @ap IS NOT NULL
+    SET @ap = (SELECT IdApertura FROM dbo.CajaAperturas WITH (UPDLOCK, ROWLOCK)
+               WHERE IdApertura = @ap AND Estado = 'A');
+IF @ap IS NOT NULL
+    INSERT INTO dbo.CajaMov(IdApertura, Tipo, Monto, RefVenta)
+    SELECT @ap, 'VEN', SUM(Cant * PUnit), @idv FROM @lin;
+
+SELECT @idv AS IdVenta, NULL AS Codigo, NULL AS Disponible, NULL AS Pedido;
+"""
+
+def _venta_items_json(items: List[Dict[str, Any]]) -> str:
+    lineas = []
+    for n, it in enumerate(items, 1):
+        lineas.append({"l": n, "c": str(it["codigo"]).strip(), "q": int(it["cant"]), "p": float(it["punit"])})
+    return json.dumps(lineas)
+
+class StockInsuficiente(ValueError):
+    """Venta rechazada por faltantes. faltantes: [(codigo, disponible|None si no existe, pedido)]."""
+
+    def __init__(self, faltantes: List[Tuple[str, Optional[int], int]], mensaje: str):
+        super().__init__(mensaje)
+        self.faltantes = faltantes
+
+def _faltantes_msg(rows) -> str:
+    partes = []
+    for _, codigo, disponible, pedido in rows:
+        if disponible is None:
+            partes.append(f"Código {codigo} no existe.")
+        else:
+            partes.append(f"Stock insuficiente para {codigo}. Disponible: {int(disponible)}, pedido: {int(pedido)}")
+    return "\n".join(partes)
+
+def venta_crear(usuario_id: int, cliente_id: Optional[int], items: List[Dict[str, Any]], nro: Optional[str] = None,
+                clave: Optional[str] = None, fecha: Optional[Any] = None) -> int:
     """
-    Crea venta y detalle, descuenta stock.
+    Crea venta y detalle, descuenta stock — todo el carrito en un solo viaje a la BD.
     items: [{codigo, cant, punit}]
-    No implementa FEFO por lote aquí (se descuenta del stock general).
+    Si algún código no existe o no alcanza el stock, no graba nada y lanza un único
+    StockInsuficiente (ValueError) con todos los faltantes.
+    FEFO: cada línea se reparte entre los lotes con stock que vencen primero (una fila de
+    VentaDetalle por lote, IdLote informado); lo que no cubren los lotes queda con IdLote NULL.
+    Si el usuario tiene una caja abierta, registra el movimiento VEN en la misma transacción
+    (con la apertura bloqueada; si un cierre concurrente ganó, la venta se graba sin movimiento).
+    clave/fecha: idempotencia y fecha real para ventas grabadas después (ver compra_crear).
+    Ante deadlock/timeout/caída de enlace se reintenta sola con la misma clave y el mismo número:
+    el cajero no tiene que volver a cargar el carrito.
+    """
+    if not items:
+        raise ValueError("La venta no tiene ítems.")
+    nro, clave = nro or nro_siguiente("FAC"), clave or nueva_clave()
+    return con_reintentos("venta_crear", lambda: _venta_crear_tx(usuario_id, cliente_id, items, nro, clave, fecha))
+
+def _venta_crear_tx(usuario_id: int, cliente_id: Optional[int], items: List[Dict[str, Any]], nro: str,
+                    clave: str, fecha: Optional[Any]) -> int:
+    cnx = conectar()
+    try:
+        with cnx.cursor() as cur:
+            previa = _clave_aplicada(cur, clave, "VEN")
+            if previa is not None:
+                cnx.commit()
+                return previa
+            cur.execute(_SQL_VENTA_LOTE, (_venta_items_json(items), nro, cliente_id, int(usuario_id), fecha))
+            rows = cur.fetchall()
+            if not rows or not rows[0][0]:
+                if rows:
+                    raise StockInsuficiente([(str(r[1]), None if r[2] is None else int(r[2]), int(r[3])) for r in rows],
+                                            _faltantes_msg(rows))
+                raise ValueError("No se pudo registrar la venta.")
+            idv = int(rows[0][0])
+            _clave_registrar(cur, clave, idv)
+            cnx.commit()
+            return idv
+    except:
+        cnx.rollback()
+        raise
+    finally:
+        cnx.close()
+
+def _venta_crear_por_linea(usuario_id: int, cliente_id: Optional[int], items: List[Dict[str, Any]], nro: Optional[str] = None) -> int:
+    """
+    Versión anterior de venta_crear (3 consultas por ítem). Se conserva solo para comparar
+    en bench_db.py.
     """
     cnx = conectar()
     try:
         with cnx.cursor() as cur:
             total = sum(float(i["cant"]) * float(i["punit"]) for i in items)
             if nro is None:
-                cur.execute("SELECT RIGHT('000000'+CONVERT(VARCHAR(6), ISNULL(MAX(IdVenta),0)+1), 6) FROM dbo.Ventas;")
-                seq = cur.fetchone()[0]
-                nro = f"FAC-{seq}"
+                nro = nro_siguiente("FAC")
 
             cur.execute("""
                 INSERT INTO dbo.Ventas(Fecha, NroComprobante, IdCliente, Total, UsuarioId)
@@ -287,3 +1366,224 @@ def venta_crear(usuario_id: int, cliente_id: Optional[int], items: List[Dict[str
         raise
     finally:
         cnx.close()
+
+# ===================== Reportes =====================
+# Los acumulados VentasDiaProducto / VentasDiaUsuario se mantienen arriba, en la transacción de
+# la venta. La API de consulta (acumulados en arrays, totales, top, comparar, mes) está en
+# reportes.py: necesita numpy, que db.py no exige para vender ni comprar.
+
+# ===================== Alertas de vencimiento =====================
+
+def alertas_barrido() -> Dict[str, int]:
+    """
+    Ejecuta el barrido diario de sp_alertas_vencimiento_barrido (barato si ya corrió hoy)
+    y devuelve el resumen {proximos, vencidos, unidades_vencidas}.
+    """
+    cnx = conectar()
+    try:
+        with cnx.cursor() as cur:
+            cur.execute("EXEC dbo.sp_alertas_vencimiento_barrido;")
+            r = cur.fetchone()
+            cnx.commit()
+            return {"proximos": int(r[0]), "vencidos": int(r[1]), "unidades_vencidas": int(r[2])}
+    finally:
+        cnx.close()
+
+def alertas_resumen() -> Dict[str, int]:
+    """Conteos del conjunto precalculado LotesAlerta, para el tablero."""
+    cnx = conectar()
+    try:
+        with cnx.cursor() as cur:
+            cur.execute("""
+                SELECT ISNULL(SUM(CASE WHEN Estado='P' THEN 1 ELSE 0 END), 0),
+                       ISNULL(SUM(CASE WHEN Estado='V' THEN 1 ELSE 0 END), 0),
+                       ISNULL(SUM(CASE WHEN Estado='V' THEN StockLote ELSE 0 END), 0)
+                FROM dbo.LotesAlerta;
+            """)
+            r = cur.fetchone()
+            return {"proximos": int(r[0]), "vencidos": int(r[1]), "unidades_vencidas": int(r[2])}
+    finally:
+        cnx.close()
+
+def alertas_vencimiento(estado: Optional[str] = None) -> List[Tuple]:
+    """
+    Lotes en alerta: [(IdLote, Codigo, Descripcion, Lote, Vence, StockLote, Estado)] por vencimiento.
+    estado: 'P' próximos, 'V' vencidos con stock, None ambos.
+    """
+    sql = """
+        SELECT a.IdLote, p.Codigo, p.Descripcion, l.Lote, a.Vence, a.StockLote, a.Estado
+        FROM dbo.LotesAlerta a
+        JOIN dbo.Lotes l ON l.IdLote = a.IdLote
+        JOIN dbo.Productos p ON p.IdProducto = a.IdProducto
+    """
+    params: Tuple[Any, ...] = ()
+    if estado:
+        sql += " WHERE a.Estado = ?"
+        params = (estado,)
+    sql += " ORDER BY a.Vence, p.Descripcion"
+    cnx = conectar()
+    try:
+        with cnx.cursor() as cur:
+            cur.execute(sql, params)
+            return cur.fetchall()
+    finally:
+        cnx.close()
+
+# ===================== Caja =====================
+
+CAJA_BLOQUE_VERIF = 5000   # movimientos por bloque al re-sumar en caja_verificar
+
+def caja_abierta(usuario_id: int) -> Optional[int]:
+    """IdApertura de la caja abierta del usuario, o None."""
+    cnx = conectar()
+    try:
+        with cnx.cursor() as cur:
+            cur.execute("SELECT IdApertura FROM dbo.CajaAperturas WHERE UsuarioId=? AND Estado='A';", (int(usuario_id),))
+            r = cur.fetchone()
+            return int(r[0]) if r else None
+    finally:
+        cnx.close()
+
+def caja_abrir(usuario_id: int, monto_inicial: float = 0) -> int:
+    """Abre una caja para el usuario. Devuelve IdApertura."""
+    cnx = conectar()
+    try:
+        with cnx.cursor() as cur:
+            cur.execute("SELECT IdApertura FROM dbo.CajaAperturas WITH (UPDLOCK, HOLDLOCK) WHERE UsuarioId=? AND Estado='A';",
+                        (int(usuario_id),))
+            if cur.fetchone():
+                raise ValueError("El usuario ya tiene una caja abierta.")
+            cur.execute("""
+                INSERT INTO dbo.CajaAperturas(FechaApertura, UsuarioId, MontoInicial, Estado, Saldo)
+                VALUES (SYSDATETIME(), ?, ?, 'A', ?);
+            """, (int(usuario_id), float(monto_inicial), float(monto_inicial)))
+            cur.execute("SELECT SCOPE_IDENTITY();")
+            ida = int(cur.fetchone()[0])
+            cnx.commit()
+            return ida
+    except:
+        cnx.rollback()
+        raise
+    finally:
+        cnx.close()
+
+def caja_mov(id_apertura: int, tipo: str, monto: float, observacion: Optional[str] = None) -> int:
+    """
+    Movimiento manual de caja: tipo 'ING' (ingreso) o 'EGR' (egreso), monto positivo.
+    Las ventas y compras registran VEN/COM solas. Devuelve IdMov.
+    """
+    if tipo not in ("ING", "EGR"):
+        raise ValueError("Tipo de movimiento inválido (use ING o EGR).")
+    if float(monto) <= 0:
+        raise ValueError("El monto debe ser mayor a cero.")
+    cnx = conectar()
+    try:
+        with cnx.cursor() as cur:
+            cur.execute("""
+                SET NOCOUNT ON;
+                INSERT INTO dbo.CajaMov(IdApertura, Tipo, Monto, Observacion) VALUES (?, ?, ?, ?);
+                SELECT CAST(SCOPE_IDENTITY() AS INT);
+            """, (int(id_apertura), tipo, float(monto), observacion))
+            idm = int(cur.fetchone()[0])
+            cnx.commit()
+            return idm
+    except:
+        cnx.rollback()
+        raise
+    finally:
+        cnx.close()
+
+def caja_saldo(id_apertura: int) -> Dict[str, Any]:
+    """
+    Estado de la caja leyendo el saldo corriente (una fila, sin sumar movimientos):
+    {inicial, saldo, movimientos, estado}.
+    """
+    cnx = conectar()
+    try:
+        with cnx.cursor() as cur:
+            cur.execute("SELECT MontoInicial, Saldo, Movimientos, Estado FROM dbo.CajaAperturas WHERE IdApertura=?;",
+                        (int(id_apertura),))
+            r = cur.fetchone()
+            if not r:
+                raise ValueError(f"La apertura {id_apertura} no existe.")
+            return {"inicial": float(r[0]), "saldo": float(r[1]), "movimientos": int(r[2]), "estado": str(r[3])}
+    finally:
+        cnx.close()
+
+def caja_cerrar(id_apertura: int, monto_conteo: float) -> Dict[str, float]:
+    """
+    Cierra la caja: registra el conteo en CajaCierres con Diferencia = conteo - saldo esperado.
+    Devuelve {esperado, conteo, diferencia}.
+    """
+    cnx = conectar()
+    try:
+        with cnx.cursor() as cur:
+            cur.execute("SELECT Saldo, Estado FROM dbo.CajaAperturas WITH (UPDLOCK) WHERE IdApertura=?;", (int(id_apertura),))
+            r = cur.fetchone()
+            if not r:
+                raise ValueError(f"La apertura {id_apertura} no existe.")
+            if r[1] != "A":
+                raise ValueError("La caja ya está cerrada.")
+            esperado = float(r[0])
+            diferencia = float(monto_conteo) - esperado
+            cur.execute("""
+                INSERT INTO dbo.CajaCierres(IdApertura, FechaCierre, MontoConteo, Diferencia)
+                VALUES (?, SYSDATETIME(), ?, ?);
+            """, (int(id_apertura), float(monto_conteo), diferencia))
+            cur.execute("UPDATE dbo.CajaAperturas SET Estado='C', FechaCierre=SYSDATETIME() WHERE IdApertura=?;",
+                        (int(id_apertura),))
+            cnx.commit()
+            return {"esperado": esperado, "conteo": float(monto_conteo), "diferencia": diferencia}
+    except:
+        cnx.rollback()
+        raise
+    finally:
+        cnx.close()
+
+def _caja_resumar(cur, id_apertura: int, desde_mov: int) -> Tuple[float, int, int]:
+    """Suma neta de movimientos con IdMov > desde_mov, en bloques cortos. Devuelve (neto, cantidad, último IdMov)."""
+    neto, cant, ultimo = 0.0, 0, desde_mov
+    while True:
+        cur.execute("""
+            SELECT MAX(IdMov), SUM(CASE WHEN Tipo IN ('EGR','COM') THEN -Monto ELSE Monto END), COUNT(*)
+            FROM (SELECT TOP (?) IdMov, Tipo, Monto FROM dbo.CajaMov
+                  WHERE IdApertura = ? AND IdMov > ? ORDER BY IdMov) b;
+        """, (CAJA_BLOQUE_VERIF, int(id_apertura), ultimo))
+        r = cur.fetchone()
+        if not r or not r[2]:
+            return neto, cant, ultimo
+        ultimo, neto, cant = int(r[0]), neto + float(r[1]), cant + int(r[2])
+
+def caja_verificar(id_apertura: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Compara el saldo corriente con la re-suma de CajaMov (por bloques, sin bloqueos largos).
+    Sin id_apertura revisa todas las cajas abiertas. Devuelve solo las que no cuadran:
+    [{id_apertura, saldo, recalculado, movimientos, contados}].
+    """
+    cnx = conectar()
+    try:
+        with cnx.cursor() as cur:
+            if id_apertura is None:
+                cur.execute("SELECT IdApertura FROM dbo.CajaAperturas WHERE Estado='A';")
+                ids = [int(r[0]) for r in cur.fetchall()]
+            else:
+                ids = [int(id_apertura)]
+            difs: List[Dict[str, Any]] = []
+            for ida in ids:
+                neto, cant, ultimo = 0.0, 0, 0
+                for _ in range(5):
+                    # si entran movimientos mientras se suma, se agregan solo los nuevos y se vuelve a comparar
+                    n, c, ultimo = _caja_resumar(cur, ida, ultimo)
+                    neto, cant = neto + n, cant + c
+                    cur.execute("SELECT MontoInicial, Saldo, Movimientos FROM dbo.CajaAperturas WHERE IdApertura=?;", (ida,))
+                    inicial, saldo, movs = cur.fetchone()
+                    cnx.commit()
+                    if int(movs) == cant:
+                        break
+                recalculado = float(inicial) + neto
+                if int(movs) != cant or abs(recalculado - float(saldo)) > 0.005:
+                    difs.append({"id_apertura": ida, "saldo": float(saldo), "recalculado": recalculado,
+                                 "movimientos": int(movs), "contados": cant})
+            return difs
+    finally:
+        cnx.close()
@@ -0,0 +1,202 @@
+# db_async.py — Ejecuta llamadas de db.py en hilos de fondo para no congelar la UI Tk
+# Uso:
+#     db_async.iniciar(root)                       # una vez, con la ventana principal
+#     db_async.enviar(db.ping, al_terminar=ok, al_fallar=error, tipo="ping")
+#     db_async.enviar(db.productos_sugerir, txt, al_terminar=mostrar, clave="sugerir")
+
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+HILOS_BD     = 4      # llamadas simultáneas a la BD
+SONDEO_MS    = 25     # cada cuánto la UI revisa resultados terminados
+
+# Presupuesto de latencia (seg.) por tipo de llamada: pasado ese tiempo la UI recibe
+# un TimeoutError y el resultado tardío se descarta.
+# Las escrituras no tienen presupuesto (None): el hilo podría confirmar la venta después de que
+# la UI la dio por fallida, así que se espera el resultado real (db.con_reintentos acota los intentos).
+PRESUPUESTOS: Dict[str, Optional[float]] = {
+    "ping": 6.0,
+    "login": 8.0,
+    "sugerir": 2.0,
+    "listar": 6.0,
+    "venta": None,
+    "compra": None,
+    "imagen": 15.0,
+    "consulta": 10.0,
+}
+
+
+class TareaCancelada(Exception):
+    """La tarea se canceló antes de que su llamada a la BD abriera un cursor."""
+
+
+_hilo = threading.local()   # tarea que está ejecutando cada hilo de trabajo
+
+
+class Tarea:
+    """
+    Llamada enviada al ejecutor. cancelar() evita que se ejecuten sus callbacks y, si ya
+    está corriendo, cancela en el servidor la sentencia en curso (pyodbc Cursor.cancel()):
+    una búsqueda reemplazada no ocupa un hilo hasta que SQL Server termine.
+    """
+    __slots__ = ("futuro", "tipo", "clave", "limite", "al_terminar", "al_fallar", "cancelada", "cursores")
+
+    def __init__(self, futuro: Optional[Future], tipo: str, clave: Optional[str], limite: float,
+                 al_terminar: Optional[Callable[[Any], None]], al_fallar: Optional[Callable[[Exception], None]]):
+        self.futuro = futuro
+        self.tipo = tipo
+        self.clave = clave
+        self.limite = limite
+        self.al_terminar = al_terminar
+        self.al_fallar = al_fallar
+        self.cancelada = False
+        self.cursores: Optional[List[Any]] = []   # None cuando la llamada terminó
+
+    def cancelar(self):
+        self.cancelada = True
+        if self.futuro is not None:
+            self.futuro.cancel()   # si todavía no empezó, ni siquiera se ejecuta
+        for cur in list(self.cursores or ()):
+            try:
+                cur.cancel()
+            except Exception:
+                pass   # cursor ya cerrado o sentencia terminada
+
+    def _registrar(self, cur):
+        if self.cursores is None:
+            return
+        self.cursores.append(cur)
+        if self.cancelada:   # se canceló antes de abrir el cursor: no llega a ejecutar nada
+            raise TareaCancelada("La consulta fue reemplazada o cancelada.")
+
+
+def registrar_cursor(cur):
+    """
+    Lo llama db.py al abrir cada cursor: si el hilo está ejecutando una Tarea, su cancelar()
+    podrá interrumpir la sentencia. Fuera de un hilo del ejecutor no hace nada.
+    """
+    tarea = getattr(_hilo, "tarea", None)
+    if tarea is not None:
+        tarea._registrar(cur)
+
+
+def _correr(tarea: Tarea, fn: Callable, args, kwargs):
+    _hilo.tarea = tarea
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        _hilo.tarea = None
+        tarea.cursores = None   # la conexión volvió al pool: no cancelar sentencias ajenas
+
+
+class EjecutorBD:
+    """
+    Pool de hilos para db.py. Los callbacks siempre corren en el hilo de Tk: los hilos de
+    trabajo solo dejan el resultado en una cola que la UI lee con after().
+    Con `clave`, una tarea nueva reemplaza a la anterior de la misma clave (autocompletado) y
+    cancela su sentencia si ya estaba en el servidor.
+    """
+
+    def __init__(self, widget, hilos: int = HILOS_BD):
+        self.widget = widget
+        self._pool = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="bd")
+        self._listas: "queue.Queue[Tarea]" = queue.Queue()
+        self._pendientes: Dict[int, Tarea] = {}
+        self._por_clave: Dict[str, Tarea] = {}
+        self._lock = threading.Lock()
+        self.stats = {"enviadas": 0, "ok": 0, "errores": 0, "vencidas": 0, "reemplazadas": 0}
+        self._after = widget.after(SONDEO_MS, self._sondear)
+
+    def enviar(self, fn: Callable, *args, al_terminar=None, al_fallar=None,
+               clave: Optional[str] = None, tipo: str = "consulta", **kwargs) -> Tarea:
+        presupuesto = PRESUPUESTOS.get(tipo, PRESUPUESTOS["consulta"])
+        limite = float("inf") if presupuesto is None else time.monotonic() + presupuesto
+        tarea = Tarea(None, tipo, clave, limite, al_terminar, al_fallar)
+        futuro = tarea.futuro = self._pool.submit(_correr, tarea, fn, args, kwargs)
+        with self._lock:
+            self.stats["enviadas"] += 1
+            if clave is not None:
+                anterior = self._por_clave.get(clave)
+                if anterior is not None:
+                    anterior.cancelar()
+                    self.stats["reemplazadas"] += 1
+                self._por_clave[clave] = tarea
+            self._pendientes[id(tarea)] = tarea
+        futuro.add_done_callback(lambda _f: self._listas.put(tarea))
+        return tarea
+
+    def _sondear(self):
+        # se reprograma antes de entregar: un callback puede abrir un loop anidado (wait_window)
+        try:
+            self._after = self.widget.after(SONDEO_MS, self._sondear)
+        except Exception:
+            return   # la ventana ya se destruyó
+        ahora = time.monotonic()
+        while True:
+            try:
+                tarea = self._listas.get_nowait()
+            except queue.Empty:
+                break
+            if self._retirar(tarea):
+                self._entregar(tarea)
+        with self._lock:
+            vencidas = [t for t in self._pendientes.values() if not t.cancelada and t.limite <= ahora]
+        for t in vencidas:
+            if self._retirar(t):
+                self.stats["vencidas"] += 1
+                t.cancelar()
+                self._llamar(t.al_fallar, TimeoutError(
+                    "La base de datos no respondió a tiempo. Verifique la red e intente nuevamente."))
+
+    def _retirar(self, tarea: Tarea) -> bool:
+        """Saca la tarea de pendientes; False si ya fue entregada, vencida o cancelada."""
+        with self._lock:
+            if self._pendientes.pop(id(tarea), None) is None:
+                return False
+            if tarea.clave is not None and self._por_clave.get(tarea.clave) is tarea:
+                del self._por_clave[tarea.clave]
+        return not tarea.cancelada
+
+    def _entregar(self, tarea: Tarea):
+        try:
+            res = tarea.futuro.result()
+        except Exception as e:
+            self.stats["errores"] += 1
+            self._llamar(tarea.al_fallar, e)
+            return
+        self.stats["ok"] += 1
+        self._llamar(tarea.al_terminar, res)
+
+    def _llamar(self, cb, valor):
+        if cb is None:
+            return
+        try:
+            cb(valor)
+        except Exception as e:
+            self.widget.report_callback_exception(type(e), e, e.__traceback__)
+
+    def cerrar(self):
+        try:
+            self.widget.after_cancel(self._after)
+        except Exception:
+            pass
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+_ejecutor: Optional[EjecutorBD] = None
+
+def iniciar(widget, hilos: int = HILOS_BD) -> EjecutorBD:
+    """Crea el ejecutor global ligado a la ventana raíz de Tk."""
+    global _ejecutor
+    if _ejecutor is None:
+        _ejecutor = EjecutorBD(widget, hilos)
+    return _ejecutor
+
+def enviar(fn: Callable, *args, **kwargs) -> Tarea:
+    """Atajo a EjecutorBD.enviar sobre el ejecutor global (ver iniciar)."""
+    if _ejecutor is None:
+        raise RuntimeError("db_async.iniciar(root) no fue llamado.")
+    return _ejecutor.enviar(fn, *args, **kwargs)
@@ -0,0 +1,318 @@
+# db_local.py — Sustituto en SQLite de la API de negocio de db.py (pruebas y benchmarks sin SQL Server)
+# Mismas firmas y mismos resultados/errores que db.py para: ping, validar_usuario, proveedores_listar,
+# producto_get_por_codigo, productos_sugerir, venta_crear y compra_crear (con clave de idempotencia).
+# No es para producción: no hay caja, alertas ni acumulados; solo lo que ejercita bench_carga.py.
+# FallasInyectadas envuelve un BDLocal y simula deadlocks y respuestas perdidas (ver db.con_reintentos).
+
+import datetime as dt
+import hashlib
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS Roles(IdRol INTEGER PRIMARY KEY, Nombre TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS Usuarios(
+    IdUsuario INTEGER PRIMARY KEY, Usuario TEXT NOT NULL UNIQUE, ClaveHash BLOB NOT NULL,
+    RolId INTEGER NOT NULL, Activo INTEGER NOT NULL DEFAULT 1);
+CREATE TABLE IF NOT EXISTS Clientes(
+    IdCliente INTEGER PRIMARY KEY, Documento TEXT, Nombre TEXT NOT NULL, Telefono TEXT, Email TEXT);
+CREATE TABLE IF NOT EXISTS Proveedores(
+    IdProveedor INTEGER PRIMARY KEY, Ruc TEXT NOT NULL, RazonSocial TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS Productos(
+    IdProducto INTEGER PRIMARY KEY, Codigo TEXT NOT NULL UNIQUE, Descripcion TEXT NOT NULL,
+    Precio REAL NOT NULL CHECK (Precio >= 0), Stock INTEGER NOT NULL DEFAULT 0 CHECK (Stock >= 0),
+    StockMin INTEGER NOT NULL DEFAULT 0, RequiereReceta INTEGER NOT NULL DEFAULT 0);
+CREATE INDEX IF NOT EXISTS IX_Productos_Descripcion ON Productos(Descripcion);
+CREATE TABLE IF NOT EXISTS Lotes(
+    IdLote INTEGER PRIMARY KEY, IdProducto INTEGER NOT NULL, Lote TEXT NOT NULL, Vence TEXT NOT NULL,
+    StockLote INTEGER NOT NULL DEFAULT 0 CHECK (StockLote >= 0));
+CREATE INDEX IF NOT EXISTS IX_Lotes_Producto ON Lotes(IdProducto, Vence);
+CREATE TABLE IF NOT EXISTS Ventas(
+    IdVenta INTEGER PRIMARY KEY, Fecha TEXT NOT NULL, NroComprobante TEXT NOT NULL UNIQUE,
+    IdCliente INTEGER, Total REAL NOT NULL, UsuarioId INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS VentaDetalle(
+    IdDet INTEGER PRIMARY KEY, IdVenta INTEGER NOT NULL, IdProducto INTEGER NOT NULL, IdLote INTEGER,
+    Cantidad INTEGER NOT NULL CHECK (Cantidad > 0), PrecioUnit REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS Compras(
+    IdCompra INTEGER PRIMARY KEY, Fecha TEXT NOT NULL, NroComprobante TEXT NOT NULL UNIQUE,
+    IdProveedor INTEGER NOT NULL, Total REAL NOT NULL, UsuarioId INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS CompraDetalle(
+    IdDet INTEGER PRIMARY KEY, IdCompra INTEGER NOT NULL, IdProducto INTEGER NOT NULL,
+    Cantidad INTEGER NOT NULL CHECK (Cantidad > 0), PrecioUnit REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS Numeracion(Serie TEXT PRIMARY KEY, Ultimo INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS OperacionesAplicadas(
+    Clave TEXT PRIMARY KEY, Tipo TEXT NOT NULL, IdRemoto INTEGER NOT NULL, Fecha TEXT NOT NULL);
+"""
+
+
+def clave_hash(clave: str) -> bytes:
+    """Igual que HASHBYTES('SHA2_256', CONVERT(NVARCHAR(4000), clave)) en SQL Server (UTF-16LE)."""
+    return hashlib.sha256(clave.encode("utf-16-le")).digest()
+
+
+class BDLocal:
+    """
+    Base SQLite en archivo (modo WAL) con la interfaz de db.py.
+    Cada hilo usa su propia conexión; las escrituras se serializan con BEGIN IMMEDIATE,
+    como lo haría un único servidor con bloqueos de fila muy gruesos.
+    """
+
+    def __init__(self, ruta: Optional[str] = None):
+        if ruta is None:
+            fd, ruta = tempfile.mkstemp(prefix="farmacia_local_", suffix=".sqlite")
+            os.close(fd)
+        self.ruta = ruta
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._abiertas: List[sqlite3.Connection] = []
+        self._cnx().executescript(_ESQUEMA)
+
+    def _cnx(self) -> sqlite3.Connection:
+        cnx = getattr(self._local, "cnx", None)
+        if cnx is None:
+            cnx = sqlite3.connect(self.ruta, timeout=30, isolation_level=None, check_same_thread=False)
+            cnx.execute("PRAGMA journal_mode=WAL;")
+            cnx.execute("PRAGMA synchronous=NORMAL;")
+            self._local.cnx = cnx
+            with self._lock:
+                self._abiertas.append(cnx)
+        return cnx
+
+    def _nro(self, cur, serie: str) -> str:
+        cur.execute("INSERT INTO Numeracion(Serie, Ultimo) VALUES (?, 1) "
+                    "ON CONFLICT(Serie) DO UPDATE SET Ultimo = Ultimo + 1;", (serie,))
+        n = cur.execute("SELECT Ultimo FROM Numeracion WHERE Serie=?;", (serie,)).fetchone()[0]
+        return f"{serie}-{int(n):06d}"
+
+    # --- API de db.py ---
+    def ping(self) -> str:
+        return os.path.basename(self.ruta)
+
+    def validar_usuario(self, usuario: str, clave: str):
+        r = self._cnx().execute("""
+            SELECT u.IdUsuario, r.Nombre, CASE WHEN u.ClaveHash = ? AND u.Activo = 1 THEN 1 ELSE 0 END
+            FROM Usuarios u JOIN Roles r ON r.IdRol = u.RolId WHERE u.Usuario = ?;
+        """, (clave_hash(clave), usuario)).fetchone()
+        if not r:
+            return False, None, None
+        ok = bool(r[2])
+        return (ok, r[1] if ok else None, r[0] if ok else None)
+
+    def proveedores_listar(self) -> List[Tuple[int, str]]:
+        return [(int(r[0]), str(r[1])) for r in
+                self._cnx().execute("SELECT IdProveedor, RazonSocial FROM Proveedores ORDER BY RazonSocial;")]
+
+    def producto_get_por_codigo(self, codigo: str) -> Optional[Tuple]:
+        return self._cnx().execute("""
+            SELECT IdProducto, Codigo, Descripcion, Precio, Stock, StockMin, RequiereReceta
+            FROM Productos WHERE Codigo = ?;
+        """, (codigo.strip(),)).fetchone()
+
+    def productos_sugerir(self, term: str) -> List[Tuple[str, str, float, int]]:
+        return self._cnx().execute("""
+            SELECT Codigo, Descripcion, Precio, Stock FROM Productos
+            WHERE Codigo LIKE ? OR Descripcion LIKE ?
+            ORDER BY Descripcion LIMIT 10;
+        """, (term + "%", "%" + term + "%")).fetchall()
+
+    def _clave_aplicada(self, cur, clave: Optional[str]) -> Optional[int]:
+        if not clave:
+            return None
+        r = cur.execute("SELECT IdRemoto FROM OperacionesAplicadas WHERE Clave=?;", (clave,)).fetchone()
+        return int(r[0]) if r else None
+
+    def _clave_registrar(self, cur, clave: Optional[str], tipo: str, id_remoto: int):
+        if clave:
+            cur.execute("INSERT INTO OperacionesAplicadas(Clave, Tipo, IdRemoto, Fecha) VALUES (?, ?, ?, ?);",
+                        (clave, tipo, int(id_remoto), dt.datetime.now().isoformat(sep=" ")))
+
+    def venta_crear(self, usuario_id: int, cliente_id: Optional[int], items: List[Dict[str, Any]],
+                    nro: Optional[str] = None, clave: Optional[str] = None, fecha: Optional[dt.datetime] = None) -> int:
+        """Como db.venta_crear (valida todo el carrito, FEFO por lote). `fecha` permite cargar histórico."""
+        if not items:
+            raise ValueError("La venta no tiene ítems.")
+        cnx = self._cnx()
+        cur = cnx.cursor()
+        cur.execute("BEGIN IMMEDIATE;")
+        try:
+            previa = self._clave_aplicada(cur, clave)
+            if previa is not None:
+                cur.execute("COMMIT;")
+                return previa
+            pedido: Dict[str, int] = {}
+            for it in items:
+                c = str(it["codigo"]).strip()
+                pedido[c] = pedido.get(c, 0) + int(it["cant"])
+            ids: Dict[str, int] = {}
+            faltantes: List[Tuple[str, Optional[int], int]] = []
+            mensajes: List[str] = []
+            for codigo, cant in sorted(pedido.items()):   # faltantes en orden de Codigo, como db.py
+                r = cur.execute("SELECT IdProducto, Stock FROM Productos WHERE Codigo=?;", (codigo,)).fetchone()
+                if not r:
+                    faltantes.append((codigo, None, cant))
+                    mensajes.append(f"Código {codigo} no existe.")
+                elif int(r[1]) < cant:
+                    faltantes.append((codigo, int(r[1]), cant))
+                    mensajes.append(f"Stock insuficiente para {codigo}. Disponible: {int(r[1])}, pedido: {cant}")
+                else:
+                    ids[codigo] = int(r[0])
+            if faltantes:
+                import db   # el mismo error que db.venta_crear (import diferido: db necesita pyodbc)
+                raise db.StockInsuficiente(faltantes, "\n".join(mensajes))
+
+            total = sum(int(i["cant"]) * float(i["punit"]) for i in items)
+            dia = (fecha or dt.datetime.now()).date().isoformat()   # los lotes vencidos no se venden
+            cur.execute("INSERT INTO Ventas(Fecha, NroComprobante, IdCliente, Total, UsuarioId) VALUES (?, ?, ?, ?, ?);",
+                        ((fecha or dt.datetime.now()).isoformat(sep=" "), nro or self._nro(cur, "FAC"),
+                         cliente_id, total, int(usuario_id)))
+            idv = cur.lastrowid
+            for it in items:
+                pid, resto, punit = ids[str(it["codigo"]).strip()], int(it["cant"]), float(it["punit"])
+                cur.execute("UPDATE Productos SET Stock = Stock - ? WHERE IdProducto=?;", (resto, pid))
+                lotes = cur.execute("SELECT IdLote, StockLote FROM Lotes WHERE IdProducto=? AND StockLote > 0 "
+                                    "AND Vence >= ? ORDER BY Vence, IdLote;", (pid, dia)).fetchall()
+                for id_lote, stock_lote in lotes:
+                    if resto == 0:
+                        break
+                    q = min(resto, int(stock_lote))
+                    cur.execute("UPDATE Lotes SET StockLote = StockLote - ? WHERE IdLote=?;", (q, id_lote))
+                    cur.execute("INSERT INTO VentaDetalle(IdVenta, IdProducto, IdLote, Cantidad, PrecioUnit) "
+                                "VALUES (?, ?, ?, ?, ?);", (idv, pid, id_lote, q, punit))
+                    resto -= q
+                if resto:
+                    cur.execute("INSERT INTO VentaDetalle(IdVenta, IdProducto, IdLote, Cantidad, PrecioUnit) "
+                                "VALUES (?, ?, NULL, ?, ?);", (idv, pid, resto, punit))
+            self._clave_registrar(cur, clave, "VEN", idv)
+            cur.execute("COMMIT;")
+            return int(idv)
+        except:
+            cur.execute("ROLLBACK;")
+            raise
+
+    def compra_crear(self, usuario_id: int, proveedor_id: int, items: Iterable[Dict[str, Any]],
+                     nro: Optional[str] = None, clave: Optional[str] = None, fecha: Optional[dt.datetime] = None) -> int:
+        """Como db.compra_crear: crea productos que no existan, suma stock y crea lotes con vencimiento."""
+        cnx = self._cnx()
+        cur = cnx.cursor()
+        cur.execute("BEGIN IMMEDIATE;")
+        try:
+            previa = self._clave_aplicada(cur, clave)
+            if previa is not None:
+                cur.execute("COMMIT;")
+                return previa
+            cur.execute("INSERT INTO Compras(Fecha, NroComprobante, IdProveedor, Total, UsuarioId) VALUES (?, ?, ?, 0, ?);",
+                        ((fecha or dt.datetime.now()).isoformat(sep=" "), nro or self._nro(cur, "OC"), int(proveedor_id),
+                         int(usuario_id)))
+            idc = cur.lastrowid
+            total, n = 0.0, 0
+            for n, it in enumerate(items, 1):
+                codigo, cant, punit = str(it["codigo"]).strip(), int(it["cant"]), float(it["punit"])
+                vence = str(it.get("vence") or "").strip() or None
+                cur.execute("""
+                    INSERT INTO Productos(Codigo, Descripcion, Precio, Stock) VALUES (?, ?, ?, ?)
+                    ON CONFLICT(Codigo) DO UPDATE SET Stock = Stock + excluded.Stock, Precio = excluded.Precio;
+                """, (codigo, str(it.get("desc") or codigo).strip(), punit, cant))
+                pid = cur.execute("SELECT IdProducto FROM Productos WHERE Codigo=?;", (codigo,)).fetchone()[0]
+                if vence:
+                    cur.execute("INSERT INTO Lotes(IdProducto, Lote, Vence, StockLote) VALUES (?, ?, ?, ?);",
+                                (pid, f"C{idc}-{n}", vence, cant))
+                cur.execute("INSERT INTO CompraDetalle(IdCompra, IdProducto, Cantidad, PrecioUnit) VALUES (?, ?, ?, ?);",
+                            (idc, pid, cant, punit))
+                total += cant * punit
+            if not n:
+                raise ValueError("La compra no tiene ítems.")
+            cur.execute("UPDATE Compras SET Total=? WHERE IdCompra=?;", (total, idc))
+            self._clave_registrar(cur, clave, "COM", idc)
+            cur.execute("COMMIT;")
+            return int(idc)
+        except:
+            cur.execute("ROLLBACK;")
+            raise
+
+    # --- carga masiva (solo en el sustituto; ver bench_carga.poblar) ---
+    def cargar_masivo(self, tabla: str, columnas: Tuple[str, ...], filas: Iterable[Tuple]) -> int:
+        """INSERT por executemany dentro de una transacción. Devuelve filas insertadas."""
+        cur = self._cnx().cursor()
+        cur.execute("BEGIN IMMEDIATE;")
+        try:
+            marcas = ", ".join("?" * len(columnas))
+            cur.executemany(f"INSERT INTO {tabla}({', '.join(columnas)}) VALUES ({marcas});", filas)
+            n = cur.rowcount
+            cur.execute("COMMIT;")
+            return n
+        except:
+            cur.execute("ROLLBACK;")
+            raise
+
+    def ejecutar(self, sql: str, params: Tuple = ()) -> int:
+        """Sentencia suelta en autocommit. Devuelve filas afectadas."""
+        return self._cnx().execute(sql, params).rowcount
+
+    def consultar(self, sql: str, params: Tuple = ()) -> List[Tuple]:
+        """SELECT suelto (verificaciones de las pruebas)."""
+        return self._cnx().execute(sql, params).fetchall()
+
+    def cerrar(self, borrar: bool = False):
+        """Cierra las conexiones de todos los hilos (llamar cuando ya no se usa la base)."""
+        with self._lock:
+            abiertas, self._abiertas = self._abiertas, []
+        for cnx in abiertas:
+            cnx.close()
+        self._local = threading.local()
+        if borrar:
+            for sufijo in ("", "-wal", "-shm"):
+                try:
+                    os.remove(self.ruta + sufijo)
+                except OSError:
+                    pass
+
+
+class FallasInyectadas:
+    """
+    Envoltura de un BDLocal que falla a propósito en venta_crear/compra_crear, con los mismos
+    errores que da pyodbc contra SQL Server:
+    - antes: deadlock (1205) antes de grabar; la transacción no dejó rastro.
+    - despues: la operación se graba, pero se "pierde" la respuesta (08S01, enlace caído):
+      solo la clave de idempotencia evita grabarla dos veces al reintentar.
+    El resto de los métodos pasa directo al BDLocal.
+    """
+
+    def __init__(self, bd: BDLocal, antes: float = 0.05, despues: float = 0.02, semilla: int = 1):
+        import pyodbc   # solo para construir errores idénticos a los reales
+        self._error = pyodbc.Error
+        self.bd = bd
+        self.antes, self.despues = antes, despues
+        self._r = random.Random(semilla)
+        self._lock = threading.Lock()
+        self.inyectadas = {"deadlock": 0, "respuesta_perdida": 0}
+
+    def __getattr__(self, nombre):
+        return getattr(self.bd, nombre)
+
+    def _sorteo(self) -> float:
+        with self._lock:
+            return self._r.random()
+
+    def _con_fallas(self, fn, *args, **kw):
+        x = self._sorteo()
+        if x < self.antes:
+            with self._lock:
+                self.inyectadas["deadlock"] += 1
+            raise self._error("40001", "[40001] [SQL Server]Transaction (Process ID 0) was deadlocked on lock resources "
+                                       "with another process and has been chosen as the deadlock victim. (1205) (SQLExecDirectW)")
+        r = fn(*args, **kw)
+        if x < self.antes + self.despues:
+            with self._lock:
+                self.inyectadas["respuesta_perdida"] += 1
+            raise self._error("08S01", "[08S01] Communication link failure (10054) (SQLExecDirectW)")
+        return r
+
+    def venta_crear(self, *args, **kw) -> int:
+        return self._con_fallas(self.bd.venta_crear, *args, **kw)
+
+    def compra_crear(self, *args, **kw) -> int:
+        return self._con_fallas(self.bd.compra_crear, *args, **kw)
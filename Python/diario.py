@@ -0,0 +1,285 @@
+# diario.py — Diario local (SQLite en modo WAL) para vender y comprar sin esperar a SQL Server
+# La venta/compra se graba primero en disco local y un hilo de fondo la envía al servidor en
+# orden, con una clave de idempotencia por operación (un reenvío nunca la duplica).
+# Uso:
+#     diario.iniciar()                                   # al abrir la ventana principal
+#     clave = diario.registrar_venta(uid, None, items)   # vuelve en milisegundos
+#     diario.estado()    # {'pendientes': 3, 'atraso_seg': 12.4, 'conflictos': 0, ...}
+# Si al enviar una venta el stock del servidor no alcanza, queda como conflicto para que un
+# encargado la resuelva (ver resolver()).
+
+import datetime as dt
+import json
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+import db
+
+MODO_DIARIO      = True                  # False: registrar_venta/compra van directo a db.py
+DIARIO_RUTA      = "diario_local.sqlite"
+ENVIO_LOTE       = 20      # operaciones por pasada del despachador
+ENVIO_INTERVALO  = 2.0     # seg. entre pasadas cuando no hay novedades
+ESPERA_MAX       = 60.0    # seg. máximos entre reintentos con el servidor caído
+INTENTOS_MAX     = 5       # errores de BD (no de conexión) antes de pasar la operación a conflicto
+CONSERVAR_DIAS   = 30      # días que se guardan las operaciones ya enviadas
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS Operaciones(
+    Seq        INTEGER PRIMARY KEY AUTOINCREMENT,
+    Clave      TEXT NOT NULL UNIQUE,
+    Tipo       TEXT NOT NULL CHECK (Tipo IN ('VEN', 'COM')),
+    UsuarioId  INTEGER NOT NULL,
+    Contraparte INTEGER,                      -- IdCliente (VEN) / IdProveedor (COM)
+    Items      TEXT NOT NULL,                 -- JSON
+    Creado     TEXT NOT NULL,                 -- fecha real de la operación (ISO)
+    Estado     TEXT NOT NULL DEFAULT 'P',     -- P pendiente, E enviada, C conflicto, D descartada
+    Intentos   INTEGER NOT NULL DEFAULT 0,
+    Error      TEXT,
+    IdRemoto   INTEGER,
+    Enviado    TEXT,
+    Ajustes    INTEGER NOT NULL DEFAULT 0     -- ajustes de faltantes ya confirmados (ver resolver)
+);
+CREATE INDEX IF NOT EXISTS IX_Operaciones_Estado ON Operaciones(Estado, Seq);
+"""
+
+# Red/servidor caído (lo que db.con_reintentos no llegó a salvar): se reintenta sin contar el intento.
+def _es_conexion(e: Exception) -> bool:
+    return db.error_transitorio(e) in ("conexion", "timeout")
+
+
+class Diario:
+    def __init__(self, ruta: str = DIARIO_RUTA,
+                 enviar_venta: Optional[Callable[..., int]] = None,
+                 enviar_compra: Optional[Callable[..., int]] = None,
+                 ajustar_faltantes: Optional[Callable[..., int]] = None):
+        self.ruta = ruta
+        self.enviar_venta = enviar_venta or db.venta_crear
+        self.enviar_compra = enviar_compra or db.compra_crear
+        self.ajustar_faltantes = ajustar_faltantes or db.stock_ajustar_faltantes
+        self._local = threading.local()
+        self._despertar = threading.Event()
+        self._detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._ultimo_envio: Optional[float] = None    # time.time() del último envío exitoso
+        self._ultimo_error: Optional[str] = None
+        self._conectado: Optional[bool] = None
+        self.stats = {"registradas": 0, "enviadas": 0, "conflictos": 0, "fallos_conexion": 0}
+        cnx = self._cnx()
+        cnx.executescript(_ESQUEMA)
+        if "Ajustes" not in {c[1] for c in cnx.execute("PRAGMA table_info(Operaciones);")}:   # diario anterior
+            cnx.execute("ALTER TABLE Operaciones ADD COLUMN Ajustes INTEGER NOT NULL DEFAULT 0;")
+
+    def _cnx(self) -> sqlite3.Connection:
+        cnx = getattr(self._local, "cnx", None)
+        if cnx is None:
+            cnx = sqlite3.connect(self.ruta, timeout=30, isolation_level=None)
+            cnx.execute("PRAGMA journal_mode=WAL;")
+            cnx.execute("PRAGMA synchronous=FULL;")   # una venta confirmada sobrevive a un corte de luz
+            self._local.cnx = cnx
+        return cnx
+
+    # --- registro (hilo de la UI) ---
+    def _registrar(self, tipo: str, usuario_id: int, contraparte: Optional[int], items: List[Dict[str, Any]]) -> str:
+        if not items:
+            raise ValueError("La venta no tiene ítems." if tipo == "VEN" else "La compra no tiene ítems.")
+        clave = uuid.uuid4().hex
+        self._cnx().execute(
+            "INSERT INTO Operaciones(Clave, Tipo, UsuarioId, Contraparte, Items, Creado) VALUES (?, ?, ?, ?, ?, ?);",
+            (clave, tipo, int(usuario_id), contraparte, json.dumps(items), dt.datetime.now().isoformat()))
+        with self._lock:
+            self.stats["registradas"] += 1
+        self._despertar.set()
+        return clave
+
+    def venta(self, usuario_id: int, cliente_id: Optional[int], items: List[Dict[str, Any]]) -> str:
+        """Graba la venta en el diario y devuelve su clave. El stock se valida al enviarla."""
+        return self._registrar("VEN", usuario_id, cliente_id, [dict(i) for i in items])
+
+    def compra(self, usuario_id: int, proveedor_id: int, items) -> str:
+        """Graba la compra en el diario (items puede ser un generador, se materializa acá)."""
+        return self._registrar("COM", usuario_id, int(proveedor_id), [dict(i) for i in items])
+
+    # --- envío (hilo de fondo) ---
+    def enviar_lote(self) -> Dict[str, int]:
+        """
+        Envía hasta ENVIO_LOTE operaciones pendientes en orden. Corta al primer error de
+        conexión (se reintenta todo en la próxima pasada). Devuelve contadores de la pasada.
+        """
+        cnx = self._cnx()
+        filas = cnx.execute("""
+            SELECT Seq, Clave, Tipo, UsuarioId, Contraparte, Items, Creado, Intentos
+            FROM Operaciones WHERE Estado = 'P' ORDER BY Seq LIMIT ?;
+        """, (ENVIO_LOTE,)).fetchall()
+        res = {"enviadas": 0, "conflictos": 0, "pendientes": len(filas), "caido": 0}
+        for seq, clave, tipo, uid, contra, items_json, creado, intentos in filas:
+            items, fecha = json.loads(items_json), dt.datetime.fromisoformat(creado)
+            try:
+                if tipo == "VEN":
+                    id_remoto = self.enviar_venta(uid, contra, items, clave=clave, fecha=fecha)
+                else:
+                    id_remoto = self.enviar_compra(uid, contra, items, clave=clave, fecha=fecha)
+            except ValueError as e:
+                # regla de negocio (p. ej. stock que se vendió en otra caja mientras estábamos sin red)
+                faltantes = getattr(e, "faltantes", None)
+                cnx.execute("UPDATE Operaciones SET Estado='C', Error=?, Intentos=Intentos+1 WHERE Seq=?;",
+                            (json.dumps({"mensaje": str(e), "faltantes": faltantes}), seq))
+                res["conflictos"] += 1
+                with self._lock:
+                    self.stats["conflictos"] += 1
+                continue
+            except Exception as e:
+                with self._lock:
+                    self._ultimo_error = str(e)
+                if _es_conexion(e):
+                    self._conectado = False
+                    with self._lock:
+                        self.stats["fallos_conexion"] += 1
+                    res["caido"] = 1
+                    break
+                estado = "C" if intentos + 1 >= INTENTOS_MAX else "P"
+                cnx.execute("UPDATE Operaciones SET Estado=?, Error=?, Intentos=Intentos+1 WHERE Seq=?;",
+                            (estado, json.dumps({"mensaje": str(e)}), seq))
+                res["caido"] = 1   # error de BD inesperado: se espera antes de reintentar
+                break
+            cnx.execute("UPDATE Operaciones SET Estado='E', IdRemoto=?, Error=NULL, Enviado=? WHERE Seq=?;",
+                        (int(id_remoto), dt.datetime.now().isoformat(), seq))
+            res["enviadas"] += 1
+            self._conectado = True
+            with self._lock:
+                self.stats["enviadas"] += 1
+                self._ultimo_envio = time.time()
+                self._ultimo_error = None
+        return res
+
+    def _ciclo(self):
+        espera = ENVIO_INTERVALO
+        while not self._detener.is_set():
+            self._despertar.clear()
+            try:
+                r = self.enviar_lote()
+            except Exception as e:   # diario local ilegible, etc.: no matar el hilo
+                with self._lock:
+                    self._ultimo_error = str(e)
+                r = {"caido": 1, "pendientes": 0}
+            if r["caido"]:
+                # servidor caído: espera creciente con variación (las cajas no reintentan todas juntas);
+                # las ventas nuevas no la acortan
+                espera = min(ESPERA_MAX, espera * 2)
+                self._detener.wait(espera * random.uniform(0.8, 1.2))
+                continue
+            espera = ENVIO_INTERVALO
+            if r["pendientes"] < ENVIO_LOTE:
+                self._despertar.wait(ENVIO_INTERVALO)
+
+    def iniciar(self):
+        if self._hilo is not None:
+            return
+        self._hilo = threading.Thread(target=self._ciclo, name="diario-envio", daemon=True)
+        self._hilo.start()
+
+    def detener(self, esperar: float = 5.0):
+        self._detener.set()
+        self._despertar.set()
+        if self._hilo is not None:
+            self._hilo.join(esperar)
+            self._hilo = None
+        self._detener.clear()
+
+    # --- estado y conflictos ---
+    def estado(self) -> Dict[str, Any]:
+        """Profundidad de la cola, atraso de replicación (seg. de la pendiente más vieja) y conflictos."""
+        cnx = self._cnx()
+        pend, mas_vieja = cnx.execute("SELECT COUNT(*), MIN(Creado) FROM Operaciones WHERE Estado='P';").fetchone()
+        conflictos = cnx.execute("SELECT COUNT(*) FROM Operaciones WHERE Estado='C';").fetchone()[0]
+        atraso = (dt.datetime.now() - dt.datetime.fromisoformat(mas_vieja)).total_seconds() if mas_vieja else 0.0
+        with self._lock:
+            return {"pendientes": int(pend), "conflictos": int(conflictos), "atraso_seg": round(atraso, 1),
+                    "conectado": self._conectado, "ultimo_error": self._ultimo_error,
+                    "ultimo_envio_hace": round(time.time() - self._ultimo_envio, 1) if self._ultimo_envio else None,
+                    **self.stats}
+
+    def conflictos(self) -> List[Dict[str, Any]]:
+        filas = self._cnx().execute("""
+            SELECT Seq, Clave, Tipo, UsuarioId, Items, Creado, Error FROM Operaciones
+            WHERE Estado='C' ORDER BY Seq;
+        """).fetchall()
+        return [{"seq": s, "clave": c, "tipo": t, "usuario_id": u, "items": json.loads(i), "creado": cr,
+                 **json.loads(e or "{}")} for s, c, t, u, i, cr, e in filas]
+
+    def resolver(self, seq: int, accion: str, usuario_id: Optional[int] = None):
+        """
+        Resuelve un conflicto:
+        - 'reintentar': vuelve a la cola (p. ej. después de cargar la compra que faltaba).
+        - 'ajustar': registra en el servidor un ajuste de stock por lo que falta (la mercadería
+          ya salió) y reintenta la venta. Requiere usuario_id del encargado. El faltante se
+          recalcula en el servidor al resolver, en una sola transacción con clave propia: si la
+          respuesta se pierde, volver a 'ajustar' no lo aplica dos veces.
+        - 'descartar': la operación no se envía (anulada en el mostrador).
+        """
+        cnx = self._cnx()
+        r = cnx.execute("SELECT Clave, Tipo, Items, Error, Ajustes FROM Operaciones WHERE Seq=? AND Estado='C';",
+                        (seq,)).fetchone()
+        if not r:
+            raise ValueError(f"La operación {seq} no está en conflicto.")
+        clave, tipo, items_json, error, ajustes = r
+        if accion == "descartar":
+            cnx.execute("UPDATE Operaciones SET Estado='D' WHERE Seq=?;", (seq,))
+            return
+        if accion == "ajustar":
+            if tipo != "VEN" or not json.loads(error or "{}").get("faltantes") or usuario_id is None:
+                raise ValueError("Solo se pueden ajustar ventas con faltantes de stock, indicando el encargado.")
+            # una clave por ajuste confirmado: si la venta vuelve a quedar sin stock, el próximo es otro
+            self.ajustar_faltantes(usuario_id, json.loads(items_json), f"AJ{ajustes}-{clave}",
+                                   f"Venta fuera de línea {clave}")
+            cnx.execute("UPDATE Operaciones SET Estado='P', Intentos=0, Ajustes=Ajustes+1 WHERE Seq=?;", (seq,))
+            self._despertar.set()
+            return
+        if accion != "reintentar":
+            raise ValueError("Acción desconocida: use 'reintentar', 'ajustar' o 'descartar'.")
+        cnx.execute("UPDATE Operaciones SET Estado='P', Intentos=0 WHERE Seq=?;", (seq,))
+        self._despertar.set()
+
+    def purgar(self, dias: int = CONSERVAR_DIAS) -> int:
+        """Borra las operaciones enviadas o descartadas hace más de `dias` días."""
+        corte = (dt.datetime.now() - dt.timedelta(days=dias)).isoformat()
+        return self._cnx().execute("DELETE FROM Operaciones WHERE Estado IN ('E','D') AND Creado < ?;",
+                                   (corte,)).rowcount
+
+
+_diario: Optional[Diario] = None
+_diario_lock = threading.Lock()
+
+def diario() -> Diario:
+    global _diario
+    if _diario is None:
+        with _diario_lock:
+            if _diario is None:
+                _diario = Diario()
+    return _diario
+
+def iniciar() -> Diario:
+    """Abre el diario local y arranca el envío en segundo plano (idempotente)."""
+    d = diario()
+    d.purgar()
+    d.iniciar()
+    return d
+
+def estado() -> Dict[str, Any]:
+    return diario().estado()
+
+def registrar_venta(usuario_id: int, cliente_id: Optional[int], items: List[Dict[str, Any]]):
+    """Con MODO_DIARIO devuelve la clave local; si no, el IdVenta de db.venta_crear."""
+    if MODO_DIARIO:
+        return diario().venta(usuario_id, cliente_id, items)
+    return db.venta_crear(usuario_id, cliente_id, items)
+
+def registrar_compra(usuario_id: int, proveedor_id: int, items):
+    """Con MODO_DIARIO devuelve la clave local; si no, el IdCompra de db.compra_crear."""
+    if MODO_DIARIO:
+        return diario().compra(usuario_id, proveedor_id, items)
+    return db.compra_crear(usuario_id, proveedor_id, items)
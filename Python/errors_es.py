@@ -7,7 +7,7 @@ Uso: from errors_es import err_es
 """
 
 import re
-import pyodbc
+import sys
 
 _PATTERNS = [
     # Conexión / Driver
@@ -43,7 +43,8 @@ def err_es(e: Exception) -> str:
     Devuelve un mensaje en español para mostrar al usuario final.
     Intenta traducir errores comunes de pyodbc/SQL Server y Python.
     """
-    if isinstance(e, pyodbc.Error):
+    pyodbc = sys.modules.get("pyodbc")   # si no se importó, e no puede ser un error de pyodbc
+    if pyodbc is not None and isinstance(e, pyodbc.Error):
         for part in map(str, e.args):
             if not part:
                 continue
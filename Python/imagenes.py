@@ -0,0 +1,217 @@
+# imagenes.py — Miniaturas de dbo.producto_imagenes sin trabar la UI
+# - Lee el VARBINARY(MAX) por bloques (SUBSTRING) a un archivo temporal, nunca entero en memoria,
+#   todos en una transacción SNAPSHOT: si la imagen se reemplaza a mitad de lectura no se mezclan.
+# - Genera la miniatura una sola vez y la guarda en disco (clave: id_imagen + creado_en); al
+#   generar borra las versiones anteriores de la misma imagen y podar() acota el total en disco.
+# - Mantiene un LRU en memoria de ImageTk.PhotoImage con presupuesto de bytes.
+# - La lectura y el decodificado corren en un EjecutorBD propio; la UI solo crea el PhotoImage.
+
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from PIL import Image, ImageTk
+
+import db
+import db_async
+
+CACHE_DIR          = os.path.join("cache", "miniaturas")
+TAM_MINIATURA      = (48, 48)
+BLOQUE_BLOB        = 256 * 1024          # bytes por lectura de SUBSTRING
+PRESUPUESTO_MEMORIA = 16 * 1024 * 1024   # bytes de miniaturas decodificadas en el LRU
+PRESUPUESTO_DISCO  = 64 * 1024 * 1024    # bytes de miniaturas en CACHE_DIR (ver podar)
+HILOS_IMAGENES     = 2                   # hilos propios: las miniaturas no compiten con las consultas
+
+Clave = Tuple[int, str]   # (id_imagen, creado_en como texto)
+
+
+def imagenes_de_productos(ids_producto: Iterable[int]) -> Dict[int, Tuple[int, object]]:
+    """{id_producto: (id_imagen, creado_en)} de la primera imagen de cada producto, en una consulta."""
+    ids = sorted({int(i) for i in ids_producto})
+    if not ids:
+        return {}
+    marcas = ",".join("?" * len(ids))
+    cnx = db.conectar()
+    try:
+        with cnx.cursor() as cur:
+            cur.execute(f"""
+                SELECT id_producto, id_imagen, creado_en
+                FROM (SELECT id_producto, id_imagen, creado_en,
+                             ROW_NUMBER() OVER (PARTITION BY id_producto ORDER BY id_imagen) AS rn
+                      FROM dbo.producto_imagenes
+                      WHERE id_producto IN ({marcas})) x
+                WHERE rn = 1;
+            """, ids)
+            return {int(r[0]): (int(r[1]), r[2]) for r in cur.fetchall()}
+    finally:
+        cnx.close()
+
+
+def _leer_blob(id_imagen: int, destino) -> Tuple[int, object]:
+    """
+    Copia la imagen al archivo `destino` por bloques. Devuelve (bytes leídos, creado_en).
+    Todas las lecturas van en una transacción SNAPSHOT (sección 22 del script): los bloques y
+    creado_en son de la misma versión de la fila aunque otra sesión la reemplace mientras tanto.
+    """
+    cnx = db.conectar()
+    try:
+        with cnx.cursor() as cur:
+            cur.execute("SET TRANSACTION ISOLATION LEVEL SNAPSHOT;")
+            try:
+                cur.execute("SELECT DATALENGTH(imagen), creado_en FROM dbo.producto_imagenes WHERE id_imagen=?;",
+                            (int(id_imagen),))
+                r = cur.fetchone()
+                if not r:
+                    raise ValueError(f"La imagen {id_imagen} no existe.")
+                total, creado_en, pos = int(r[0] or 0), r[1], 1
+                while pos <= total:
+                    cur.execute("SELECT SUBSTRING(imagen, ?, ?) FROM dbo.producto_imagenes WHERE id_imagen=?;",
+                                (pos, BLOQUE_BLOB, int(id_imagen)))
+                    destino.write(bytes(cur.fetchone()[0]))
+                    pos += BLOQUE_BLOB
+                cnx.commit()
+            finally:
+                cur.execute("SET TRANSACTION ISOLATION LEVEL READ COMMITTED;")   # la conexión vuelve al pool
+            return total, creado_en
+    except:
+        cnx.rollback()
+        raise
+    finally:
+        cnx.close()
+
+
+class ServicioImagenes:
+    def __init__(self, widget, dir_cache: str = CACHE_DIR, tam: Tuple[int, int] = TAM_MINIATURA,
+                 presupuesto: int = PRESUPUESTO_MEMORIA, presupuesto_disco: int = PRESUPUESTO_DISCO):
+        self._bg = db_async.EjecutorBD(widget, HILOS_IMAGENES)
+        self.dir_cache = dir_cache
+        self.tam = tam
+        self.presupuesto = presupuesto
+        self.presupuesto_disco = presupuesto_disco
+        self._lru: "OrderedDict[Clave, Tuple[ImageTk.PhotoImage, int]]" = OrderedDict()
+        self._bytes = 0
+        self._esperando: Dict[Clave, List[Callable]] = {}   # pedidos en curso -> callbacks
+        self._lock = threading.Lock()
+        self.stats = {"lru_aciertos": 0, "disco_aciertos": 0, "generadas": 0, "expulsadas": 0, "errores": 0,
+                      "podadas": 0}
+        os.makedirs(dir_cache, exist_ok=True)
+        self._bg.enviar(self.podar, tipo="imagen")
+
+    @staticmethod
+    def clave(id_imagen: int, creado_en) -> Clave:
+        txt = creado_en.strftime("%Y%m%d%H%M%S%f") if hasattr(creado_en, "strftime") else str(creado_en)
+        return (int(id_imagen), txt)
+
+    def _ruta(self, clave: Clave) -> str:
+        return os.path.join(self.dir_cache, f"{clave[0]}_{clave[1]}_{self.tam[0]}x{self.tam[1]}.png")
+
+    # --- hilo de fondo ---
+    def podar(self) -> int:
+        """Borra las miniaturas usadas hace más tiempo hasta quedar dentro de presupuesto_disco."""
+        archivos = []
+        for e in os.scandir(self.dir_cache):
+            if e.is_file() and e.name.endswith(".png"):
+                st = e.stat()
+                archivos.append((st.st_mtime, st.st_size, e.path))
+        total, borradas = sum(a[1] for a in archivos), 0
+        for _, tam, ruta in sorted(archivos):
+            if total <= self.presupuesto_disco:
+                break
+            try:
+                os.remove(ruta)
+            except OSError:
+                continue
+            total -= tam
+            borradas += 1
+        with self._lock:
+            self.stats["podadas"] += borradas
+        return borradas
+
+    def _borrar_versiones(self, clave: Clave):
+        """Borra las miniaturas de la misma imagen con otro creado_en (la imagen se reemplazó)."""
+        prefijo, sufijo, actual = f"{clave[0]}_", f"_{self.tam[0]}x{self.tam[1]}.png", os.path.basename(self._ruta(clave))
+        for nombre in os.listdir(self.dir_cache):
+            if nombre.startswith(prefijo) and nombre.endswith(sufijo) and nombre != actual:
+                try:
+                    os.remove(os.path.join(self.dir_cache, nombre))
+                except OSError:
+                    pass
+
+    def miniatura(self, clave: Clave) -> Image.Image:
+        """Miniatura como PIL.Image (desde disco o generándola). Se llama fuera del hilo de Tk."""
+        ruta = self._ruta(clave)
+        if os.path.exists(ruta):
+            with self._lock:
+                self.stats["disco_aciertos"] += 1
+            os.utime(ruta)   # podar() borra primero las menos usadas
+            img = Image.open(ruta)
+            img.load()
+            return img
+        with tempfile.TemporaryFile() as tmp:
+            _, creado_en = _leer_blob(clave[0], tmp)
+            if self.clave(clave[0], creado_en) != clave:
+                # la imagen se reemplazó después de listarla: no se guarda con una clave que no es la suya
+                raise ValueError(f"La imagen {clave[0]} cambió; vuelva a cargar la lista.")
+            tmp.seek(0)
+            img = Image.open(tmp)
+            img.draft("RGB", self.tam)   # JPEG: decodifica directamente a escala reducida
+            img = img.convert("RGBA")
+            img.thumbnail(self.tam, Image.LANCZOS)
+        parcial = ruta + ".tmp"
+        img.save(parcial, "PNG")
+        os.replace(parcial, ruta)
+        self._borrar_versiones(clave)
+        with self._lock:
+            self.stats["generadas"] += 1
+        return img
+
+    # --- hilo de Tk ---
+    def obtener(self, id_imagen: int, creado_en, al_listo: Callable[[ImageTk.PhotoImage], None]):
+        """Entrega la miniatura a `al_listo` (inmediato si está en memoria, si no en segundo plano)."""
+        clave = self.clave(id_imagen, creado_en)
+        hit = self._lru.get(clave)
+        if hit is not None:
+            self._lru.move_to_end(clave)
+            self.stats["lru_aciertos"] += 1
+            al_listo(hit[0])
+            return
+        if clave in self._esperando:
+            self._esperando[clave].append(al_listo)
+            return
+        self._esperando[clave] = [al_listo]
+        self._bg.enviar(self.miniatura, clave, tipo="imagen",
+                        al_terminar=lambda img: self._llego(clave, img),
+                        al_fallar=lambda e: self._fallo(clave))
+
+    def precargar(self, imagenes: Iterable[Tuple[int, object]]):
+        """Genera/lee en segundo plano las miniaturas indicadas [(id_imagen, creado_en)]."""
+        for id_imagen, creado_en in imagenes:
+            self.obtener(id_imagen, creado_en, lambda _foto: None)
+
+    def _llego(self, clave: Clave, img: Image.Image):
+        foto = ImageTk.PhotoImage(img)
+        peso = img.width * img.height * 4
+        self._lru[clave] = (foto, peso)
+        self._bytes += peso
+        while self._bytes > self.presupuesto and len(self._lru) > 1:
+            _, (_, p) = self._lru.popitem(last=False)
+            self._bytes -= p
+            self.stats["expulsadas"] += 1
+        for cb in self._esperando.pop(clave, []):
+            cb(foto)
+
+    def _fallo(self, clave: Clave):
+        self.stats["errores"] += 1
+        self._esperando.pop(clave, None)
+
+
+_servicio: Optional[ServicioImagenes] = None
+
+def servicio(widget) -> ServicioImagenes:
+    """Servicio compartido de miniaturas (crear desde el hilo de Tk)."""
+    global _servicio
+    if _servicio is None:
+        _servicio = ServicioImagenes(widget)
+    return _servicio
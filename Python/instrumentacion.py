@@ -0,0 +1,307 @@
+# instrumentacion.py — Métricas de cada sentencia SQL y de cada llamada de negocio de db.py
+# db.conectar() entrega conexiones cuyo cursor mide execute/executemany; acá se acumula:
+# - por sentencia (huella sin literales): ejecuciones, filas, ms totales/máx. e histograma;
+# - por llamada de negocio (la función que pidió la conexión): veces, ms y sentencias por llamada;
+# - apertura de conexiones físicas, aparte del tiempo de las consultas;
+# - un registro acotado de consultas lentas.
+# Uso:
+#     instrumentacion.configurar(lenta_ms=200)
+#     instrumentacion.agregar_hook(lambda ev: print(ev["tipo"], ev["ms"], ev.get("huella")))
+#     instrumentacion.exportar("metricas_bd.json")
+
+import datetime as dt
+import json
+import re
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+INSTRUMENTAR = True     # False: db.conectar() entrega cursores sin medir
+LENTA_MS     = 500      # ms a partir de los cuales una sentencia va al registro de lentas
+LENTAS_MAX   = 200      # consultas lentas que se conservan (las más viejas se descartan)
+TEXTO_MAX    = 400      # caracteres de la sentencia guardados en el registro de lentas
+
+# Límites superiores (ms) de los tramos del histograma; el último tramo es "más de 5000".
+HISTO_LIMITES_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+_RE_COMENTARIO = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_RE_CADENA     = re.compile(r"N?'(?:[^']|'')*'")
+_RE_NUMERO     = re.compile(r"(?<![\w@#])-?\d+(?:\.\d+)?\b")
+_RE_LISTA      = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_RE_ESPACIOS   = re.compile(r"\s+")
+
+
+def huella(sql: str) -> str:
+    """
+    Texto normalizado de la sentencia: sin comentarios, literales reemplazados por ? y listas
+    IN (?, ?, ...) colapsadas, para agrupar ejecuciones de la misma consulta.
+    """
+    s = _RE_COMENTARIO.sub(" ", sql)
+    s = _RE_CADENA.sub("?", s)
+    s = _RE_NUMERO.sub("?", s)
+    s = _RE_ESPACIOS.sub(" ", s).strip()
+    return _RE_LISTA.sub("(?...)", s)
+
+
+def _tramo(ms: float) -> int:
+    for i, lim in enumerate(HISTO_LIMITES_MS):
+        if ms <= lim:
+            return i
+    return len(HISTO_LIMITES_MS)
+
+
+class _Acumulado:
+    __slots__ = ("n", "ms", "max_ms", "filas", "histo", "errores")
+
+    def __init__(self):
+        self.n, self.ms, self.max_ms, self.filas, self.errores = 0, 0.0, 0.0, 0, 0
+        self.histo = [0] * (len(HISTO_LIMITES_MS) + 1)
+
+    def sumar(self, ms: float, filas: int = 0, error: bool = False):
+        self.n += 1
+        self.ms += ms
+        self.filas += max(filas, 0)
+        self.errores += int(error)
+        if ms > self.max_ms:
+            self.max_ms = ms
+        self.histo[_tramo(ms)] += 1
+
+    def percentil(self, p: float) -> Optional[float]:
+        """Cota superior (límite del tramo) del percentil p; None si cae en el último tramo."""
+        objetivo, acum = self.n * p / 100, 0
+        for i, c in enumerate(self.histo):
+            acum += c
+            if acum >= objetivo and c:
+                return float(HISTO_LIMITES_MS[i]) if i < len(HISTO_LIMITES_MS) else None
+        return None
+
+    def dict(self) -> Dict[str, Any]:
+        return {"n": self.n, "ms_total": round(self.ms, 2), "ms_prom": round(self.ms / self.n, 3) if self.n else 0.0,
+                "ms_max": round(self.max_ms, 2), "p50_ms": self.percentil(50), "p95_ms": self.percentil(95),
+                "p99_ms": self.percentil(99), "filas": self.filas, "errores": self.errores,
+                "histograma": dict(zip([f"<={l}" for l in HISTO_LIMITES_MS] + [f">{HISTO_LIMITES_MS[-1]}"], self.histo))}
+
+
+class Instrumentacion:
+    """Acumuladores compartidos por todos los hilos (un lock corto por evento)."""
+
+    def __init__(self, lenta_ms: float = LENTA_MS, lentas_max: int = LENTAS_MAX):
+        self.lenta_ms = lenta_ms
+        self._lock = threading.Lock()
+        self._sentencias: Dict[str, _Acumulado] = {}
+        self._llamadas_de: Dict[str, set] = {}        # huella -> llamadas de negocio que la usan
+        self._llamadas: Dict[str, _Acumulado] = {}
+        self._sent_por_llamada: Dict[str, _Acumulado] = {}   # "filas" = sentencias de cada llamada
+        self._leidas: Dict[str, int] = {}             # huella -> filas traídas con fetch*
+        self._conexiones = _Acumulado()
+        self._lentas: deque = deque(maxlen=lentas_max)
+        self._hooks: List[Callable[[Dict[str, Any]], None]] = []
+        self._desde = dt.datetime.now()
+
+    # --- registro (lo llama db.py) ---
+    def sentencia(self, sql: str, ms: float, filas: int, llamada: str, error: Optional[BaseException] = None) -> str:
+        """Registra una ejecución; `filas` son las afectadas (rowcount). Devuelve la huella."""
+        h = huella(sql)
+        with self._lock:
+            a = self._sentencias.get(h)
+            if a is None:
+                a = self._sentencias[h] = _Acumulado()
+                self._llamadas_de[h] = set()
+            a.sumar(ms, filas, error is not None)
+            self._llamadas_de[h].add(llamada)
+            if ms >= self.lenta_ms:
+                self._lentas.append({"fecha": dt.datetime.now().isoformat(timespec="milliseconds"),
+                                     "ms": round(ms, 2), "llamada": llamada, "filas": filas,
+                                     "huella": h, "sql": sql.strip()[:TEXTO_MAX],
+                                     "error": str(error) if error is not None else None})
+        self._avisar({"tipo": "sentencia", "huella": h, "ms": ms, "filas": filas, "llamada": llamada,
+                      "lenta": ms >= self.lenta_ms, "error": error})
+        return h
+
+    def leidas(self, h: str, filas: int):
+        with self._lock:
+            self._leidas[h] = self._leidas.get(h, 0) + filas
+
+    def llamada(self, nombre: str, ms: float, sentencias: int):
+        with self._lock:
+            self._llamadas.setdefault(nombre, _Acumulado()).sumar(ms)
+            self._sent_por_llamada.setdefault(nombre, _Acumulado()).sumar(0.0, sentencias)
+        self._avisar({"tipo": "llamada", "llamada": nombre, "ms": ms, "sentencias": sentencias})
+
+    def conexion(self, ms: float, error: Optional[BaseException] = None):
+        with self._lock:
+            self._conexiones.sumar(ms, 0, error is not None)
+        self._avisar({"tipo": "conexion", "ms": ms, "error": error})
+
+    # --- hooks ---
+    def agregar_hook(self, fn: Callable[[Dict[str, Any]], None]):
+        """fn(evento) por cada sentencia, llamada y conexión. Corre en el hilo que hizo la consulta."""
+        with self._lock:
+            self._hooks = self._hooks + [fn]
+
+    def quitar_hook(self, fn: Callable[[Dict[str, Any]], None]):
+        with self._lock:
+            self._hooks = [h for h in self._hooks if h is not fn]
+
+    def _avisar(self, evento: Dict[str, Any]):
+        for fn in self._hooks:
+            try:
+                fn(evento)
+            except Exception:
+                pass   # un hook roto no puede tirar una venta
+
+    # --- lectura ---
+    def snapshot(self) -> Dict[str, Any]:
+        """Copia de todas las métricas (serializable a JSON)."""
+        with self._lock:
+            sentencias = [dict(a.dict(), huella=h, leidas=self._leidas.get(h, 0), llamadas=sorted(self._llamadas_de[h]))
+                          for h, a in self._sentencias.items()]
+            llamadas = []
+            for nombre, a in self._llamadas.items():
+                s = self._sent_por_llamada[nombre]
+                llamadas.append(dict(a.dict(), llamada=nombre, sentencias=s.filas,
+                                     sentencias_prom=round(s.filas / s.n, 2) if s.n else 0.0))
+            return {
+                "desde": self._desde.isoformat(timespec="seconds"),
+                "hasta": dt.datetime.now().isoformat(timespec="seconds"),
+                "lenta_ms": self.lenta_ms,
+                "conexiones": self._conexiones.dict(),
+                "llamadas": sorted(llamadas, key=lambda d: -d["ms_total"]),
+                "sentencias": sorted(sentencias, key=lambda d: -d["ms_total"]),
+                "lentas": list(self._lentas),
+            }
+
+    def reiniciar(self):
+        """Pone los acumuladores en cero (conserva configuración y hooks)."""
+        with self._lock:
+            self._sentencias, self._llamadas_de, self._leidas = {}, {}, {}
+            self._llamadas, self._sent_por_llamada = {}, {}
+            self._conexiones = _Acumulado()
+            self._lentas.clear()
+            self._desde = dt.datetime.now()
+
+    def limitar_lentas(self, lentas_max: int):
+        with self._lock:
+            self._lentas = deque(self._lentas, maxlen=int(lentas_max))
+
+
+_inst = Instrumentacion()
+
+def configurar(activa: Optional[bool] = None, lenta_ms: Optional[float] = None, lentas_max: Optional[int] = None):
+    """Cambia la configuración en caliente."""
+    global INSTRUMENTAR
+    if activa is not None:
+        INSTRUMENTAR = bool(activa)
+    if lenta_ms is not None:
+        _inst.lenta_ms = float(lenta_ms)
+    if lentas_max is not None:
+        _inst.limitar_lentas(lentas_max)
+
+def instrumentacion() -> Instrumentacion:
+    return _inst
+
+def agregar_hook(fn: Callable[[Dict[str, Any]], None]):
+    _inst.agregar_hook(fn)
+
+def quitar_hook(fn: Callable[[Dict[str, Any]], None]):
+    _inst.quitar_hook(fn)
+
+def snapshot() -> Dict[str, Any]:
+    return _inst.snapshot()
+
+def reiniciar():
+    _inst.reiniciar()
+
+def exportar(ruta: str) -> Dict[str, Any]:
+    """Escribe el snapshot en JSON y lo devuelve."""
+    snap = _inst.snapshot()
+    with open(ruta, "w", encoding="utf-8") as f:
+        json.dump(snap, f, ensure_ascii=False, indent=2, default=str)
+    return snap
+
+def quien_llama(profundidad: int = 2) -> str:
+    """
+    Nombre de la función que pidió la conexión ('compra_crear', 'catalogo.cargar', ...).
+    El cuerpo reintentable `_x_tx` de una operación (ver db.con_reintentos) se informa como `x`.
+    """
+    f = sys._getframe(profundidad)
+    mod = f.f_globals.get("__name__", "")
+    nombre = f.f_code.co_name
+    if nombre.startswith("_") and nombre.endswith("_tx"):
+        nombre = nombre[1:-3]
+    return nombre if mod == "db" else f"{mod}.{nombre}"
+
+
+# ===================== Envolturas =====================
+
+class CursorMedido:
+    """Cursor que mide execute/executemany. Todo lo demás pasa directo al cursor real."""
+    __slots__ = ("_cur", "_llamada", "_cuenta", "_huella")
+
+    def __init__(self, cur, llamada: str, cuenta: List[int]):
+        object.__setattr__(self, "_cur", cur)
+        object.__setattr__(self, "_llamada", llamada)
+        object.__setattr__(self, "_cuenta", cuenta)   # sentencias de la llamada (compartido por sus cursores)
+        object.__setattr__(self, "_huella", None)
+
+    def __getattr__(self, nombre):
+        return getattr(self._cur, nombre)
+
+    def __setattr__(self, nombre, valor):
+        setattr(self._cur, nombre, valor)   # p. ej. fast_executemany
+
+    def __iter__(self):
+        return iter(self._cur)
+
+    # el protocolo with es propio: los cursores de sqlite3 no lo tienen
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        salir = getattr(type(self._cur), "__exit__", None)
+        try:
+            return salir(self._cur, *exc) if salir is not None else False   # pyodbc: commit al salir sin error
+        finally:
+            self._cur.close()
+
+    def _medir(self, metodo, sql: str, args, filas_def: Optional[int]):
+        self._cuenta[0] += 1
+        t0 = time.perf_counter()
+        try:
+            metodo(sql, *args)
+        except Exception as e:
+            _inst.sentencia(sql, (time.perf_counter() - t0) * 1000, 0, self._llamada, e)
+            raise
+        ms = (time.perf_counter() - t0) * 1000
+        filas = getattr(self._cur, "rowcount", -1)
+        h = _inst.sentencia(sql, ms, filas if filas is not None and filas >= 0 else (filas_def or 0), self._llamada)
+        object.__setattr__(self, "_huella", h)
+        return self
+
+    def _contar(self, filas: int):
+        if self._huella is not None and filas:
+            _inst.leidas(self._huella, filas)
+
+    def execute(self, sql: str, *params):
+        return self._medir(self._cur.execute, sql, params, None)
+
+    def executemany(self, sql: str, seq):
+        seq = seq if isinstance(seq, (list, tuple)) else list(seq)
+        return self._medir(self._cur.executemany, sql, (seq,), len(seq))
+
+    def fetchone(self):
+        r = self._cur.fetchone()
+        self._contar(r is not None)
+        return r
+
+    def fetchmany(self, n: int = 1):
+        filas = self._cur.fetchmany(n)
+        self._contar(len(filas))
+        return filas
+
+    def fetchall(self):
+        filas = self._cur.fetchall()
+        self._contar(len(filas))
+        return filas
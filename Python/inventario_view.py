@@ -0,0 +1,211 @@
+# inventario_view.py — Pestaña Inventario (listado de productos)
+# Carga por páginas keyset a medida que se hace scroll; en memoria solo una ventana de páginas.
+# Si Pillow está instalado muestra la miniatura de cada producto (ver imagenes.py).
+
+import ttkbootstrap as tb
+from ttkbootstrap.dialogs import Messagebox
+from ttkbootstrap.constants import PRIMARY, SECONDARY
+
+import db
+import db_async
+from errors_es import err_es
+
+try:
+    import imagenes
+except ImportError:   # sin Pillow: inventario sin miniaturas
+    imagenes = None
+
+PAGINAS_EN_VISTA = 4      # páginas que se mantienen en la grilla a la vez
+BORDE_SCROLL     = 0.15   # fracción cerca de un extremo que dispara la carga de otra página
+
+_COLUMNAS = (("codigo", "Código", 120, "w"), ("desc", "Descripción", 420, "w"),
+             ("precio", "Precio", 100, "e"), ("stock", "Stock", 80, "e"),
+             ("min", "Mín.", 70, "e"), ("receta", "Receta", 70, "center"))
+
+
+class InventarioFrame(tb.Frame):
+    def __init__(self, parent, tam_pagina: int = db.PAGINA_PRODUCTOS):
+        super().__init__(parent, padding=8)
+        self.tam_pagina = tam_pagina
+        self.var_buscar = tb.StringVar(value="")
+
+        # Ventana de páginas visibles: cada una es (clave_inicio, filas, clave_fin).
+        # clave_inicio es la clave keyset con la que se pidió (None = primera página); filas son
+        # solo las que se agregaron a la grilla (una fila que ya estaba, p. ej. porque cambió su
+        # descripción mientras tanto, no se repite) y clave_fin la de la última fila recibida.
+        self._paginas = []
+        self._antes = []          # claves de inicio de páginas descartadas por arriba
+        self._fin = False         # no hay más páginas hacia abajo
+        self._buscar_actual = ""
+        self._after_buscar = None
+        self._pendiente = False   # hay una página pedida que todavía no llegó
+        self._fotos = {}          # iid -> PhotoImage mostrado (Tk no guarda la referencia)
+        self._img = imagenes.servicio(self) if imagenes else None
+
+        self._build_ui()
+        self.recargar()
+
+    def _build_ui(self):
+        bar = tb.Frame(self)
+        bar.pack(fill="x", pady=(0, 8))
+        tb.Label(bar, text="Buscar:").pack(side="left")
+        ent = tb.Entry(bar, textvariable=self.var_buscar, width=40)
+        ent.pack(side="left", padx=6)
+        ent.bind("<KeyRelease>", self._on_tecla)
+        tb.Button(bar, text="Actualizar", bootstyle=PRIMARY, command=self.recargar).pack(side="left")
+        self.lbl_estado = tb.Label(bar, text="", bootstyle=SECONDARY)
+        self.lbl_estado.pack(side="right")
+
+        grid = tb.Frame(self)
+        grid.pack(fill="both", expand=True)
+        if self._img:
+            alto = imagenes.TAM_MINIATURA[1] + 4
+            tb.Style().configure("Inventario.Treeview", rowheight=alto)
+            self.tree = tb.Treeview(grid, columns=[c[0] for c in _COLUMNAS], show="tree headings",
+                                    style="Inventario.Treeview")
+            self.tree.column("#0", width=imagenes.TAM_MINIATURA[0] + 12, stretch=False)
+        else:
+            self.tree = tb.Treeview(grid, columns=[c[0] for c in _COLUMNAS], show="headings")
+        for col, titulo, ancho, anchor in _COLUMNAS:
+            self.tree.heading(col, text=titulo)
+            self.tree.column(col, width=ancho, anchor=anchor, stretch=(col == "desc"))
+        self.tree.tag_configure("bajo", foreground="#c0392b")
+
+        self.scroll = tb.Scrollbar(grid, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self._on_scroll)
+        self.tree.pack(side="left", fill="both", expand=True)
+        self.scroll.pack(side="right", fill="y")
+
+    # --- carga por páginas (en segundo plano, ver db_async) ---
+    def recargar(self):
+        self._buscar_actual = self.var_buscar.get().strip()
+        self._paginas, self._antes, self._fin = [], [], False
+        self._quitar(self.tree.get_children())
+        self.lbl_estado.config(text="Cargando…")
+        self._cargar_abajo()
+
+    def _pedir(self, despues, al_llegar):
+        # misma clave para todas las páginas: un pedido nuevo (p. ej. otra búsqueda) descarta al anterior
+        self._pendiente = True
+
+        def llego(filas):
+            self._pendiente = False
+            al_llegar(filas)
+
+        def error(e):
+            self._pendiente = False
+            Messagebox.show_error(f"No se pudo cargar el inventario.\n\n{err_es(e)}", "Inventario", parent=self)
+
+        db_async.enviar(db.productos_pagina, self._buscar_actual, despues, self.tam_pagina,
+                        tipo="listar", clave=f"inventario-{id(self)}", al_terminar=llego, al_fallar=error)
+
+    @staticmethod
+    def _clave(fila):
+        return (fila[2], int(fila[0]))
+
+    def _cargar_abajo(self):
+        if self._fin:
+            return
+        despues = self._paginas[-1][2] if self._paginas else None
+        self._pedir(despues, lambda filas: self._llego_abajo(despues, filas))
+
+    def _llego_abajo(self, despues, filas):
+        if len(filas) < self.tam_pagina:
+            self._fin = True
+        if not filas:
+            self._estado()
+            return
+        nuevas = self._nuevas(filas)
+        self._paginas.append((despues, nuevas, self._clave(filas[-1])))
+        for f in nuevas:
+            self._insertar("end", f)
+        self._miniaturas(nuevas)
+        if len(self._paginas) > PAGINAS_EN_VISTA:
+            inicio, viejas, _ = self._paginas.pop(0)
+            self._antes.append(inicio)
+            self._quitar([str(f[0]) for f in viejas])
+        self._estado()
+
+    def _cargar_arriba(self):
+        if not self._antes:
+            return
+        inicio = self._antes[-1]
+        self._pedir(inicio, lambda filas: self._llego_arriba(inicio, filas))
+
+    def _llego_arriba(self, inicio, filas):
+        # se saca aunque la página llegue vacía (se borraron esos productos): si no, se pediría
+        # la misma clave en cada scroll
+        if self._antes and self._antes[-1] == inicio:
+            self._antes.pop()
+        nuevas = self._nuevas(filas)
+        if not nuevas:
+            self._estado()
+            return
+        self._paginas.insert(0, (inicio, nuevas, self._clave(filas[-1])))
+        for i, f in enumerate(nuevas):
+            self._insertar(i, f)
+        self._miniaturas(nuevas)
+        if len(self._paginas) > PAGINAS_EN_VISTA:
+            _, ultimas, _ = self._paginas.pop()
+            self._fin = False
+            self._quitar([str(f[0]) for f in ultimas])
+        # mantiene a la vista la fila que estaba arriba antes de insertar
+        hijos = self.tree.get_children()
+        if len(hijos) > len(nuevas):
+            self.tree.see(hijos[len(nuevas)])
+        self._estado()
+
+    def _nuevas(self, filas):
+        """Filas que todavía no están en la grilla (el iid es el IdProducto y no puede repetirse)."""
+        return [f for f in filas if not self.tree.exists(str(f[0]))]
+
+    def _insertar(self, pos, f):
+        idp, codigo, desc, precio, stock, stockmin, receta = f
+        tags = ("bajo",) if int(stock) <= int(stockmin) else ()
+        self.tree.insert("", pos, iid=str(idp),
+                         values=(codigo, desc, f"{float(precio):,.0f}", int(stock), int(stockmin),
+                                 "Sí" if receta else ""), tags=tags)
+
+    def _quitar(self, iids):
+        for iid in iids:
+            self._fotos.pop(iid, None)
+        self.tree.delete(*iids)
+
+    # --- miniaturas (en segundo plano; una consulta por página para saber qué imagen tiene cada producto) ---
+    def _miniaturas(self, filas):
+        if not self._img:
+            return
+        ids = [int(f[0]) for f in filas]
+        db_async.enviar(imagenes.imagenes_de_productos, ids, tipo="imagen", al_terminar=self._poner_miniaturas)
+
+    def _poner_miniaturas(self, por_producto):
+        for idp, (id_imagen, creado_en) in por_producto.items():
+            iid = str(idp)
+            if self.tree.exists(iid):
+                self._img.obtener(id_imagen, creado_en, lambda foto, iid=iid: self._poner_foto(iid, foto))
+
+    def _poner_foto(self, iid, foto):
+        if self.tree.exists(iid):   # la fila pudo salir de la ventana mientras se generaba
+            self._fotos[iid] = foto
+            self.tree.item(iid, image=foto)
+
+    def _estado(self):
+        n = sum(len(f) for _, f, _ in self._paginas)
+        extra = "" if self._fin else " (más al bajar)"
+        self.lbl_estado.config(text=f"{n} productos en vista{extra}")
+
+    # --- eventos ---
+    def _on_scroll(self, primero, ultimo):
+        self.scroll.set(primero, ultimo)
+        if self._pendiente:
+            return
+        primero, ultimo = float(primero), float(ultimo)
+        if ultimo >= 1 - BORDE_SCROLL and not self._fin:
+            self._cargar_abajo()
+        elif primero <= BORDE_SCROLL and self._antes:
+            self._cargar_arriba()
+
+    def _on_tecla(self, _evt=None):
+        if self._after_buscar is not None:
+            self.after_cancel(self._after_buscar)
+        self._after_buscar = self.after(300, self.recargar)
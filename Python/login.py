@@ -1,5 +1,9 @@
 # -*- coding: utf-8 -*-
 # Login moderno con ttkbootstrap (tema, logo) + errores en español
+# Arranque rápido: pyodbc, PIL y la ventana principal se cargan recién cuando hacen falta;
+# mientras se escribe el usuario, un hilo importa db y abre la primera conexión.
+
+import arranque   # primero: inicia el reloj de arranque
 
 import os
 import sys
@@ -8,10 +12,11 @@ import traceback
 import ttkbootstrap as tb
 from ttkbootstrap.dialogs import Messagebox
 from ttkbootstrap.constants import SUCCESS, DANGER
-from PIL import Image, ImageTk
 
-import db
-from main_app_db import MainApp
+import db_async
+from errors_es import err_es
+
+arranque.marcar("imports_login")
 
 APP_THEME = "flatly"  # "cosmo", "darkly", etc.
 LOGO_PATH = os.path.join("assets", "logo.png")  # coloca tu logo aquí
@@ -32,12 +37,15 @@ class LoginApp(tb.Window):
         self.var_show = tb.BooleanVar(value=False)
 
         self._build_ui()
+        arranque.marcar("ventana_login")
 
-        try:
-            base = db.ping()
-            print(f"Conectado a: {base}")
-        except Exception as e:
-            Messagebox.show_error(f"No se pudo conectar a la BD.\n\n{e}", "BD", parent=self)
+        # la BD se prepara en segundo plano: la ventana responde mientras tanto
+        db_async.iniciar(self)
+        db_async.enviar(_calentar, tipo="ping",
+                        al_terminar=lambda base: print(f"Conectado a: {base}"),
+                        al_fallar=lambda e: Messagebox.show_error(
+                            f"No se pudo conectar a la BD.\n\n{err_es(e)}", "BD", parent=self))
+        self.after_idle(arranque.listo)
 
     def _center(self, w, h):
         sw, sh = self.winfo_screenwidth(), self.winfo_screenheight()
@@ -53,6 +61,7 @@ class LoginApp(tb.Window):
 
         if os.path.exists(LOGO_PATH):
             try:
+                from PIL import Image, ImageTk
                 img = Image.open(LOGO_PATH).resize((48, 48), Image.LANCZOS)
                 self._logo_imgtk = ImageTk.PhotoImage(img)
                 tb.Label(header, image=self._logo_imgtk).pack(side="left", padx=(0, 8))
@@ -81,7 +90,8 @@ class LoginApp(tb.Window):
         bar = tb.Frame(frm)
         bar.pack(fill="x", pady=10)
 
-        tb.Button(bar, text="Ingresar", bootstyle=SUCCESS, command=self._login).pack(side="left")
+        self.btn_login = tb.Button(bar, text="Ingresar", bootstyle=SUCCESS, command=self._login)
+        self.btn_login.pack(side="left")
         tb.Button(bar, text="Cancelar / Salir", bootstyle=DANGER, command=self.destroy).pack(side="left", padx=8)
 
         self.bind("<Return>", lambda e: self._login())
@@ -92,23 +102,39 @@ class LoginApp(tb.Window):
         if not u or not p:
             Messagebox.show_warning("Por favor complete usuario y contraseña.", "Campos vacíos", parent=self)
             return
-        try:
-            ok, rol, uid = db.validar_usuario(u, p)
+        if str(self.btn_login["state"]) == "disabled":
+            return   # ya hay una validación en curso
+        self.btn_login.config(state="disabled", text="Validando…")
+
+        def listo(res):
+            self._login_fin()
+            ok, rol, uid = res
             if not ok:
                 Messagebox.show_error("Usuario o contraseña incorrectos.", "Acceso denegado", parent=self)
                 return
+            self._abrir_main(u, rol, uid)
 
-            try:
-                self.withdraw()
-                main = MainApp(self, usuario=u, rol=rol, usuario_id=uid)
-                main.protocol("WM_DELETE_WINDOW", main.destroy)
-                main.wait_window()
-            except Exception as e:
-                Messagebox.show_error(f"No se pudo abrir el menú principal.\n\n{e}", "App", parent=self)
-            finally:
-                self.deiconify()
+        def error(e):
+            self._login_fin()
+            Messagebox.show_error(f"No se pudo validar contra la BD.\n\n{err_es(e)}", "BD", parent=self)
+
+        import db   # ya importado por _calentar salvo que el usuario haya sido más rápido
+        db_async.enviar(db.validar_usuario, u, p, tipo="login", al_terminar=listo, al_fallar=error)
+
+    def _login_fin(self):
+        self.btn_login.config(state="normal", text="Ingresar")
+
+    def _abrir_main(self, u, rol, uid):
+        try:
+            self.withdraw()
+            from main_app_db import MainApp
+            main = MainApp(self, usuario=u, rol=rol, usuario_id=uid)
+            main.protocol("WM_DELETE_WINDOW", main.destroy)
+            main.wait_window()
         except Exception as e:
-            Messagebox.show_error(f"No se pudo validar contra la BD.\n\n{e}", "BD", parent=self)
+            Messagebox.show_error(f"No se pudo abrir el menú principal.\n\n{e}", "App", parent=self)
+        finally:
+            self.deiconify()
 
     def _tk_error_es(self, exc, val, tbk):
         try:
@@ -118,6 +144,23 @@ class LoginApp(tb.Window):
             print(val, file=sys.stderr)
 
 
+def _calentar() -> str:
+    """
+    Hilo de fondo: importa db (pyodbc) y la ventana principal y abre la primera conexión del
+    pool, así el login y el menú no pagan ese costo. Devuelve el nombre de la base.
+    """
+    import db
+    arranque.marcar("import_db")
+    base = db.ping()
+    arranque.marcar("bd_conectada")
+    try:
+        import main_app_db  # noqa: F401  (solo para dejarlo cargado)
+        arranque.marcar("import_main")
+    except Exception:
+        pass   # el error se muestra al abrir la ventana principal
+    return base
+
+
 if __name__ == "__main__":
     app = LoginApp()
     app.mainloop()
@@ -1,18 +1,32 @@
 # main_app_db.py — Ventana principal con Notebook
-# Integra Inventario, Compras y Ventas
+# Integra Inventario, Compras y Ventas. Cada pestaña (y su módulo) se construye la primera
+# vez que se la selecciona.
+
+import importlib
+import time
 
 import ttkbootstrap as tb
 from ttkbootstrap.dialogs import Messagebox
-from ttkbootstrap.constants import PRIMARY, INFO, WARNING
+from ttkbootstrap.constants import PRIMARY, INFO, WARNING, DANGER
 
+import arranque
+import catalogo
 import db
-from inventario_view import InventarioFrame
-from compras_view import ComprasFrame
-from ventas_view import VentasFrame
+import db_async
+import diario
+from errors_es import err_es
+
+# (texto, atributo, módulo, clase, recibe usuario_id)
+_PESTANAS = (
+    ("Inventario", "tab_inv", "inventario_view", "InventarioFrame", False),
+    ("Compras",    "tab_com", "compras_view",    "ComprasFrame",    True),
+    ("Ventas",     "tab_ven", "ventas_view",     "VentasFrame",     True),
+)
 
 
 class MainApp(tb.Toplevel):
     def __init__(self, parent=None, usuario: str = "", rol: str = "", usuario_id: int | None = None):
+        t0 = time.perf_counter()
         super().__init__(parent)
         self.title("Farmacia 3 Hermanas – Sistema de Gestión")
         self.geometry("1200x720")
@@ -21,8 +35,15 @@ class MainApp(tb.Toplevel):
         self.usuario = usuario
         self.rol = rol
         self.usuario_id = usuario_id
+        self._after_diario = None
 
         self._build_ui()
+        diario.iniciar()
+        catalogo.iniciar()   # carga y deltas en su hilo; la venta busca en memoria
+        self._refrescar_diario()
+        self.after_idle(lambda: (arranque.duracion("menu_principal", (time.perf_counter() - t0) * 1000),
+                                 arranque.listo("menu_principal")))
+        self.after_idle(self._on_tab)   # primera pestaña, después del primer dibujado
 
     def _build_ui(self):
         top = tb.Frame(self, padding=10)
@@ -36,32 +57,88 @@ class MainApp(tb.Toplevel):
         tb.Button(top, text="Cerrar", bootstyle=WARNING, command=self.destroy)\
             .pack(side="right")
 
-        nb = tb.Notebook(self)
-        nb.pack(fill="both", expand=True, padx=10, pady=10)
+        self.nb = tb.Notebook(self)
+        self.nb.pack(fill="both", expand=True, padx=10, pady=10)
 
-        self.tab_inv  = InventarioFrame(nb)
-        self.tab_com  = ComprasFrame(nb, usuario_id=self.usuario_id)
-        self.tab_ven  = VentasFrame(nb, usuario_id=self.usuario_id)
-
-        nb.add(self.tab_inv, text="Inventario")
-        nb.add(self.tab_com, text="Compras")
-        nb.add(self.tab_ven, text="Ventas")
+        # contenedores vacíos; el contenido se arma en _on_tab (la primera se arma tras dibujar)
+        self._contenedores = {}
+        for texto, attr, *_ in _PESTANAS:
+            setattr(self, attr, None)
+            cont = tb.Frame(self.nb)
+            self.nb.add(cont, text=texto)
+            self._contenedores[str(cont)] = cont
+        self.nb.bind("<<NotebookTabChanged>>", self._on_tab)
 
         status = tb.Frame(self)
         status.pack(fill="x", side="bottom")
         tb.Label(status, text="© Farmacia 3 Hermanas").pack(side="left", padx=8, pady=4)
-
-    def _probe_db(self):
+        self.lbl_alertas = tb.Label(status, text="", bootstyle=WARNING)
+        self.lbl_alertas.pack(side="right", padx=8, pady=4)
+        self.lbl_diario = tb.Label(status, text="", bootstyle=INFO)
+        self.lbl_diario.pack(side="right", padx=8, pady=4)
+
+        # barrido diario de vencimientos + resumen para la barra de estado (en segundo plano)
+        db_async.enviar(db.alertas_barrido, tipo="consulta", al_terminar=self._mostrar_alertas,
+                        al_fallar=lambda e: self._mostrar_alertas(None))
+
+    def destroy(self):
+        # el refresco periódico no debe sobrevivir a la ventana (tras "Cerrar" vuelve el login)
+        if self._after_diario is not None:
+            self.after_cancel(self._after_diario)
+            self._after_diario = None
+        super().destroy()
+
+    def _mostrar_alertas(self, r):
+        if not self.winfo_exists():   # el barrido terminó después de cerrar la ventana
+            return
+        if not r or not (r["proximos"] or r["vencidos"]):
+            self.lbl_alertas.config(text="")
+            return
+        self.lbl_alertas.config(
+            text=f"Vencimientos: {r['proximos']} lotes próximos, {r['vencidos']} vencidos con stock "
+                 f"({r['unidades_vencidas']} u.)")
+
+    def _on_tab(self, _evt=None):
+        cont = self._contenedores.get(self.nb.select())
+        if cont is None or cont.winfo_children():
+            return
+        texto, attr, modulo, clase, con_usuario = _PESTANAS[self.nb.index(cont)]
+        t0 = time.perf_counter()
         try:
-            base = db.ping()
-            Messagebox.show_info(f"Conectado a: {base}", "BD", parent=self)
+            cls = getattr(importlib.import_module(modulo), clase)
+            tab = cls(cont, usuario_id=self.usuario_id) if con_usuario else cls(cont)
         except Exception as e:
-            Messagebox.show_error(f"No se pudo conectar a la BD.\n\n{e}", "BD", parent=self)
+            tb.Label(cont, text=f"No se pudo abrir {texto}.\n\n{err_es(e)}", bootstyle=DANGER,
+                     justify="center").pack(expand=True)
+            return
+        tab.pack(fill="both", expand=True)
+        setattr(self, attr, tab)
+        arranque.duracion(f"pestana_{modulo}", (time.perf_counter() - t0) * 1000)
+
+    def _refrescar_diario(self):
+        # estado() solo lee el SQLite local: se puede consultar desde la UI
+        e = diario.estado()
+        partes = []
+        if e["pendientes"]:
+            partes.append(f"Sin enviar: {e['pendientes']} (atraso {e['atraso_seg']:.0f} s)")
+        if e["conectado"] is False:
+            partes.append("servidor sin conexión")
+        if e["conflictos"]:
+            partes.append(f"{e['conflictos']} en conflicto")
+        self.lbl_diario.config(text=" · ".join(partes))
+        self._after_diario = self.after(3000, self._refrescar_diario)
+
+    def _probe_db(self):
+        db_async.enviar(db.ping, tipo="ping", clave="probe_db",
+                        al_terminar=lambda base: Messagebox.show_info(f"Conectado a: {base}", "BD", parent=self),
+                        al_fallar=lambda e: Messagebox.show_error(
+                            f"No se pudo conectar a la BD.\n\n{err_es(e)}", "BD", parent=self))
 
 
 # Prueba directa
 if __name__ == "__main__":
     root = tb.Window(themename="flatly")
     root.withdraw()
+    db_async.iniciar(root)
     MainApp(root, usuario="admin", rol="Administrador", usuario_id=1).wait_window()
     root.destroy()
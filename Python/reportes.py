@@ -0,0 +1,121 @@
+# reportes.py — Reportes de ventas sobre los acumulados VentasDiaProducto / VentasDiaUsuario
+# Requiere: pip install numpy
+# Cada consulta trae una porción de los acumulados en columnas (arrays NumPy) y los totales,
+# márgenes y comparaciones se calculan vectorizados, sin recorrer el detalle de ventas.
+
+import datetime as dt
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import db
+
+_LOTE = 10000   # filas por fetchmany
+
+
+def _fetch_columnas(sql: str, params: Tuple, nombres: List[str], tipos: List) -> Dict[str, np.ndarray]:
+    """Ejecuta una consulta y devuelve {columna: array} construidos por bloques."""
+    cols: List[List] = [[] for _ in nombres]
+    cnx = db.conectar()
+    try:
+        with cnx.cursor() as cur:
+            cur.execute(sql, params)
+            while True:
+                filas = cur.fetchmany(_LOTE)
+                if not filas:
+                    break
+                for i, col in enumerate(zip(*filas)):
+                    cols[i].extend(col)
+    finally:
+        cnx.close()
+    return {n: np.array(c, dtype=t) for n, c, t in zip(nombres, cols, tipos)}
+
+
+def acumulados(desde: dt.date, hasta: dt.date, usuario_id: Optional[int] = None) -> Dict[str, np.ndarray]:
+    """
+    Porción [desde, hasta] de VentasDiaProducto en columnas:
+    fecha (datetime64[D]), producto, usuario, cantidad, importe, costo, tickets.
+    """
+    sql = """
+        SELECT Fecha, IdProducto, UsuarioId, Cantidad, Importe, Costo, Tickets
+        FROM dbo.VentasDiaProducto
+        WHERE Fecha BETWEEN ? AND ?
+    """
+    params: Tuple = (desde, hasta)
+    if usuario_id is not None:
+        sql += " AND UsuarioId = ?"
+        params += (int(usuario_id),)
+    return _fetch_columnas(sql, params,
+                           ["fecha", "producto", "usuario", "cantidad", "importe", "costo", "tickets"],
+                           ["datetime64[D]", np.int32, np.int32, np.int64, np.float64, np.float64, np.int64])
+
+
+def agrupar(datos: Dict[str, np.ndarray], por: str = "producto") -> Dict[str, np.ndarray]:
+    """
+    Suma cantidad/importe/costo por 'dia', 'producto' o 'usuario' y calcula margen y margen_pct.
+    """
+    clave = {"dia": "fecha", "producto": "producto", "usuario": "usuario"}[por]
+    claves, idx = np.unique(datos[clave], return_inverse=True)
+    res = {por: claves}
+    for col in ("cantidad", "importe", "costo"):
+        res[col] = np.bincount(idx, weights=datos[col], minlength=len(claves))
+    res["margen"] = res["importe"] - res["costo"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        res["margen_pct"] = np.where(res["importe"] > 0, res["margen"] / res["importe"] * 100, 0.0)
+    return res
+
+
+def totales(desde: dt.date, hasta: dt.date, usuario_id: Optional[int] = None) -> Dict[str, float]:
+    """Totales del período: unidades, importe, costo, margen, margen_pct y tickets."""
+    d = acumulados(desde, hasta, usuario_id)
+    importe, costo = float(d["importe"].sum()), float(d["costo"].sum())
+    return {
+        "unidades": int(d["cantidad"].sum()),
+        "importe": importe,
+        "costo": costo,
+        "margen": importe - costo,
+        "margen_pct": (importe - costo) / importe * 100 if importe else 0.0,
+        "tickets": tickets(desde, hasta, usuario_id),
+    }
+
+
+def tickets(desde: dt.date, hasta: dt.date, usuario_id: Optional[int] = None) -> int:
+    sql = "SELECT ISNULL(SUM(Tickets), 0) FROM dbo.VentasDiaUsuario WHERE Fecha BETWEEN ? AND ?"
+    params: Tuple = (desde, hasta)
+    if usuario_id is not None:
+        sql += " AND UsuarioId = ?"
+        params += (int(usuario_id),)
+    return int(_fetch_columnas(sql, params, ["t"], [np.int64])["t"][0])
+
+
+def top(desde: dt.date, hasta: dt.date, n: int = 20, por: str = "producto", orden: str = "importe") -> Dict[str, np.ndarray]:
+    """Los n primeros de la agrupación `por`, ordenados por 'importe', 'margen' o 'cantidad'."""
+    g = agrupar(acumulados(desde, hasta), por)
+    sel = np.argsort(-g[orden], kind="stable")[:n]
+    return {k: v[sel] for k, v in g.items()}
+
+
+def comparar(a: Tuple[dt.date, dt.date], b: Tuple[dt.date, dt.date], por: str = "producto") -> Dict[str, np.ndarray]:
+    """
+    Compara dos períodos (p. ej. este mes contra el anterior) alineados por `por`.
+    Devuelve la clave y, para importe/cantidad/margen, los valores de cada período y la variación %.
+    """
+    ga, gb = agrupar(acumulados(*a), por), agrupar(acumulados(*b), por)
+    claves = np.union1d(ga[por], gb[por])
+    res = {por: claves}
+    for col in ("importe", "cantidad", "margen"):
+        va = np.zeros(len(claves))
+        vb = np.zeros(len(claves))
+        va[np.searchsorted(claves, ga[por])] = ga[col]
+        vb[np.searchsorted(claves, gb[por])] = gb[col]
+        res[f"{col}_a"], res[f"{col}_b"] = va, vb
+        with np.errstate(divide="ignore", invalid="ignore"):
+            res[f"{col}_var_pct"] = np.where(vb != 0, (va - vb) / np.abs(vb) * 100, np.nan)
+    return res
+
+
+def mes(anio: int, mes_: int) -> Tuple[dt.date, dt.date]:
+    """(primer día, último día) del mes."""
+    ini = dt.date(anio, mes_, 1)
+    sig = dt.date(anio + (mes_ == 12), mes_ % 12 + 1, 1)
+    return ini, sig - dt.timedelta(days=1)
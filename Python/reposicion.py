@@ -0,0 +1,229 @@
+# reposicion.py — Sugerencias de reposición por velocidad de venta, StockMin y vencimientos
+# Requiere: pip install numpy
+# La historia diaria por producto (acumulado VentasDiaProducto) se guarda como matriz
+# productos x días en reposicion_cache.npz; en cada corrida solo se releen los días cuya huella
+# (filas, unidades, checksum) cambió. Velocidad, días de cobertura, pérdida por vencimiento y
+# cantidad a pedir se calculan vectorizados sobre todo el catálogo.
+# Uso: python reposicion.py
+
+import datetime as dt
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import db
+import reportes
+
+HISTORIA_DIAS  = 91      # días de ventas guardados en la caché
+VENTANA_LARGA  = 28      # días de la media móvil principal
+VENTANA_CORTA  = 7       # media corta: si la venta se acelera, manda esta
+DEMORA_DIAS    = 3       # días desde que se hace el pedido hasta que llega
+COBERTURA_DIAS = 14      # días de venta que debe cubrir cada pedido
+CACHE_RUTA     = "reposicion_cache.npz"
+
+# Huella por día: si no cambió desde la última corrida, ese día no se vuelve a leer.
+_SQL_HUELLAS = """
+SELECT Fecha, COUNT(*), SUM(CAST(Cantidad AS BIGINT)), CHECKSUM_AGG(CHECKSUM(IdProducto, UsuarioId, Cantidad))
+FROM dbo.VentasDiaProducto
+WHERE Fecha BETWEEN ? AND ?
+GROUP BY Fecha
+"""
+
+_SQL_DIAS = """
+SELECT Fecha, IdProducto, SUM(Cantidad)
+FROM dbo.VentasDiaProducto
+WHERE Fecha IN (SELECT CAST(value AS DATE) FROM OPENJSON(?))
+GROUP BY Fecha, IdProducto
+"""
+
+# Lotes que vencen antes de que llegue a venderse lo pedido, en orden FEFO.
+_SQL_LOTES = """
+SELECT IdProducto, DATEDIFF(DAY, ?, Vence), StockLote
+FROM dbo.Lotes
+WHERE StockLote > 0 AND Vence <= DATEADD(DAY, ?, ?)
+ORDER BY IdProducto, Vence, IdLote
+"""
+
+_SQL_ULTIMA_COMPRA = """
+SELECT IdProducto, IdProveedor, PrecioUnit
+FROM (
+    SELECT d.IdProducto, c.IdProveedor, d.PrecioUnit,
+           ROW_NUMBER() OVER (PARTITION BY d.IdProducto ORDER BY c.Fecha DESC, c.IdCompra DESC) AS rn
+    FROM dbo.CompraDetalle d
+    JOIN dbo.Compras c ON c.IdCompra = d.IdCompra
+    WHERE d.IdProducto IN (SELECT CAST(value AS INT) FROM OPENJSON(?))
+) x
+WHERE rn = 1
+"""
+
+
+# ===================== Historia de ventas (caché) =====================
+
+def _cache_vacia(inicio: np.datetime64) -> Dict[str, np.ndarray]:
+    return {"productos": np.zeros(0, np.int32), "inicio": np.array(inicio, dtype="datetime64[D]"),
+            "cant": np.zeros((0, HISTORIA_DIAS), np.int32), "huellas": np.full((HISTORIA_DIAS, 3), -1, np.int64)}
+
+
+def _cache_leer(ruta: str) -> Optional[Dict[str, np.ndarray]]:
+    try:
+        with np.load(ruta) as z:
+            c = {k: z[k] for k in z.files}
+    except (OSError, ValueError):
+        return None
+    if set(c) != {"productos", "inicio", "cant", "huellas"} or c["cant"].shape[1] != HISTORIA_DIAS:
+        return None   # otra versión o parámetros distintos: se arma de nuevo
+    return c
+
+
+def _cache_guardar(c: Dict[str, np.ndarray], ruta: str):
+    tmp = ruta + ".tmp"
+    try:
+        with open(tmp, "wb") as f:
+            np.savez(f, **c)
+        os.replace(tmp, ruta)
+    except OSError:
+        pass   # sin caché la próxima corrida relee todo, no es un error
+
+
+def _alinear(c: Optional[Dict[str, np.ndarray]], inicio: np.datetime64) -> Dict[str, np.ndarray]:
+    """Corre la ventana de la caché para que empiece en `inicio` (los días nuevos quedan sin huella)."""
+    if c is None:
+        return _cache_vacia(inicio)
+    corr = int((inicio - c["inicio"]) // np.timedelta64(1, "D"))
+    if corr < 0 or corr >= HISTORIA_DIAS:
+        return _cache_vacia(inicio)
+    cant = np.zeros_like(c["cant"])
+    cant[:, :HISTORIA_DIAS - corr] = c["cant"][:, corr:]
+    huellas = np.full((HISTORIA_DIAS, 3), -1, np.int64)
+    huellas[:HISTORIA_DIAS - corr] = c["huellas"][corr:]
+    return {"productos": c["productos"], "inicio": np.array(inicio, dtype="datetime64[D]"),
+            "cant": cant, "huellas": huellas}
+
+
+def historia(hoy: Optional[dt.date] = None, ruta: str = CACHE_RUTA) -> Tuple[Dict[str, np.ndarray], int]:
+    """
+    Unidades vendidas por producto y día en los últimos HISTORIA_DIAS (el último es `hoy`).
+    Devuelve ({'productos', 'inicio', 'cant' [productos x días], 'huellas'}, días releídos).
+    """
+    hoy_d = np.datetime64(hoy or dt.date.today(), "D")
+    inicio = hoy_d - (HISTORIA_DIAS - 1)
+    c = _alinear(_cache_leer(ruta), inicio)
+
+    h = reportes._fetch_columnas(_SQL_HUELLAS, (inicio.item(), hoy_d.item()), ["fecha", "filas", "cant", "chk"],
+                                 ["datetime64[D]", np.int64, np.int64, np.int64])
+    actual = np.zeros((HISTORIA_DIAS, 3), np.int64)   # día sin ventas = (0, 0, 0)
+    actual[(h["fecha"] - inicio).astype(np.int64)] = np.column_stack([h["filas"], h["cant"], h["chk"]])
+    cambiados = np.flatnonzero((actual != c["huellas"]).any(axis=1))
+    if not len(cambiados):
+        return c, 0
+
+    fechas = [str(inicio + int(i)) for i in cambiados]
+    d = reportes._fetch_columnas(_SQL_DIAS, (json.dumps(fechas),), ["fecha", "producto", "cantidad"],
+                                 ["datetime64[D]", np.int32, np.int64])
+    productos = np.union1d(c["productos"], d["producto"]).astype(np.int32)
+    cant = np.zeros((len(productos), HISTORIA_DIAS), np.int32)
+    cant[np.searchsorted(productos, c["productos"])] = c["cant"]
+    cant[:, cambiados] = 0
+    np.add.at(cant, (np.searchsorted(productos, d["producto"]), (d["fecha"] - inicio).astype(np.int64)), d["cantidad"])
+    c.update(productos=productos, cant=cant, huellas=actual)
+    _cache_guardar(c, ruta)
+    return c, len(cambiados)
+
+
+# ===================== Sugerencias =====================
+
+def _perdida_vencimiento(catalogo: np.ndarray, vel: np.ndarray, hoy: dt.date, horizonte: int) -> np.ndarray:
+    """
+    Unidades que van a vencer sin venderse dentro del horizonte, por producto del catálogo.
+    Con venta constante y FEFO, lo que vence de los lotes 1..i es max_j(acum_j - vel * dias_j),
+    así que alcanza con un cumsum y un maximum.reduceat por producto.
+    """
+    perdida = np.zeros(len(catalogo))
+    l = reportes._fetch_columnas(_SQL_LOTES, (hoy, horizonte, hoy), ["producto", "dias", "stock"],
+                                 [np.int32, np.int64, np.int64])
+    if not len(l["producto"]):
+        return perdida
+    idx = np.searchsorted(catalogo, l["producto"])
+    grupos = np.flatnonzero(np.r_[True, l["producto"][1:] != l["producto"][:-1]])
+    acum = np.cumsum(l["stock"])
+    previo = np.repeat(acum[grupos] - l["stock"][grupos], np.diff(np.r_[grupos, len(acum)]))
+    exceso = (acum - previo) - vel[idx] * np.maximum(l["dias"], 0)
+    perdida[idx[grupos]] = np.maximum(np.maximum.reduceat(exceso, grupos), 0)
+    return perdida
+
+
+def sugerencias(hoy: Optional[dt.date] = None, demora: int = DEMORA_DIAS, cobertura: int = COBERTURA_DIAS,
+                ruta: str = CACHE_RUTA) -> Dict[str, Any]:
+    """
+    Productos a pedir, en columnas (arrays) ordenadas por días de cobertura:
+    producto, codigo, descripcion, stock, stock_min, velocidad (u/día), por_vencer, dias_cobertura,
+    pedir, proveedor (0 = nunca se compró), costo (último precio de compra).
+    Se pide cuando el stock útil (sin lo que va a vencer) no llega a cubrir la demora más StockMin,
+    y se pide hasta cubrir demora + cobertura días más StockMin.
+    """
+    hoy = hoy or dt.date.today()
+    hist, releidos = historia(hoy, ruta)
+    p = reportes._fetch_columnas("SELECT IdProducto, Codigo, Descripcion, Stock, StockMin FROM dbo.Productos ORDER BY IdProducto",
+                                 (), ["producto", "codigo", "descripcion", "stock", "stock_min"],
+                                 [np.int32, object, object, np.int64, np.int64])
+
+    # ventas del catálogo actual (los dados de baja se ignoran); hoy está incompleto y no cuenta
+    ventas = np.zeros((len(p["producto"]), HISTORIA_DIAS))
+    vigentes = np.isin(hist["productos"], p["producto"])
+    ventas[np.searchsorted(p["producto"], hist["productos"][vigentes])] = hist["cant"][vigentes]
+    larga = ventas[:, -(VENTANA_LARGA + 1):-1].sum(axis=1) / VENTANA_LARGA
+    corta = ventas[:, -(VENTANA_CORTA + 1):-1].sum(axis=1) / VENTANA_CORTA
+    vel = np.maximum(larga, corta)
+
+    por_vencer = np.minimum(_perdida_vencimiento(p["producto"], vel, hoy, demora + cobertura), p["stock"])
+    util = p["stock"] - por_vencer
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dias = np.where(vel > 0, util / vel, np.inf)
+    punto = vel * demora + p["stock_min"]
+    objetivo = vel * (demora + cobertura) + p["stock_min"]
+    pedir = np.where(util <= punto, np.ceil(objetivo - util), 0).clip(min=0).astype(np.int64)
+
+    sel = np.flatnonzero(pedir > 0)
+    sel = sel[np.argsort(dias[sel], kind="stable")]
+    res: Dict[str, Any] = {k: v[sel] for k, v in p.items()}
+    res.update(velocidad=vel[sel], por_vencer=por_vencer[sel], dias_cobertura=dias[sel], pedir=pedir[sel])
+
+    res["proveedor"] = np.zeros(len(sel), np.int32)
+    res["costo"] = np.zeros(len(sel))
+    if len(sel):
+        u = reportes._fetch_columnas(_SQL_ULTIMA_COMPRA, (json.dumps(res["producto"].tolist()),),
+                                     ["producto", "proveedor", "costo"], [np.int32, np.int32, np.float64])
+        orden = np.argsort(res["producto"])
+        pos = orden[np.searchsorted(res["producto"], u["producto"], sorter=orden)]
+        res["proveedor"][pos] = u["proveedor"]
+        res["costo"][pos] = u["costo"]
+    res["dias_releidos"] = releidos
+    return res
+
+
+def por_proveedor(s: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Agrupa las sugerencias por el último proveedor de cada producto (mayor importe primero)."""
+    nombres = dict(db.proveedores_listar())
+    grupos = []
+    for prov in np.unique(s["proveedor"]):
+        i = np.flatnonzero(s["proveedor"] == prov)
+        items = [{"codigo": s["codigo"][k], "descripcion": s["descripcion"][k], "stock": int(s["stock"][k]),
+                  "velocidad": round(float(s["velocidad"][k]), 2), "dias_cobertura": float(s["dias_cobertura"][k]),
+                  "por_vencer": int(s["por_vencer"][k]), "pedir": int(s["pedir"][k]), "costo": float(s["costo"][k])}
+                 for k in i]
+        grupos.append({"id_proveedor": int(prov), "proveedor": nombres.get(int(prov), "Sin compras previas"),
+                       "items": items, "total": float((s["pedir"][i] * s["costo"][i]).sum())})
+    grupos.sort(key=lambda g: -g["total"])
+    return grupos
+
+
+if __name__ == "__main__":
+    s = sugerencias()
+    print(f"{len(s['producto'])} productos a pedir (días de ventas releídos: {s['dias_releidos']})")
+    for g in por_proveedor(s):
+        print(f"\n{g['proveedor']}  — estimado {g['total']:,.2f}")
+        for it in g["items"]:
+            print(f"  {it['codigo']:<20} {it['descripcion'][:40]:<40} stock {it['stock']:>6}  "
+                  f"{it['velocidad']:>6.2f} u/día  cubre {it['dias_cobertura']:>5.1f} d  pedir {it['pedir']:>6}")
@@ -0,0 +1,291 @@
+# sincronizacion.py — Exportación incremental de la sucursal y su importación en casa central
+# Uso: python sincronizacion.py exportar [carpeta]     (en la sucursal, de noche)
+#      python sincronizacion.py importar [carpeta]     (en casa central, con db.py apuntando a la réplica)
+# Cada tabla tiene RowVer (secciones 13 y 21 del script) y su marca de agua en dbo.Parametros
+# ('sync_marca_<Tabla>'): solo se leen las filas nuevas o cambiadas desde la última exportación,
+# así el tiempo y los bytes dependen del movimiento del día y no del historial.
+# Salida: archivos .jsonl.gz de hasta SYNC_FILAS_ARCHIVO filas que nunca se reescriben, más
+# manifiesto.jsonl (una línea por archivo, solo se agrega). La importación aplica cada archivo
+# con un MERGE en su propia transacción y anota el último aplicado ('sync_import_<origen>'),
+# así repetir la importación o reenviar archivos no duplica nada.
+# Todas las lecturas de una exportación van en una sola transacción SNAPSHOT (sección 22 del
+# script) y cada fila exportada arrastra a los padres que referencia: la réplica nunca recibe
+# un detalle sin su cabecera, aunque una venta toque la cabecera durante la exportación.
+# El destino es una base con el mismo esquema (una réplica por sucursal en casa central).
+
+import datetime as dt
+import decimal
+import gzip
+import hashlib
+import json
+import os
+import sys
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import db
+
+SYNC_CARPETA       = "sync_salida"
+SYNC_FILAS_ARCHIVO = 50000   # filas por archivo comprimido
+SYNC_LOTE          = 5000    # filas por fetchmany / executemany
+MANIFIESTO         = "manifiesto.jsonl"
+
+# (tabla, clave, columnas exportadas, valores para altas en destino de columnas que no viajan)
+# En orden de claves foráneas: la importación aplica los archivos en el mismo orden.
+_TABLAS: List[Tuple[str, str, Tuple[str, ...], Dict[str, str]]] = [
+    ("Clientes", "IdCliente", ("IdCliente", "Documento", "Nombre", "Telefono", "Email"), {}),
+    ("Proveedores", "IdProveedor", ("IdProveedor", "Ruc", "RazonSocial", "Telefono", "Email"), {}),
+    # la clave de los usuarios no sale de la sucursal: en la réplica quedan sin poder iniciar sesión
+    ("Usuarios", "IdUsuario", ("IdUsuario", "Usuario", "RolId", "Activo"), {"ClaveHash": "0x"}),
+    ("Productos", "IdProducto", ("IdProducto", "Codigo", "Descripcion", "Precio", "Stock", "StockMin", "RequiereReceta"), {}),
+    ("Lotes", "IdLote", ("IdLote", "IdProducto", "Lote", "Vence", "StockLote"), {}),
+    ("Compras", "IdCompra", ("IdCompra", "Fecha", "NroComprobante", "IdProveedor", "Total", "UsuarioId"), {}),
+    ("CompraDetalle", "IdDet", ("IdDet", "IdCompra", "IdProducto", "Cantidad", "PrecioUnit"), {}),
+    ("Ventas", "IdVenta", ("IdVenta", "Fecha", "NroComprobante", "IdCliente", "Total", "UsuarioId"), {}),
+    ("VentaDetalle", "IdDet", ("IdDet", "IdVenta", "IdProducto", "IdLote", "Cantidad", "PrecioUnit"), {}),
+]
+
+# claves foráneas entre las tablas exportadas: tabla hija -> [(columna, tabla padre)]
+_REFERENCIAS: Dict[str, List[Tuple[str, str]]] = {
+    "Lotes": [("IdProducto", "Productos")],
+    "Compras": [("IdProveedor", "Proveedores"), ("UsuarioId", "Usuarios")],
+    "CompraDetalle": [("IdCompra", "Compras"), ("IdProducto", "Productos")],
+    "Ventas": [("IdCliente", "Clientes"), ("UsuarioId", "Usuarios")],
+    "VentaDetalle": [("IdVenta", "Ventas"), ("IdProducto", "Productos"), ("IdLote", "Lotes")],
+}
+
+# tipo de Python (cursor.description) -> nombre en el manifiesto y conversión al importar
+_TIPOS = {int: "int", bool: "bool", str: "str", float: "float", decimal.Decimal: "decimal",
+          dt.datetime: "datetime", dt.date: "date"}
+_DESDE_JSON = {"decimal": decimal.Decimal, "datetime": dt.datetime.fromisoformat, "date": dt.date.fromisoformat}
+
+
+# ===================== Parámetros (marcas de agua) =====================
+
+def _param_leer(cur, clave: str, defecto: str = "0") -> str:
+    cur.execute("SELECT Valor FROM dbo.Parametros WITH (UPDLOCK, HOLDLOCK) WHERE Clave = ?;", (clave,))
+    r = cur.fetchone()
+    return str(r[0]) if r else defecto
+
+
+def _param_guardar(cur, clave: str, valor: str):
+    cur.execute("""
+        MERGE dbo.Parametros AS T
+        USING (SELECT ? AS Clave, ? AS Valor) AS S ON T.Clave = S.Clave
+        WHEN MATCHED THEN UPDATE SET Valor = S.Valor
+        WHEN NOT MATCHED THEN INSERT(Clave, Valor) VALUES (S.Clave, S.Valor);
+    """, (clave, valor))
+
+
+# ===================== Exportación =====================
+
+def _json(v: Any) -> Any:
+    if isinstance(v, decimal.Decimal):
+        return str(v)
+    if isinstance(v, (dt.datetime, dt.date)):
+        return v.isoformat()
+    raise TypeError(f"Tipo no exportable: {type(v).__name__}")
+
+
+def _filtro(tabla: str, alias: str = "t", nivel: int = 0) -> str:
+    """
+    Condición de exportación de `tabla`: sus filas con RowVer en [desde, hasta) y, además, las
+    filas con RowVer >= hasta que referencia alguna fila hija exportada (recursivo). Sin esto,
+    una cabecera cuyo RowVer subió durante la exportación (p. ej. el Stock de un producto recién
+    dado de alta) quedaría para la próxima corrida mientras sus lotes ya viajan en esta.
+    """
+    clave = next(t[1] for t in _TABLAS if t[0] == tabla)
+    propia = f"({alias}.RowVer >= @d_{tabla} AND {alias}.RowVer < @hasta)"
+    hijas = [(hija, col) for hija, refs in _REFERENCIAS.items() for col, padre in refs if padre == tabla]
+    if not hijas:
+        return propia
+    subs = []
+    for n, (hija, col) in enumerate(hijas):
+        a = f"h{nivel}_{n}"
+        subs.append(f"{alias}.{clave} IN (SELECT {a}.{col} FROM dbo.{hija} {a} WHERE {_filtro(hija, a, nivel + 1)})")
+    return f"({propia} OR ({alias}.RowVer >= @hasta AND ({' OR '.join(subs)})))"
+
+
+def _manifiesto(carpeta: str) -> List[Dict[str, Any]]:
+    try:
+        with open(os.path.join(carpeta, MANIFIESTO), encoding="utf-8") as f:
+            return [json.loads(l) for l in f if l.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def _escribir_archivo(carpeta: str, nombre: str, filas: List[Tuple]) -> Tuple[int, str]:
+    """Escribe filas como JSON por línea comprimido. Devuelve (bytes, sha256)."""
+    ruta = os.path.join(carpeta, nombre)
+    with gzip.open(ruta + ".tmp", "wt", encoding="utf-8", newline="\n") as f:
+        for fila in filas:
+            f.write(json.dumps(list(fila), default=_json, ensure_ascii=False) + "\n")
+    os.replace(ruta + ".tmp", ruta)
+    with open(ruta, "rb") as f:
+        return os.path.getsize(ruta), hashlib.sha256(f.read()).hexdigest()
+
+
+def _exportar_tablas(cur, carpeta: str, origen: str, desdes: Dict[str, int], seq: int, ahora: str,
+                     nuevas: List[Dict[str, Any]], res: Dict[str, int]) -> int:
+    """Lee y escribe los archivos de todas las tablas (dentro de la transacción SNAPSHOT). Devuelve hasta."""
+    cur.execute("SELECT CAST(MIN_ACTIVE_ROWVERSION() AS BIGINT);")
+    hasta = int(cur.fetchone()[0])
+    variables = ", ".join(["@hasta BINARY(8) = CAST(? AS BINARY(8))"]
+                          + [f"@d_{t[0]} BINARY(8) = CAST(? AS BINARY(8))" for t in _TABLAS])
+    params = (hasta, *(desdes[t[0]] for t in _TABLAS))
+    for tabla, clave, columnas, _ in _TABLAS:
+        cur.execute(f"""
+            SET NOCOUNT ON;
+            DECLARE {variables};
+            SELECT {", ".join(f"t.{c}" for c in columnas)} FROM dbo.{tabla} t
+            WHERE {_filtro(tabla)};
+        """, params)
+        tipos = [_TIPOS.get(d[1], "str") for d in cur.description]
+        res[tabla] = 0
+        archivo: List[Tuple] = []
+        while True:
+            filas = cur.fetchmany(SYNC_LOTE)
+            if filas:
+                archivo.extend(tuple(f) for f in filas)
+            if archivo and (not filas or len(archivo) >= SYNC_FILAS_ARCHIVO):
+                seq += 1
+                nombre = f"{seq:08d}_{tabla}.jsonl.gz"
+                tam, sha = _escribir_archivo(carpeta, nombre, archivo)
+                nuevas.append({"seq": seq, "archivo": nombre, "origen": origen, "tabla": tabla,
+                               "clave": clave, "columnas": list(columnas), "tipos": tipos,
+                               "filas": len(archivo), "bytes": tam, "sha256": sha,
+                               "desde": desdes[tabla], "hasta": hasta, "creado": ahora})
+                res[tabla] += len(archivo)
+                archivo = []
+            if not filas:
+                break
+    return hasta
+
+
+def exportar(carpeta: str = SYNC_CARPETA, origen: Optional[str] = None) -> Dict[str, int]:
+    """
+    Exporta las filas cambiadas desde la última corrida. Devuelve filas exportadas por tabla.
+    El límite superior es MIN_ACTIVE_ROWVERSION(): lo que esté en una transacción abierta
+    queda para la próxima corrida, nunca se saltea. Todas las tablas se leen en una misma
+    transacción SNAPSHOT, así los padres que arrastra _filtro son la versión que ven sus
+    hijas. Las marcas se guardan recién después de escribir archivos y manifiesto; si algo
+    falla antes, la próxima corrida repite esas filas (la importación es un MERGE, así que
+    repetir no duplica).
+    """
+    origen = origen or db.DATABASE
+    os.makedirs(carpeta, exist_ok=True)
+    previos = _manifiesto(carpeta)
+    seq = max((m["seq"] for m in previos), default=0)
+    ahora = dt.datetime.now().isoformat(timespec="seconds")
+    nuevas: List[Dict[str, Any]] = []
+    res: Dict[str, int] = {}
+
+    cnx = db.conectar()
+    try:
+        with cnx.cursor() as cur:
+            desdes = {t[0]: int(_param_leer(cur, f"sync_marca_{t[0]}")) for t in _TABLAS}
+            cnx.commit()   # no retener el bloqueo de Parametros mientras se leen las tablas
+            cur.execute("SET TRANSACTION ISOLATION LEVEL SNAPSHOT;")
+            try:
+                hasta = _exportar_tablas(cur, carpeta, origen, desdes, seq, ahora, nuevas, res)
+                cnx.commit()
+            finally:
+                cur.execute("SET TRANSACTION ISOLATION LEVEL READ COMMITTED;")   # la conexión vuelve al pool
+        marcas = {t[0]: hasta for t in _TABLAS}
+
+        with open(os.path.join(carpeta, MANIFIESTO), "a", encoding="utf-8", newline="\n") as f:
+            for m in nuevas:
+                f.write(json.dumps(m, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+        with cnx.cursor() as cur:
+            for tabla, marca in marcas.items():
+                _param_guardar(cur, f"sync_marca_{tabla}", str(marca))
+            cnx.commit()
+        return res
+    except:
+        cnx.rollback()
+        raise
+    finally:
+        cnx.close()
+
+
+# ===================== Importación =====================
+
+def _leer_archivo(carpeta: str, m: Dict[str, Any]) -> Iterator[Tuple]:
+    ruta = os.path.join(carpeta, m["archivo"])
+    with open(ruta, "rb") as f:
+        if hashlib.sha256(f.read()).hexdigest() != m["sha256"]:
+            raise ValueError(f"El archivo {m['archivo']} no coincide con el manifiesto (dañado o incompleto).")
+    conv = [_DESDE_JSON.get(t) for t in m["tipos"]]
+    with gzip.open(ruta, "rt", encoding="utf-8") as f:
+        for linea in f:
+            fila = json.loads(linea)
+            yield tuple(c(v) if c is not None and v is not None else v for c, v in zip(conv, fila))
+
+
+def _importar_tx(carpeta: str, m: Dict[str, Any]) -> bool:
+    """Aplica un archivo del manifiesto en una transacción. False si ya estaba aplicado."""
+    tabla, clave, columnas = m["tabla"], m["clave"], m["columnas"]
+    extras = next(t[3] for t in _TABLAS if t[0] == tabla)
+    cols = ", ".join(columnas)
+    otras = [c for c in columnas if c != clave]
+    cnx = db.conectar()
+    try:
+        with cnx.cursor() as cur:
+            if int(_param_leer(cur, f"sync_import_{m['origen']}")) >= m["seq"]:
+                cnx.commit()
+                return False
+            # CAST: así la columna temporal no hereda el IDENTITY de la clave
+            cur.execute(f"""
+                DROP TABLE IF EXISTS #sync;
+                SELECT TOP (0) CAST({clave} AS INT) AS {clave}, {", ".join(otras)} INTO #sync FROM dbo.{tabla};
+            """)
+            cur.fast_executemany = True
+            marcas = ", ".join("?" * len(columnas))
+            for bloque in db.en_bloques(_leer_archivo(carpeta, m), SYNC_LOTE):
+                cur.executemany(f"INSERT INTO #sync({cols}) VALUES ({marcas});", bloque)
+            cur.execute(f"""
+                SET IDENTITY_INSERT dbo.{tabla} ON;
+                MERGE dbo.{tabla} AS T
+                USING #sync AS S ON T.{clave} = S.{clave}
+                WHEN MATCHED THEN UPDATE SET {", ".join(f"T.{c} = S.{c}" for c in otras)}
+                WHEN NOT MATCHED THEN INSERT({", ".join((*columnas, *extras))})
+                    VALUES ({", ".join((*(f"S.{c}" for c in columnas), *extras.values()))});
+                SET IDENTITY_INSERT dbo.{tabla} OFF;
+                DROP TABLE #sync;
+            """)
+            _param_guardar(cur, f"sync_import_{m['origen']}", str(m["seq"]))
+            cnx.commit()
+            return True
+    except:
+        cnx.rollback()
+        raise
+    finally:
+        cnx.close()
+
+
+def importar(carpeta: str = SYNC_CARPETA) -> Dict[str, int]:
+    """
+    Aplica en orden los archivos del manifiesto que todavía no se aplicaron (por origen).
+    Devuelve {'archivos', 'omitidos', 'filas'}. Un archivo dañado corta la importación antes
+    de tocar la base; los siguientes se aplican en la próxima corrida.
+    """
+    res = {"archivos": 0, "omitidos": 0, "filas": 0}
+    for m in sorted(_manifiesto(carpeta), key=lambda m: (m["origen"], m["seq"])):
+        if db.con_reintentos("sync_importar", lambda: _importar_tx(carpeta, m)):
+            res["archivos"] += 1
+            res["filas"] += m["filas"]
+        else:
+            res["omitidos"] += 1
+    return res
+
+
+if __name__ == "__main__":
+    modo = sys.argv[1] if len(sys.argv) > 1 else "exportar"
+    carpeta = sys.argv[2] if len(sys.argv) > 2 else SYNC_CARPETA
+    if modo == "importar":
+        print(importar(carpeta))
+    else:
+        r = exportar(carpeta)
+        print(f"{sum(r.values())} filas exportadas: " + ", ".join(f"{t} {n}" for t, n in r.items() if n))
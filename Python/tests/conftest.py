@@ -0,0 +1,20 @@
+# Pruebas: python -m pytest -q (desde Python/)
+# Las que necesitan SQL Server corren solo con FARMACIA_TEST_SQLSERVER=1 y db.py apuntando a una BD
+# de pruebas (¡graban datos!). El resto usa sustitutos en memoria.
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def sqlserver():
+    """Módulo db contra un SQL Server de pruebas (se saltea si no está configurado)."""
+    if not os.environ.get("FARMACIA_TEST_SQLSERVER"):
+        pytest.skip("sin SQL Server de pruebas (FARMACIA_TEST_SQLSERVER=1)")
+    pytest.importorskip("pyodbc")
+    import db
+    return db
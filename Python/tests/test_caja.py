@@ -0,0 +1,48 @@
+import threading
+import time
+import uuid
+
+import pytest
+
+
+def test_sqlserver_venta_durante_cierre_de_caja(sqlserver):
+    """Un cierre en curso no hace fallar la venta: espera y la graba sin movimiento de caja."""
+    db = sqlserver
+    if db.caja_abierta(1) is not None:
+        pytest.skip("el usuario 1 ya tiene una caja abierta")
+    prov = db.proveedores_listar()
+    if not prov:
+        pytest.skip("se necesita un proveedor")
+    codigo = "TEST-CAJA-" + uuid.uuid4().hex[:8]
+    db.compra_crear(1, prov[0][0], [{"codigo": codigo, "desc": "prueba caja", "cant": 5, "punit": 10}])
+    ida = db.caja_abrir(1, 0)
+
+    # cierre a mano, con la transacción abierta mientras corre la venta
+    cierre = db.conectar()
+    cur = cierre.cursor()
+    cur.execute("SELECT Saldo FROM dbo.CajaAperturas WITH (UPDLOCK) WHERE IdApertura=?;", (ida,))
+    cur.fetchone()
+    cur.execute("UPDATE dbo.CajaAperturas SET Estado='C', FechaCierre=SYSDATETIME() WHERE IdApertura=?;", (ida,))
+
+    res = {}
+    def vender():
+        try:
+            res["idv"] = db.venta_crear(1, None, [{"codigo": codigo, "cant": 1, "punit": 10}])
+        except Exception as e:
+            res["error"] = e
+    hilo = threading.Thread(target=vender)
+    hilo.start()
+    time.sleep(1)
+    cierre.commit()
+    cur.close()
+    cierre.close()
+    hilo.join(30)
+
+    assert "error" not in res, res.get("error")
+    cnx = db.conectar()
+    try:
+        with cnx.cursor() as c:
+            c.execute("SELECT COUNT(*) FROM dbo.CajaMov WHERE RefVenta = ?;", (res["idv"],))
+            assert c.fetchone()[0] == 0
+    finally:
+        cnx.close()
@@ -0,0 +1,210 @@
+import time
+
+import pytest
+
+pytest.importorskip("pyodbc")
+
+import catalogo
+import db
+
+
+def _fila(id_, codigo, stock=10):
+    return (id_, codigo, f"Producto {codigo}", 100.0, stock, 1, False)
+
+
+class _BD:
+    """Productos de mentira para cargar/refrescar y producto_get_por_codigo."""
+
+    def __init__(self, filas=()):
+        self.filas = {f[1]: f for f in filas}
+        self.caida = False
+        self.consultas = 0          # producto_get_por_codigo
+        self.sincronizaciones = 0   # cargas y deltas
+        self.demora = 0.0
+
+    def _verificar(self):
+        time.sleep(self.demora)
+        if self.caida:
+            raise db.pyodbc.OperationalError("08001", "no se pudo conectar")
+
+    def conectar(self):
+        self.sincronizaciones += 1
+        self._verificar()
+        return _Conexion(self)
+
+    def producto_get_por_codigo(self, codigo):
+        self.consultas += 1
+        self._verificar()
+        return self.filas.get(codigo)
+
+
+class _Conexion:
+    def __init__(self, bd):
+        self.bd = bd
+
+    def cursor(self):
+        return _Cursor(self.bd)
+
+    def close(self):
+        pass
+
+
+class _Cursor:
+    def __init__(self, bd):
+        self.bd = bd
+        self._sets = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=()):
+        self._sets = [[(len(self.bd.filas),)], list(self.bd.filas.values())]
+
+    def fetchone(self):
+        return self._sets[0][0]
+
+    def nextset(self):
+        self._sets.pop(0)
+        return True
+
+    def fetchmany(self, n):
+        filas, self._sets[0] = self._sets[0][:n], self._sets[0][n:]
+        return filas
+
+    def fetchall(self):
+        filas, self._sets[0] = self._sets[0], []
+        return filas
+
+
+@pytest.fixture
+def bd(monkeypatch):
+    b = _BD([_fila(1, "A1"), _fila(2, "B2")])
+    monkeypatch.setattr(db, "conectar", b.conectar)
+    monkeypatch.setattr(db, "producto_get_por_codigo", b.producto_get_por_codigo)
+    return b
+
+
+def _esperar(cond, seg=2.0):
+    fin = time.monotonic() + seg
+    while not cond() and time.monotonic() < fin:
+        time.sleep(0.01)
+    assert cond()
+
+
+def test_get_no_refresca_aunque_la_copia_este_vieja(bd):
+    cat = catalogo.CatalogoProductos(max_edad=0.01)
+    cat.cargar()
+    time.sleep(0.05)
+    bd.caida, bd.demora = True, 5.0          # una consulta a la BD bloquearía 5 s
+    t0 = time.monotonic()
+    assert cat.get("A1")[1] == "A1"
+    assert [r[1] for r in cat.todos()] == ["A1", "B2"]
+    assert time.monotonic() - t0 < 0.5
+    assert bd.sincronizaciones == 1 and bd.consultas == 0
+
+
+def test_codigo_inexistente_se_recuerda(bd):
+    cat = catalogo.CatalogoProductos(ausente=0.1)
+    cat.cargar()
+    assert cat.get("ZZ") is None and cat.get("ZZ") is None
+    assert bd.consultas == 1 and cat.stats()["ausentes"] == 1
+    time.sleep(0.15)
+    assert cat.get("ZZ") is None
+    assert bd.consultas == 2
+
+
+def test_codigo_nuevo_se_trae_una_vez(bd):
+    cat = catalogo.CatalogoProductos()
+    cat.cargar()
+    bd.filas["C3"] = _fila(3, "C3")
+    assert cat.get("C3")[0] == 3 and cat.get("C3")[0] == 3
+    assert bd.consultas == 1
+
+
+def test_alta_por_delta_borra_la_marca_de_ausente(bd):
+    cat = catalogo.CatalogoProductos()
+    cat.cargar()
+    assert cat.get("C3") is None
+    bd.filas["C3"] = _fila(3, "C3")
+    cat.refrescar()
+    assert cat.get("C3")[0] == 3
+
+
+def test_bd_caida_sirve_la_copia_y_espacia_las_consultas(bd):
+    cat = catalogo.CatalogoProductos(max_edad=2)
+    cat.cargar()
+    bd.caida = True
+    assert cat.get("X1") is None             # falla: empieza la espera
+    assert cat.get("X2") is None and cat.get("X3") is None
+    assert bd.consultas == 1
+    st = cat.stats()
+    assert st["errores"] == 1 and st["sin_bd"] == 2 and st["espera_seg"] == 1.0
+    assert cat.get("B2")[1] == "B2"
+
+
+def test_sin_copia_y_bd_caida_informa_el_error(bd):
+    cat = catalogo.CatalogoProductos()
+    bd.caida = True
+    with pytest.raises(db.pyodbc.OperationalError):
+        cat.get("A1")
+    with pytest.raises(db.pyodbc.OperationalError):
+        cat.get("A1")                        # durante la espera: sin volver a la BD
+    assert bd.consultas == 1
+
+
+def test_hilo_carga_refresca_y_espera_el_doble_tras_errores(bd):
+    cat = catalogo.CatalogoProductos(espera_max=0.08)
+    cat.iniciar_auto(intervalo=0.02)
+    _esperar(lambda: cat.stats()["cargas"] == 1)
+    bd.filas["C3"] = _fila(3, "C3")
+    _esperar(lambda: cat.stats()["productos"] == 3)
+
+    bd.caida = True
+    _esperar(lambda: cat.stats()["espera_seg"] == 0.08)   # 0.02 -> 0.04 -> 0.08 (tope)
+    errores = cat.stats()["errores"]
+    assert cat.get("A1")[1] == "A1"
+    bd.caida = False
+    _esperar(lambda: cat.stats()["espera_seg"] == 0.0)
+    assert cat.stats()["errores"] >= errores
+    cat.detener()
+
+
+def test_catalogo_compartido_no_bloquea(bd, monkeypatch):
+    monkeypatch.setattr(catalogo, "_catalogo", None)
+    bd.demora = 0.3
+    t0 = time.monotonic()
+    cat = catalogo.iniciar()
+    assert time.monotonic() - t0 < 0.2
+    assert catalogo.iniciar() is cat
+    _esperar(lambda: cat.stats()["cargas"] == 1)
+    assert catalogo.producto_por_codigo(" A1 ")[0] == 1
+    cat.detener()
+
+
+def test_copia_vencida_se_confirma_en_la_bd(bd):
+    cat = catalogo.CatalogoProductos(vigencia=0.05)
+    cat.cargar()
+    assert cat.precio("A1") == 100.0 and bd.consultas == 0
+    time.sleep(0.08)
+    bd.filas["A1"] = (1, "A1", "Producto A1", 120.0, 4, 1, False)
+    assert cat.precio("A1") == 120.0 and cat.stock("A1") == 4
+    assert bd.consultas == 2 and cat.stats()["vencidos"] == 2
+
+
+def test_copia_vencida_y_bd_caida_no_sirve_precios(bd):
+    cat = catalogo.CatalogoProductos(vigencia=0.05)
+    cat.cargar()
+    time.sleep(0.08)
+    bd.caida = True
+    with pytest.raises(catalogo.CatalogoDesactualizado) as e:
+        cat.precio("A1")
+    assert e.value.codigo == "A1" and e.value.edad >= 0.05
+    with pytest.raises(catalogo.CatalogoDesactualizado):
+        cat.stock("B2")                      # durante la espera: sin volver a la BD
+    assert bd.consultas == 1
+    bd.caida = False
+    cat.refrescar()
+    assert cat.precio("A1") == 100.0 and bd.consultas == 1
@@ -0,0 +1,49 @@
+import datetime as dt
+import uuid
+
+import pytest
+
+
+def test_sqlserver_recorta_lotes_en_orden_fefo(sqlserver):
+    db = sqlserver
+    import conciliacion
+    prov = db.proveedores_listar()
+    if not prov:
+        pytest.skip("se necesita un proveedor")
+    hoy = dt.date.today()
+    codigo = "TEST-CONC-" + uuid.uuid4().hex[:8]
+    db.compra_crear(1, prov[0][0], [
+        {"codigo": codigo, "desc": "prueba conciliación", "cant": 5, "punit": 10,
+         "vence": (hoy + dt.timedelta(days=30)).isoformat()},
+        {"codigo": codigo, "desc": "prueba conciliación", "cant": 5, "punit": 10,
+         "vence": (hoy + dt.timedelta(days=10)).isoformat()},
+    ])
+    pid = db.producto_get_por_codigo(codigo)[0]
+
+    def lotes():
+        cnx = db.conectar()
+        try:
+            with cnx.cursor() as cur:
+                cur.execute("SELECT Vence, StockLote FROM dbo.Lotes WHERE IdProducto = ? ORDER BY Vence;", (pid,))
+                return [int(r[1]) for r in cur.fetchall()]
+        finally:
+            cnx.close()
+
+    cnx = db.conectar()
+    try:
+        with cnx.cursor() as cur:   # desvío: el producto dice 7 y los lotes suman 10
+            cur.execute("UPDATE dbo.Productos SET Stock = 7 WHERE IdProducto = ?;", (pid,))
+    finally:
+        cnx.close()
+
+    tam = conciliacion.TRAMO_PRODUCTOS
+    rango = pid // tam
+    assert rango in conciliacion.tramos_cambiados(tam)
+
+    informe = conciliacion._revisar_tramo(rango, tam, reparar=False)
+    mio = [d for d in informe if d["id_producto"] == pid]
+    assert mio and mio[0]["exceso"] == 3 and lotes() == [5, 5]
+
+    conciliacion._revisar_tramo(rango, tam, reparar=True)
+    assert lotes() == [2, 5]                          # el exceso sale del que vence primero
+    assert rango not in conciliacion.tramos_cambiados(tam)   # sin cambios: no se vuelve a revisar
@@ -0,0 +1,137 @@
+import threading
+import time
+
+import pytest
+
+import db_async
+
+
+class _Widget:
+    """Sustituto de Tk: after() solo guarda el callback; la prueba bombea a mano."""
+
+    def __init__(self):
+        self.programado = None
+
+    def after(self, ms, fn):
+        self.programado = fn
+        return "after#1"
+
+    def after_cancel(self, ident):
+        self.programado = None
+
+    def report_callback_exception(self, tipo, e, tb):
+        raise e
+
+
+def _bombear(widget, hasta, espera=2.0):
+    fin = time.monotonic() + espera
+    while not hasta() and time.monotonic() < fin:
+        widget.programado()
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def ejecutor():
+    w = _Widget()
+    ej = db_async.EjecutorBD(w, hilos=2)
+    yield w, ej
+    ej.cerrar()
+
+
+def test_consulta_vencida_se_informa_como_timeout(ejecutor, monkeypatch):
+    w, ej = ejecutor
+    liberar = threading.Event()
+    fallas, oks = [], []
+    ej.enviar(liberar.wait, tipo="consulta", al_terminar=oks.append, al_fallar=fallas.append)
+    reloj = time.monotonic() + db_async.PRESUPUESTOS["consulta"] + 1
+    monkeypatch.setattr(db_async.time, "monotonic", lambda: reloj)
+    w.programado()
+    liberar.set()
+    assert len(fallas) == 1 and isinstance(fallas[0], TimeoutError)
+    assert ej.stats["vencidas"] == 1 and oks == []
+
+
+@pytest.mark.parametrize("tipo", ["venta", "compra"])
+def test_escritura_lenta_no_se_da_por_fallida(ejecutor, monkeypatch, tipo):
+    w, ej = ejecutor
+    liberar = threading.Event()
+    fallas, oks = [], []
+    ej.enviar(lambda: liberar.wait() and 123, tipo=tipo, al_terminar=oks.append, al_fallar=fallas.append)
+    real = time.monotonic
+    monkeypatch.setattr(db_async.time, "monotonic", lambda: real() + 3600)
+    w.programado()
+    assert fallas == [] and ej.stats["vencidas"] == 0
+    liberar.set()
+    _bombear(w, lambda: oks)
+    assert oks == [123] and fallas == []
+
+
+class _Cursor:
+    """Cursor de mentira: execute() bloquea hasta que se llame a cancel(), como una consulta lenta."""
+
+    def __init__(self):
+        self.cancelado = threading.Event()
+
+    def cancel(self):
+        self.cancelado.set()
+
+    def execute(self):
+        if not self.cancelado.wait(2.0):
+            return "terminó"
+        raise RuntimeError("HY008 Operation canceled")
+
+
+def _consulta(cur, empezo=None):
+    def fn():
+        db_async.registrar_cursor(cur)
+        if empezo is not None:
+            empezo.set()
+        return cur.execute()
+    return fn
+
+
+def test_busqueda_reemplazada_cancela_la_sentencia(ejecutor):
+    w, ej = ejecutor
+    vieja, empezo = _Cursor(), threading.Event()
+    oks, fallas = [], []
+    t1 = ej.enviar(_consulta(vieja, empezo), clave="sugerir", tipo="sugerir",
+                   al_terminar=oks.append, al_fallar=fallas.append)
+    assert empezo.wait(2.0)
+    ej.enviar(lambda: "nueva", clave="sugerir", tipo="sugerir", al_terminar=oks.append, al_fallar=fallas.append)
+    assert vieja.cancelado.wait(1.0)
+    _bombear(w, lambda: oks and t1.futuro.done())
+    assert oks == ["nueva"] and fallas == []          # la reemplazada no llama a nadie
+    assert ej.stats["reemplazadas"] == 1
+
+
+def test_cancelada_antes_de_abrir_cursor_no_ejecuta(ejecutor):
+    w, ej = ejecutor
+    empezo, liberar, cur = threading.Event(), threading.Event(), _Cursor()
+    ejecuto = []
+
+    def fn():
+        empezo.set()
+        liberar.wait(2.0)
+        db_async.registrar_cursor(cur)
+        ejecuto.append(True)
+
+    t = ej.enviar(fn, clave="k")
+    assert empezo.wait(2.0)
+    t.cancelar()
+    liberar.set()
+    with pytest.raises(db_async.TareaCancelada):
+        t.futuro.result(2.0)
+    assert ejecuto == []
+
+
+def test_tarea_terminada_no_cancela_cursores(ejecutor):
+    w, ej = ejecutor
+    cur = _Cursor()
+    t = ej.enviar(lambda: db_async.registrar_cursor(cur) or "ok")
+    t.futuro.result(2.0)
+    t.cancelar()
+    assert not cur.cancelado.is_set()
+
+
+def test_registrar_cursor_fuera_del_ejecutor_no_hace_nada():
+    db_async.registrar_cursor(_Cursor())
@@ -0,0 +1,222 @@
+import datetime as dt
+
+import pytest
+
+pyodbc = pytest.importorskip("pyodbc")
+
+import db
+import diario
+
+
+def _enlace():
+    return pyodbc.OperationalError("08S01", "[08S01] [Microsoft][ODBC Driver 18 for SQL Server]"
+                                            "Communication link failure (10054) (SQLExecDirectW)")
+
+
+class _Servidor:
+    """Reemplaza a db.venta_crear/compra_crear/stock_ajustar_faltantes; `fallas` se consume en orden."""
+
+    def __init__(self):
+        self.recibidas = []      # (tipo, clave, fecha)
+        self.ajustes = []        # (usuario, clave)
+        self.fallas = []         # excepciones a lanzar en los próximos envíos (None = éxito)
+        self.fallas_ajuste = []
+
+    def _enviar(self, tipo, clave, fecha):
+        if self.fallas:
+            e = self.fallas.pop(0)
+            if e is not None:
+                raise e
+        self.recibidas.append((tipo, clave, fecha))
+        return len(self.recibidas)
+
+    def venta(self, uid, cliente, items, clave=None, fecha=None):
+        return self._enviar("VEN", clave, fecha)
+
+    def compra(self, uid, prov, items, clave=None, fecha=None):
+        return self._enviar("COM", clave, fecha)
+
+    def ajustar(self, uid, items, clave, motivo):
+        if self.fallas_ajuste:
+            raise self.fallas_ajuste.pop(0)
+        self.ajustes.append((uid, clave))
+        return 1
+
+
+@pytest.fixture
+def srv():
+    return _Servidor()
+
+
+@pytest.fixture
+def d(tmp_path, srv):
+    return diario.Diario(str(tmp_path / "diario.sqlite"), enviar_venta=srv.venta, enviar_compra=srv.compra,
+                         ajustar_faltantes=srv.ajustar)
+
+
+_ITEMS = [{"codigo": "A1", "cant": 2, "punit": 10}]
+
+
+def _estados(d):
+    return [r[0] for r in d._cnx().execute("SELECT Estado FROM Operaciones ORDER BY Seq;")]
+
+
+def _sin_stock():
+    return db.StockInsuficiente([("A1", 1, 2)], "Código A1: disponible 1, pedido 2")
+
+
+def test_envia_en_orden_con_clave_y_fecha(d, srv):
+    claves = [d.venta(1, None, _ITEMS), d.compra(1, 7, _ITEMS), d.venta(1, None, _ITEMS)]
+    r = d.enviar_lote()
+    assert r == {"enviadas": 3, "conflictos": 0, "pendientes": 3, "caido": 0}
+    assert [(t, c) for t, c, _ in srv.recibidas] == list(zip(("VEN", "COM", "VEN"), claves))
+    assert all(isinstance(f, dt.datetime) for _, _, f in srv.recibidas)
+    assert _estados(d) == ["E", "E", "E"]
+    e = d.estado()
+    assert (e["pendientes"], e["enviadas"], e["conectado"]) == (0, 3, True)
+
+
+def test_sin_items_no_registra(d):
+    with pytest.raises(ValueError):
+        d.venta(1, None, [])
+    assert _estados(d) == []
+
+
+def test_stock_insuficiente_pasa_a_conflicto_y_sigue(d, srv):
+    d.venta(1, None, _ITEMS)
+    d.venta(1, None, _ITEMS)
+    srv.fallas = [_sin_stock()]
+    r = d.enviar_lote()
+    assert (r["enviadas"], r["conflictos"]) == (1, 1)
+    assert _estados(d) == ["C", "E"]
+    c = d.conflictos()
+    assert len(c) == 1 and c[0]["faltantes"] == [["A1", 1, 2]] and "disponible 1" in c[0]["mensaje"]
+
+
+def test_sin_conexion_corta_la_pasada_sin_contar_intento(d, srv):
+    d.venta(1, None, _ITEMS)
+    d.venta(1, None, _ITEMS)
+    srv.fallas = [_enlace()]
+    r = d.enviar_lote()
+    assert (r["enviadas"], r["caido"]) == (0, 1)
+    assert srv.recibidas == []
+    assert d._cnx().execute("SELECT MAX(Intentos) FROM Operaciones;").fetchone()[0] == 0
+    e = d.estado()
+    assert (e["pendientes"], e["conectado"], e["fallos_conexion"]) == (2, False, 1)
+    assert d.enviar_lote()["enviadas"] == 2
+
+
+def test_error_de_bd_pasa_a_conflicto_tras_intentos_max(d, srv):
+    d.venta(1, None, _ITEMS)
+    srv.fallas = [pyodbc.ProgrammingError("42S02", "Invalid object name")] * diario.INTENTOS_MAX
+    for n in range(1, diario.INTENTOS_MAX + 1):
+        assert d.enviar_lote()["caido"] == 1
+        assert _estados(d) == (["C"] if n == diario.INTENTOS_MAX else ["P"])
+    assert d.enviar_lote()["pendientes"] == 0
+
+
+class _Detener:
+    """Sustituye al Event de detención: anota las esperas y corta el ciclo a las `n`."""
+
+    def __init__(self, n):
+        self.esperas, self.n = [], n
+
+    def is_set(self):
+        return len(self.esperas) >= self.n
+
+    def wait(self, seg=None):
+        self.esperas.append(seg)
+        return self.is_set()
+
+
+def test_espera_creciente_con_tope_mientras_no_hay_conexion(d, monkeypatch):
+    monkeypatch.setattr(diario.random, "uniform", lambda a, b: 1.0)
+    monkeypatch.setattr(diario, "ESPERA_MAX", 10.0)
+    monkeypatch.setattr(d, "enviar_lote", lambda: {"caido": 1, "pendientes": 1})
+    d._detener = _Detener(5)
+    d._ciclo()
+    assert d._detener.esperas == [4.0, 8.0, 10.0, 10.0, 10.0]
+
+
+def test_espera_vuelve_al_intervalo_cuando_vuelve_la_conexion(d, monkeypatch):
+    monkeypatch.setattr(diario.random, "uniform", lambda a, b: 1.0)
+    pasadas = iter([{"caido": 1, "pendientes": 1}, {"caido": 1, "pendientes": 1},
+                    {"caido": 0, "pendientes": 0}, {"caido": 1, "pendientes": 1}])
+    monkeypatch.setattr(d, "enviar_lote", lambda: next(pasadas))
+    d._detener = _Detener(3)
+    d._despertar.wait = lambda seg=None: None
+    d._ciclo()
+    i = diario.ENVIO_INTERVALO
+    assert d._detener.esperas == [i * 2, i * 4, i * 2]
+
+
+def test_resolver_reintentar_y_descartar(d, srv):
+    d.venta(1, None, _ITEMS)
+    d.venta(1, None, _ITEMS)
+    srv.fallas = [_sin_stock(), _sin_stock()]
+    d.enviar_lote()
+    s1, s2 = (c["seq"] for c in d.conflictos())
+    d.resolver(s1, "reintentar")
+    d.resolver(s2, "descartar")
+    assert _estados(d) == ["P", "D"]
+    with pytest.raises(ValueError):
+        d.resolver(s2, "reintentar")      # ya no está en conflicto
+    with pytest.raises(ValueError):
+        d.resolver(s1, "otra")
+
+
+def test_resolver_ajustar_una_vez_por_clave(d, srv):
+    clave = d.venta(1, None, _ITEMS)
+    srv.fallas = [_sin_stock()]
+    d.enviar_lote()
+    seq = d.conflictos()[0]["seq"]
+    with pytest.raises(ValueError):
+        d.resolver(seq, "ajustar")                 # falta el encargado
+
+    srv.fallas_ajuste = [_enlace()]
+    with pytest.raises(pyodbc.Error):
+        d.resolver(seq, "ajustar", usuario_id=9)   # sin respuesta: sigue en conflicto
+    assert _estados(d) == ["C"]
+    d.resolver(seq, "ajustar", usuario_id=9)       # el reintento lleva la misma clave
+    assert _estados(d) == ["P"]
+
+    srv.fallas = [_sin_stock()]                    # otra caja se llevó el stock de nuevo
+    d.enviar_lote()
+    d.resolver(seq, "ajustar", usuario_id=9)
+    assert srv.ajustes == [(9, f"AJ0-{clave}"), (9, f"AJ1-{clave}")]
+    assert d.enviar_lote()["enviadas"] == 1
+
+
+def test_ajustar_solo_ventas_con_faltantes(d, srv):
+    d.compra(1, 7, _ITEMS)
+    srv.fallas = [ValueError("proveedor inexistente")]
+    d.enviar_lote()
+    with pytest.raises(ValueError):
+        d.resolver(d.conflictos()[0]["seq"], "ajustar", usuario_id=9)
+    assert srv.ajustes == []
+
+
+def test_purgar_borra_solo_enviadas_o_descartadas_viejas(d, srv):
+    for _ in range(4):
+        d.venta(1, None, _ITEMS)
+    srv.fallas = [None, _sin_stock()]
+    d.enviar_lote()                                # E, C, E, E
+    d.resolver(2, "descartar")
+    d._cnx().execute("UPDATE Operaciones SET Estado='P' WHERE Seq=4;")
+    viejo = (dt.datetime.now() - dt.timedelta(days=diario.CONSERVAR_DIAS + 1)).isoformat()
+    d._cnx().execute("UPDATE Operaciones SET Creado=? WHERE Seq IN (1, 2, 4);", (viejo,))
+    assert d.purgar() == 2
+    assert [r[0] for r in d._cnx().execute("SELECT Seq FROM Operaciones ORDER BY Seq;")] == [3, 4]
+
+
+def test_diario_anterior_recibe_columna_ajustes(tmp_path, srv):
+    import sqlite3
+    ruta = str(tmp_path / "viejo.sqlite")
+    esquema = diario._ESQUEMA.replace(
+        ",\n    Ajustes    INTEGER NOT NULL DEFAULT 0     -- ajustes de faltantes ya confirmados (ver resolver)", "")
+    assert "Ajustes" not in esquema
+    cnx = sqlite3.connect(ruta)
+    cnx.executescript(esquema)
+    cnx.close()
+    d = diario.Diario(ruta, enviar_venta=srv.venta)
+    assert "Ajustes" in {c[1] for c in d._cnx().execute("PRAGMA table_info(Operaciones);")}
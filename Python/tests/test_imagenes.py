@@ -0,0 +1,125 @@
+import datetime as dt
+import io
+import os
+
+import pytest
+
+PIL = pytest.importorskip("PIL.Image")
+pytest.importorskip("pyodbc")
+
+import imagenes
+
+
+class _Widget:
+    """Sin Tk: el sondeo del EjecutorBD nunca corre; las pruebas llaman a _llego/_fallo a mano."""
+
+    def after(self, ms, fn):
+        return "after#1"
+
+    def after_cancel(self, ident):
+        pass
+
+
+@pytest.fixture
+def svc(tmp_path, monkeypatch):
+    monkeypatch.setattr(imagenes.ImageTk, "PhotoImage", lambda img: ("foto", img.size))
+    s = imagenes.ServicioImagenes(_Widget(), dir_cache=str(tmp_path), tam=(10, 10), presupuesto=3 * 10 * 10 * 4)
+    s._bg._pool.shutdown(wait=True)      # deja terminar el podar() inicial
+    s.enviados = []
+    s._bg.enviar = lambda fn, *args, **kw: s.enviados.append(args)
+    yield s
+
+
+def _img(color="red", tam=(10, 10)):
+    return PIL.new("RGBA", tam, color)
+
+
+def _png(color="blue", tam=(40, 30)):
+    b = io.BytesIO()
+    PIL.new("RGB", tam, color).save(b, "PNG")
+    return b.getvalue()
+
+
+CREADO = dt.datetime(2024, 5, 1, 10, 0, 0)
+
+
+def test_lru_respeta_el_presupuesto_y_expulsa_el_menos_usado(svc):
+    for i in (1, 2, 3):
+        svc.obtener(i, CREADO, lambda f: None)
+        svc._llego(svc.clave(i, CREADO), _img())
+    recibidas = []
+    svc.obtener(1, CREADO, recibidas.append)           # 1 pasa a ser el más reciente
+    assert recibidas == [("foto", (10, 10))] and svc.stats["lru_aciertos"] == 1
+
+    svc.obtener(4, CREADO, lambda f: None)
+    svc._llego(svc.clave(4, CREADO), _img())
+    assert [k[0] for k in svc._lru] == [3, 1, 4]       # salió el 2
+    assert svc._bytes == 3 * 400 and svc.stats["expulsadas"] == 1
+    svc.obtener(2, CREADO, lambda f: None)
+    assert len(svc.enviados) == 5                       # el expulsado vuelve a pedirse
+
+
+def test_pedidos_simultaneos_de_la_misma_imagen_van_una_vez(svc):
+    a, b = [], []
+    svc.obtener(7, CREADO, a.append)
+    svc.obtener(7, CREADO, b.append)
+    assert len(svc.enviados) == 1 and svc.enviados[0] == (svc.clave(7, CREADO),)
+    svc._llego(svc.clave(7, CREADO), _img())
+    assert a == b == [("foto", (10, 10))]
+    assert svc._esperando == {}
+
+
+def test_fallo_libera_el_pedido(svc):
+    llamadas = []
+    svc.obtener(8, CREADO, llamadas.append)
+    svc._fallo(svc.clave(8, CREADO))
+    assert llamadas == [] and svc._esperando == {} and svc.stats["errores"] == 1
+    svc.obtener(8, CREADO, llamadas.append)
+    assert len(svc.enviados) == 2
+
+
+def test_miniatura_se_genera_una_vez_y_reemplaza_versiones_viejas(svc, monkeypatch):
+    lecturas = []
+
+    def leer(id_imagen, destino, creado=CREADO):
+        lecturas.append(id_imagen)
+        destino.write(_png())
+        return 0, creado
+
+    monkeypatch.setattr(imagenes, "_leer_blob", leer)
+    viejo = svc.clave(5, CREADO - dt.timedelta(days=1))
+    open(svc._ruta(viejo), "wb").close()
+    otra = svc.clave(55, CREADO)
+    open(svc._ruta(otra), "wb").close()
+
+    img = svc.miniatura(svc.clave(5, CREADO))
+    assert max(img.size) == 10 and lecturas == [5]
+    assert svc.miniatura(svc.clave(5, CREADO)).size == img.size
+    assert lecturas == [5] and svc.stats["disco_aciertos"] == 1
+    assert sorted(os.listdir(svc.dir_cache)) == sorted(os.path.basename(svc._ruta(k))
+                                                       for k in (svc.clave(5, CREADO), otra))
+
+
+def test_miniatura_no_guarda_una_imagen_que_cambio(svc, monkeypatch):
+    nuevo = CREADO + dt.timedelta(minutes=5)
+
+    def leer(id_imagen, destino):
+        destino.write(_png())
+        return 0, nuevo
+
+    monkeypatch.setattr(imagenes, "_leer_blob", leer)
+    with pytest.raises(ValueError):
+        svc.miniatura(svc.clave(5, CREADO))
+    assert os.listdir(svc.dir_cache) == []
+
+
+def test_podar_borra_las_menos_usadas(svc):
+    svc.presupuesto_disco = 250
+    for n, nombre in enumerate(("a.png", "b.png", "c.png", "d.png")):
+        ruta = os.path.join(svc.dir_cache, nombre)
+        with open(ruta, "wb") as f:
+            f.write(b"x" * 100)
+        os.utime(ruta, (1000 + n, 1000 + n))
+    os.utime(os.path.join(svc.dir_cache, "a.png"), (2000, 2000))   # la más vieja se usó recién
+    assert svc.podar() == 2
+    assert sorted(os.listdir(svc.dir_cache)) == ["a.png", "d.png"]
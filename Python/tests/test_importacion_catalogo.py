@@ -0,0 +1,112 @@
+import pytest
+
+pytest.importorskip("pyodbc")
+
+import db
+
+
+@pytest.mark.parametrize("texto, valor", [
+    ("1234.5", 1234.5),
+    ("1234,5", 1234.5),
+    ("1.234,50", 1234.5),
+    ("1,234.50", 1234.5),
+    ("$ 1.234,50", 1234.5),
+    ("15.000", 15000.0),
+    ("1,234", 1234.0),
+    ("1.250.000", 1250000.0),
+    ("1,250,000", 1250000.0),
+    ("-2.500", -2500.0),
+    ("0,125", 0.125),
+    ("12,50", 12.5),
+    ("15", 15.0),
+    (15000, 15000.0),
+    (12.5, 12.5),
+])
+def test_numero(texto, valor):
+    assert db._numero(texto) == valor
+
+
+@pytest.mark.parametrize("texto", ["1.25.000", "1.250.00", "abc", ""])
+def test_numero_invalido(texto):
+    with pytest.raises(ValueError):
+        db._numero(texto)
+
+
+def test_catalogo_fila_normaliza():
+    fila = {"Código": 7791234567890.0, "Descripción": "  Ibuprofeno   400 mg ", "PVP": "15.000",
+            "Stock Min": "3", "Requiere Receta": "Sí", "otra": "se ignora"}
+    assert db._catalogo_fila(fila) == ("7791234567890", "Ibuprofeno 400 mg", 15000.0, 3, 1)
+
+
+def test_catalogo_fila_columnas_opcionales():
+    assert db._catalogo_fila({"ean": "A1", "precio": "1.250.000"}) == ("A1", None, 1250000.0, None, None)
+
+
+@pytest.mark.parametrize("fila, motivo", [
+    ({"codigo": "", "precio": "10"}, "sin código"),
+    ({"codigo": "X" * 41, "precio": "10"}, "40 caracteres"),
+    ({"codigo": "A1"}, "sin precio"),
+    ({"codigo": "A1", "precio": "diez"}, "precio inválido"),
+    ({"codigo": "A1", "precio": "-1"}, "fuera de rango"),
+    ({"codigo": "A1", "precio": "10", "stockmin": "-2"}, "negativo"),
+    ({"codigo": "A1", "precio": "10", "receta": "quizás"}, "receta inválida"),
+])
+def test_catalogo_fila_rechaza(fila, motivo):
+    with pytest.raises(ValueError, match=motivo):
+        db._catalogo_fila(fila)
+
+
+class _Cursor:
+    def __init__(self, cargadas):
+        self.cargadas = cargadas
+        self.fast_executemany = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=()):
+        self._merge = "MERGE" in sql
+
+    def executemany(self, sql, filas):
+        self.cargadas.extend(filas)
+
+    def fetchone(self):
+        return (len(self.cargadas), 0, 0)
+
+    def nextset(self):
+        return True
+
+    def fetchall(self):
+        return []
+
+
+class _Conexion:
+    def __init__(self, cargadas):
+        self.cargadas = cargadas
+
+    def cursor(self):
+        return _Cursor(self.cargadas)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_catalogo_importar_detalle_rechazos_con_encabezado_alias(monkeypatch):
+    cargadas = []
+    monkeypatch.setattr(db, "conectar", lambda: _Conexion(cargadas))
+    filas = [{"Código": "A1", "PVP": "15.000"},
+             {"Código": "B2", "PVP": "gratis"},
+             {"EAN": 7790000000012.0}]
+    res = db.catalogo_importar(filas)
+    assert cargadas == [("A1", None, 15000.0, None, None)]
+    assert res["rechazados"] == 2
+    assert [(n, c) for n, c, _ in res["detalle_rechazos"]] == [(2, "B2"), (3, "7790000000012")]
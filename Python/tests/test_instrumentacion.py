@@ -0,0 +1,52 @@
+import sqlite3
+
+import instrumentacion
+
+
+def test_cursor_medido_con_sqlite3_en_with():
+    instrumentacion.reiniciar()
+    cnx = sqlite3.connect(":memory:")
+    cuenta = [0]
+    cur = cnx.cursor()
+    with instrumentacion.CursorMedido(cur, "prueba", cuenta) as c:
+        assert isinstance(c, instrumentacion.CursorMedido)
+        c.execute("SELECT ? + 1;", (1,))
+        assert c.fetchone() == (2,)
+    assert cuenta == [1]
+    try:
+        cur.execute("SELECT 1;")
+        raise AssertionError("el cursor debía quedar cerrado")
+    except sqlite3.ProgrammingError:
+        pass
+    sentencias = instrumentacion.snapshot()["sentencias"]
+    assert [s["leidas"] for s in sentencias] == [1]
+    cnx.close()
+
+
+class _CursorPyodbc:
+    """Como pyodbc: __exit__ confirma si no hubo error."""
+
+    def __init__(self):
+        self.salidas, self.cerrado = [], False
+
+    def __exit__(self, tipo, *exc):
+        self.salidas.append(tipo)
+        return False
+
+    def close(self):
+        self.cerrado = True
+
+
+def test_cursor_medido_conserva_el_exit_del_cursor_real():
+    real = _CursorPyodbc()
+    with instrumentacion.CursorMedido(real, "prueba", [0]):
+        pass
+    assert real.salidas == [None] and real.cerrado
+
+    real = _CursorPyodbc()
+    try:
+        with instrumentacion.CursorMedido(real, "prueba", [0]):
+            raise KeyError("x")
+    except KeyError:
+        pass
+    assert real.salidas == [KeyError] and real.cerrado
@@ -0,0 +1,95 @@
+import pytest
+
+pytest.importorskip("ttkbootstrap")
+pytest.importorskip("pyodbc")
+
+import inventario_view
+
+
+class _Tree:
+    """Lo mínimo de ttk.Treeview que usa la paginación; insert repite el TclError de Tk."""
+
+    def __init__(self):
+        self.iids = []
+
+    def insert(self, padre, pos, iid, **_):
+        if iid in self.iids:
+            raise RuntimeError(f'Item {iid} already exists')
+        self.iids.insert(len(self.iids) if pos == "end" else pos, iid)
+
+    def exists(self, iid):
+        return iid in self.iids
+
+    def get_children(self):
+        return tuple(self.iids)
+
+    def delete(self, *iids):
+        for iid in iids:
+            self.iids.remove(iid)
+
+    def see(self, iid):
+        pass
+
+
+class _Label:
+    def config(self, **_):
+        pass
+
+
+def _fila(n):
+    return (n, f"C{n:03d}", f"Producto {n:03d}", 10.0, 5, 1, False)
+
+
+@pytest.fixture
+def vista(monkeypatch):
+    v = object.__new__(inventario_view.InventarioFrame)
+    v.tam_pagina, v._paginas, v._antes, v._fin = 3, [], [], False
+    v._pendiente, v._fotos, v._img = False, {}, None
+    v.tree, v.lbl_estado = _Tree(), _Label()
+    v.pedidos = []
+    monkeypatch.setattr(v, "_pedir", lambda despues, al_llegar: v.pedidos.append((despues, al_llegar)), raising=False)
+    monkeypatch.setattr(inventario_view, "PAGINAS_EN_VISTA", 2)
+    return v
+
+
+def _bajar(v, filas):
+    v._cargar_abajo()
+    despues, al_llegar = v.pedidos.pop()
+    al_llegar(filas)
+    return despues
+
+
+def test_subir_no_repite_filas_que_ya_estan(vista):
+    v = vista
+    _bajar(v, [_fila(1), _fila(2), _fila(3)])
+    _bajar(v, [_fila(4), _fila(5), _fila(6)])
+    _bajar(v, [_fila(7), _fila(8), _fila(9)])        # la primera página sale por arriba
+    assert v.tree.get_children() == ("4", "5", "6", "7", "8", "9") and v._antes == [None]
+
+    v._cargar_arriba()
+    inicio, al_llegar = v.pedidos.pop()
+    al_llegar([_fila(2), _fila(3), _fila(4)])        # se borró el 1: la página pisa a la siguiente
+    assert v.tree.get_children() == ("2", "3", "4", "5", "6")
+    assert v._antes == []
+
+
+def test_pagina_vacia_arriba_igual_avanza(vista):
+    v = vista
+    for base in (1, 4, 7, 10):
+        _bajar(v, [_fila(base), _fila(base + 1), _fila(base + 2)])
+    assert len(v._antes) == 2
+    v._cargar_arriba()
+    _, al_llegar = v.pedidos.pop()
+    al_llegar([])                                    # esos productos ya no existen
+    assert len(v._antes) == 1
+    v._cargar_arriba()
+    assert v.pedidos[-1][0] is None                  # la siguiente clave, no la misma de nuevo
+
+
+def test_bajar_sigue_desde_la_ultima_fila_recibida(vista):
+    v = vista
+    _bajar(v, [_fila(1), _fila(2), _fila(3)])
+    despues = _bajar(v, [_fila(4), _fila(2), _fila(5)])   # el 2 cambió de descripción: ya está
+    assert despues == (_fila(3)[2], 3)
+    assert v.tree.get_children() == ("1", "2", "3", "4", "5")
+    assert _bajar(v, [_fila(6)]) == (_fila(5)[2], 5)
@@ -0,0 +1,88 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("pyodbc")
+
+import db
+
+
+class _Secuencias:
+    """Sustituto de _reservar_rango (sp_sequence_get_range): rangos contiguos por serie."""
+
+    def __init__(self, demora: float = 0.0):
+        self.proximo = {}
+        self.llamadas = []
+        self.demora = demora
+        self._lock = threading.Lock()
+
+    def __call__(self, serie: str, cantidad: int) -> int:
+        time.sleep(self.demora)   # el viaje a la BD: otros hilos quedan esperando el lock del numerador
+        with self._lock:
+            primero = self.proximo.get(serie, 1)
+            self.proximo[serie] = primero + cantidad
+            self.llamadas.append((serie, primero, cantidad))
+            return primero
+
+
+def _numero(nro: str) -> int:
+    return int(nro.split("-")[1])
+
+
+def _en_hilos(n_hilos: int, por_hilo: int, fn):
+    resultados = [[] for _ in range(n_hilos)]
+    largada = threading.Barrier(n_hilos)
+
+    def trabajar(i):
+        largada.wait()
+        for _ in range(por_hilo):
+            resultados[i].append(fn(i))
+
+    hilos = [threading.Thread(target=trabajar, args=(i,)) for i in range(n_hilos)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    return resultados
+
+
+def test_sin_duplicados_ni_saltos_entre_hilos():
+    sec = _Secuencias(demora=0.001)
+    num = db.Numerador(sec, bloque=7)
+    res = _en_hilos(16, 200, lambda i: num.siguiente("FAC"))
+
+    todos = [_numero(n) for r in res for n in r]
+    assert len(todos) == len(set(todos)) == 16 * 200
+    assert sorted(todos) == list(range(1, 16 * 200 + 1))   # un solo numerador: bloques completos
+    assert num.reservas == len(sec.llamadas) == -(-16 * 200 // 7)
+    for r in res:                                          # cada hilo ve números crecientes
+        ns = [_numero(n) for n in r]
+        assert ns == sorted(ns)
+
+
+def test_los_rangos_se_usan_en_orden():
+    sec = _Secuencias()
+    num = db.Numerador(sec, bloque=5)
+    usados = [_numero(num.siguiente("OC")) for _ in range(12)]
+    assert usados == list(range(1, 13))
+    assert [(s, p) for s, p, _ in sec.llamadas] == [("OC", 1), ("OC", 6), ("OC", 11)]
+    assert num.siguiente("OC") == "OC-000013"              # sigue en el tercer bloque sin reservar
+
+
+def test_series_independientes():
+    sec = _Secuencias()
+    num = db.Numerador(sec, bloque=3)
+    res = _en_hilos(8, 50, lambda i: num.siguiente("FAC" if i % 2 else "OC"))
+    for serie in ("FAC", "OC"):
+        ns = [_numero(n) for r in res for n in r if n.startswith(serie + "-")]
+        assert sorted(ns) == list(range(1, 4 * 50 + 1))
+
+
+def test_varias_cajas_no_repiten_numeros():
+    sec = _Secuencias(demora=0.001)
+    cajas = [db.Numerador(sec, bloque=10) for _ in range(4)]
+    res = _en_hilos(8, 100, lambda i: cajas[i % 4].siguiente("FAC"))
+    todos = [_numero(n) for r in res for n in r]
+    assert len(todos) == len(set(todos)) == 800
+    assert max(todos) <= sec.proximo["FAC"] - 1            # solo saltos por bloques sin terminar
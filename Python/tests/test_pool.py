@@ -0,0 +1,179 @@
+import threading
+import time
+
+import pytest
+
+pyodbc = pytest.importorskip("pyodbc")
+
+import db
+
+
+class _Cursor:
+    def __init__(self, cnx):
+        self.cnx = cnx
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def execute(self, sql, params=()):
+        if self.cnx.rota:
+            raise pyodbc.OperationalError("08S01", "Communication link failure")
+        self.cnx.sentencias.append(sql)
+        return self
+
+    def fetchone(self):
+        return (1,)
+
+    def close(self):
+        pass
+
+
+class _Conexion:
+    def __init__(self, n):
+        self.n = n
+        self.rota = False
+        self.cerrada = False
+        self.rollbacks = 0
+        self.sentencias = []
+
+    def cursor(self):
+        return _Cursor(self)
+
+    def rollback(self):
+        if self.rota:
+            raise pyodbc.OperationalError("08S01", "Communication link failure")
+        self.rollbacks += 1
+
+    def commit(self):
+        pass
+
+    def close(self):
+        self.cerrada = True
+
+
+class _Fabrica:
+    def __init__(self):
+        self.creadas = []
+
+    def __call__(self):
+        c = _Conexion(len(self.creadas))
+        self.creadas.append(c)
+        return c
+
+
+@pytest.fixture
+def fabrica():
+    return _Fabrica()
+
+
+def _pool(fabrica, **opciones):
+    opciones.setdefault("validar_tras", 60)
+    return db.PoolConexiones(fabrica, **opciones)
+
+
+def test_reusa_la_ultima_devuelta_y_hace_rollback(fabrica):
+    pool = _pool(fabrica)
+    a, b = pool.obtener(), pool.obtener()
+    a.close()
+    b.close()
+    c = pool.obtener()
+    assert c._cnx is fabrica.creadas[1]          # LIFO
+    assert fabrica.creadas[0].rollbacks == 1 and fabrica.creadas[1].rollbacks == 1
+    c.close()
+    st = pool.stats()
+    assert (st["creadas"], st["reusadas"], st["checkouts"]) == (2, 1, 3)
+    assert (st["abiertas"], st["libres"], st["prestadas"]) == (2, 2, 0)
+
+
+def test_devuelta_no_se_puede_usar(fabrica):
+    pool = _pool(fabrica)
+    c = pool.obtener()
+    c.close()
+    with pytest.raises(pyodbc.ProgrammingError):
+        c.cursor()
+
+
+def test_no_abre_mas_del_maximo_y_espera_una_libre(fabrica):
+    pool = _pool(fabrica, max_conexiones=2, espera=5)
+    a, b = pool.obtener(), pool.obtener()
+    obtenida = []
+    hilo = threading.Thread(target=lambda: obtenida.append(pool.obtener()))
+    hilo.start()
+    time.sleep(0.1)
+    assert obtenida == [] and len(fabrica.creadas) == 2
+    a.close()
+    hilo.join(2)
+    assert obtenida and obtenida[0]._cnx is fabrica.creadas[0]
+    st = pool.stats()
+    assert (st["creadas"], st["esperas"], st["abiertas"], st["prestadas"]) == (2, 1, 2, 2)
+    assert st["hilos"] == 2 and st["max"] == 2
+    obtenida[0].close()
+    b.close()
+
+
+def test_sin_lugar_vence_la_espera(fabrica):
+    pool = _pool(fabrica, max_conexiones=1, espera=0.05)
+    a = pool.obtener()
+    t0 = time.monotonic()
+    with pytest.raises(pyodbc.OperationalError):
+        pool.obtener()
+    assert time.monotonic() - t0 >= 0.05
+    assert pool.stats()["timeouts"] == 1
+    a.close()
+
+
+def test_expulsa_las_inactivas(fabrica):
+    pool = _pool(fabrica, inactividad=0.05)
+    pool.obtener().close()
+    time.sleep(0.1)
+    pool.purgar()
+    st = pool.stats()
+    assert fabrica.creadas[0].cerrada
+    assert (st["expulsadas"], st["abiertas"], st["libres"]) == (1, 0, 0)
+    pool.obtener().close()                        # abre otra en su lugar
+    assert len(fabrica.creadas) == 2
+
+
+def test_descarta_la_que_no_pasa_la_validacion(fabrica):
+    pool = _pool(fabrica, validar_tras=0)
+    pool.obtener().close()
+    fabrica.creadas[0].rota = True
+    c = pool.obtener()
+    assert c._cnx is fabrica.creadas[1] and fabrica.creadas[0].cerrada
+    c.close()
+    st = pool.stats()
+    assert (st["descartadas"], st["creadas"], st["abiertas"]) == (1, 2, 1)
+
+
+def test_rollback_fallido_al_devolver_libera_el_lugar(fabrica):
+    pool = _pool(fabrica, max_conexiones=1, espera=0.05)
+    c = pool.obtener()
+    fabrica.creadas[0].rota = True
+    c.close()
+    assert pool.stats()["descartadas"] == 1
+    pool.obtener().close()                        # el lugar quedó libre: no vence la espera
+    assert len(fabrica.creadas) == 2
+
+
+def test_fabrica_que_falla_no_ocupa_lugar(fabrica):
+    def rota():
+        raise pyodbc.OperationalError("08001", "no se pudo conectar")
+    pool = _pool(rota, max_conexiones=1, espera=0.05)
+    for _ in range(3):
+        with pytest.raises(pyodbc.OperationalError, match="08001"):
+            pool.obtener()
+    assert pool.stats()["abiertas"] == 0
+
+
+def test_cerrar_cierra_libres_y_las_prestadas_al_devolverse(fabrica):
+    pool = _pool(fabrica)
+    a, b = pool.obtener(), pool.obtener()
+    a.close()
+    pool.cerrar()
+    assert fabrica.creadas[0].cerrada and not fabrica.creadas[1].cerrada
+    b.close()
+    assert fabrica.creadas[1].cerrada and pool.stats()["abiertas"] == 0
@@ -0,0 +1,243 @@
+import collections
+
+import pytest
+
+pyodbc = pytest.importorskip("pyodbc")
+
+import db
+import instrumentacion
+
+
+def _deadlock():
+    return pyodbc.Error("40001", "[40001] [Microsoft][ODBC Driver 18 for SQL Server][SQL Server]Transaction "
+                                 "(Process ID 57) was deadlocked on lock resources with another process and has "
+                                 "been chosen as the deadlock victim. Rerun the transaction. (1205) (SQLExecDirectW)")
+
+
+def _enlace():
+    return pyodbc.OperationalError("08S01", "[08S01] [Microsoft][ODBC Driver 18 for SQL Server]"
+                                            "Communication link failure (10054) (SQLExecDirectW)")
+
+
+def _timeout():
+    return pyodbc.OperationalError("HYT00", "[HYT00] [Microsoft][ODBC Driver 18 for SQL Server]"
+                                            "Query timeout expired (0) (SQLExecDirectW)")
+
+
+class _Servidor:
+    """
+    SQL Server de mentira para venta_crear/compra_crear: reconoce las sentencias de db.py por
+    su texto, guarda lo confirmado y deja fallar donde se le pida.
+    fallas: [(marca, momento, fabrica_de_error)], cada una se dispara una vez:
+      momento 'sentencia' = al ejecutar la sentencia que contiene `marca` (nada se graba);
+              'commit'    = al confirmar una transacción que ejecutó `marca` (nada se graba);
+              'respuesta' = se graba y se pierde la respuesta del commit.
+    """
+
+    def __init__(self, fallas=()):
+        self.fallas = list(fallas)
+        self.aplicadas = {}                    # clave -> IdRemoto
+        self.confirmadas = collections.Counter()   # clave -> commits que la grabaron
+        self.documentos = []                   # (tipo, id, nro)
+        self.proximo_id = 100
+
+    def conectar(self):
+        return _Conexion(self)
+
+    def falla(self, marca_sql: str, momento: str):
+        for i, (marca, m, error) in enumerate(self.fallas):
+            if m == momento and marca in marca_sql:
+                del self.fallas[i]
+                return error()
+        return None
+
+
+class _Conexion:
+    def __init__(self, srv: _Servidor):
+        self.srv = srv
+        self.rota = False
+        self._pendiente = []                   # ("clave", clave, id) | ("doc", tipo, id, nro)
+        self._ejecutadas = []
+
+    def _viva(self):
+        if self.rota:
+            raise _enlace()
+
+    def _romper_si(self, e):
+        if e is not None:
+            self.rota = e.args[0].startswith("08")
+            raise e
+
+    def cursor(self):
+        self._viva()
+        return _Cursor(self)
+
+    def commit(self):
+        self._viva()
+        if not self._pendiente:
+            return
+        for sql in self._ejecutadas:
+            self._romper_si(self.srv.falla(sql, "commit"))
+        for op in self._pendiente:
+            if op[0] == "clave":
+                self.srv.aplicadas[op[1]] = op[2]
+                self.srv.confirmadas[op[1]] += 1
+            else:
+                self.srv.documentos.append(op[1:])
+        ejecutadas, self._pendiente, self._ejecutadas = self._ejecutadas, [], []
+        for sql in ejecutadas:
+            self._romper_si(self.srv.falla(sql, "respuesta"))
+
+    def rollback(self):
+        self._viva()
+        self._pendiente, self._ejecutadas = [], []
+
+    def close(self):
+        pass
+
+
+class _Cursor:
+    def __init__(self, cnx: _Conexion):
+        self.cnx = cnx
+        self.rowcount = -1
+        self.fast_executemany = False
+        self._filas = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, *exc):
+        if tipo is None:
+            self.cnx.commit()                  # como pyodbc: commit al salir sin error
+        return False
+
+    def execute(self, sql, *params):
+        cnx, srv = self.cnx, self.cnx.srv
+        cnx._viva()
+        cnx._romper_si(srv.falla(sql, "sentencia"))
+        cnx._ejecutadas.append(sql)
+        params = params[0] if len(params) == 1 and isinstance(params[0], tuple) else params
+        self._filas = []
+        if "INSERT INTO dbo.OperacionesAplicadas" in sql:      # toma la clave (o devuelve el Id previo)
+            self._filas = [(srv.aplicadas.get(params[0]),)]
+        elif "UPDATE dbo.OperacionesAplicadas" in sql:
+            cnx._pendiente.append(("clave", params[1], params[0]))
+        elif "INSERT INTO dbo.Ventas" in sql or "INSERT INTO dbo.Compras" in sql:
+            srv.proximo_id += 1
+            tipo = "VEN" if "dbo.Ventas" in sql else "COM"
+            cnx._pendiente.append(("doc", tipo, srv.proximo_id, params[1] if tipo == "VEN" else params[0]))
+            self._filas = [(srv.proximo_id, None, None, None)]
+        elif sql.strip().startswith("SELECT 1"):
+            self._filas = [(1,)]
+        return self
+
+    def executemany(self, sql, filas):
+        self.cnx._viva()
+        return self
+
+    def fetchone(self):
+        return self._filas.pop(0) if self._filas else None
+
+    def fetchall(self):
+        filas, self._filas = self._filas, []
+        return filas
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def servidor(monkeypatch):
+    def instalar(fallas=()):
+        srv = _Servidor(fallas)
+        monkeypatch.setattr(db, "_pool", db.PoolConexiones(srv.conectar, validar_tras=60))
+        return srv
+    monkeypatch.setattr(db, "REINTENTO_BASE", 0.0)
+    monkeypatch.setattr(instrumentacion, "INSTRUMENTAR", True)
+    return instalar
+
+
+_ITEMS_VENTA = [{"codigo": "A1", "cant": 2, "punit": 50}]
+_ITEMS_COMPRA = [{"codigo": "A1", "desc": "Producto", "cant": 10, "punit": 30, "vence": None}]
+_ERRORES = {"1205": _deadlock, "08S01": _enlace, "HYT00": _timeout}
+
+
+def _stats(op):
+    return collections.Counter(db.reintentos_stats().get(op, {}))
+
+
+@pytest.mark.parametrize("error", sorted(_ERRORES))
+@pytest.mark.parametrize("momento", ["sentencia", "commit", "respuesta"])
+def test_venta_crear_graba_una_sola_vez(servidor, error, momento):
+    srv = servidor([("INSERT INTO dbo.Ventas", momento, _ERRORES[error])])
+    antes = _stats("venta_crear")
+    idv = db.venta_crear(1, None, _ITEMS_VENTA, nro="FAC-000001", clave="k1")
+    assert srv.confirmadas == {"k1": 1}
+    assert srv.documentos == [("VEN", idv, "FAC-000001")]
+    d = _stats("venta_crear") - antes
+    assert (d["llamadas"], d["reintentos"], d["recuperadas"]) == (1, 1, 1)
+
+
+@pytest.mark.parametrize("momento", ["sentencia", "commit", "respuesta"])
+def test_compra_crear_graba_una_sola_vez(servidor, momento):
+    srv = servidor([("INSERT INTO dbo.Compras", momento, _enlace), ("INSERT INTO dbo.Compras", "sentencia", _deadlock)])
+    idc = db.compra_crear(1, 1, _ITEMS_COMPRA, nro="OC-000001", clave="c1")
+    assert srv.confirmadas == {"c1": 1}
+    assert [d[1] for d in srv.documentos] == [idc]
+
+
+def test_varias_fallas_seguidas_y_varias_claves(servidor):
+    srv = servidor([("INSERT INTO dbo.Ventas", "sentencia", _deadlock),
+                    ("INSERT INTO dbo.Ventas", "respuesta", _enlace),
+                    ("INSERT INTO dbo.Ventas", "sentencia", _timeout)])
+    ids = [db.venta_crear(1, None, _ITEMS_VENTA, nro=f"FAC-{n:06d}", clave=f"k{n}") for n in range(1, 4)]
+    assert srv.confirmadas == {"k1": 1, "k2": 1, "k3": 1}
+    assert sorted(d[1] for d in srv.documentos) == sorted(ids)
+
+
+def test_sin_recuperacion_no_graba_y_cuenta_abortada(servidor):
+    srv = servidor([("INSERT INTO dbo.Ventas", "sentencia", _deadlock)] * db.REINTENTOS_MAX)
+    antes = _stats("venta_crear")
+    with pytest.raises(pyodbc.Error):
+        db.venta_crear(1, None, _ITEMS_VENTA, nro="FAC-000001", clave="k1")
+    assert srv.confirmadas == {} and srv.documentos == []
+    d = _stats("venta_crear") - antes
+    assert (d["abortadas"], d["deadlock"]) == (1, db.REINTENTOS_MAX)
+
+
+def test_error_no_transitorio_no_se_reintenta(servidor):
+    servidor([("INSERT INTO dbo.Ventas", "sentencia",
+               lambda: pyodbc.IntegrityError("23000", "Violation of UNIQUE KEY constraint (2627) (SQLExecDirectW)"))])
+    antes = _stats("venta_crear")
+    with pytest.raises(pyodbc.IntegrityError):
+        db.venta_crear(1, None, _ITEMS_VENTA, nro="FAC-000001", clave="k1")
+    assert (_stats("venta_crear") - antes)["reintentos"] == 0
+
+
+def test_instrumentacion_informa_la_operacion_publica(servidor):
+    servidor([("INSERT INTO dbo.Ventas", "respuesta", _enlace)])
+    instrumentacion.reiniciar()
+    db.venta_crear(1, None, _ITEMS_VENTA, nro="FAC-000001", clave="k1")
+    db.compra_crear(1, 1, _ITEMS_COMPRA, nro="OC-000001", clave="c1")
+    llamadas = {l["llamada"]: l["n"] for l in instrumentacion.snapshot()["llamadas"]}
+    assert llamadas == {"venta_crear": 2, "compra_crear": 1}
+
+
+def test_sqlserver_claves_distintas_no_se_esperan(sqlserver):
+    db = sqlserver
+    a, b = db.conectar(), db.conectar()
+    try:
+        ca, cb = a.cursor(), b.cursor()
+        assert db._clave_aplicada(ca, "TEST-" + db.nueva_clave()[:30], "VEN") is None
+        cb.execute("SET LOCK_TIMEOUT 1000;")          # antes: esperaba al rango bloqueado por `a`
+        clave_b = "TEST-" + db.nueva_clave()[:30]
+        assert db._clave_aplicada(cb, clave_b, "VEN") is None
+        db._clave_registrar(cb, clave_b, 77)
+        b.commit()
+        cb.execute("SET LOCK_TIMEOUT -1;")
+        assert db._clave_aplicada(cb, clave_b, "VEN") == 77   # reenvío: devuelve el Id grabado
+    finally:
+        a.rollback()
+        b.rollback()
+        a.close()
+        b.close()
@@ -0,0 +1,74 @@
+import datetime as dt
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("pyodbc")
+
+import reportes
+
+
+def _datos(filas):
+    """Porción de VentasDiaProducto como la devuelve reportes.acumulados."""
+    nombres = ["fecha", "producto", "usuario", "cantidad", "importe", "costo", "tickets"]
+    tipos = ["datetime64[D]", np.int32, np.int32, np.int64, np.float64, np.float64, np.int64]
+    cols = list(zip(*filas)) if filas else [[] for _ in nombres]
+    return {n: np.array(c, dtype=t) for n, c, t in zip(nombres, cols, tipos)}
+
+
+_MAYO = _datos([
+    ("2024-05-01", 3, 1, 2, 200.0, 120.0, 1),
+    ("2024-05-01", 1, 2, 1, 50.0, 50.0, 1),
+    ("2024-05-02", 3, 2, 1, 100.0, 60.0, 1),
+    ("2024-05-02", 7, 1, 5, 0.0, 10.0, 1),      # bonificado: importe 0
+])
+
+
+def test_agrupar_por_producto():
+    g = reportes.agrupar(_MAYO, "producto")
+    assert g["producto"].tolist() == [1, 3, 7]
+    assert g["cantidad"].tolist() == [1, 3, 5]
+    assert g["importe"].tolist() == [50.0, 300.0, 0.0]
+    assert g["margen"].tolist() == [0.0, 120.0, -10.0]
+    assert g["margen_pct"].tolist() == [0.0, 40.0, 0.0]       # sin importe no divide por cero
+
+
+def test_agrupar_por_dia_y_usuario():
+    d = reportes.agrupar(_MAYO, "dia")
+    assert d["dia"].tolist() == [dt.date(2024, 5, 1), dt.date(2024, 5, 2)]
+    assert d["importe"].tolist() == [250.0, 100.0]
+    u = reportes.agrupar(_MAYO, "usuario")
+    assert u["usuario"].tolist() == [1, 2] and u["costo"].tolist() == [130.0, 110.0]
+
+
+def test_agrupar_vacio():
+    g = reportes.agrupar(_datos([]))
+    assert len(g["producto"]) == 0 and len(g["margen_pct"]) == 0
+
+
+def test_comparar_claves_de_un_solo_periodo(monkeypatch):
+    abril = _datos([
+        ("2024-04-03", 3, 1, 2, 150.0, 90.0, 1),
+        ("2024-04-10", 9, 1, 4, 80.0, 40.0, 1),      # no se vendió en mayo
+    ])
+    periodos = {reportes.mes(2024, 5): _MAYO, reportes.mes(2024, 4): abril}
+    monkeypatch.setattr(reportes, "acumulados", lambda desde, hasta, usuario_id=None: periodos[(desde, hasta)])
+    r = reportes.comparar(reportes.mes(2024, 5), reportes.mes(2024, 4))
+    assert r["producto"].tolist() == [1, 3, 7, 9]
+    assert r["importe_a"].tolist() == [50.0, 300.0, 0.0, 0.0]
+    assert r["importe_b"].tolist() == [0.0, 150.0, 0.0, 80.0]
+    var = r["importe_var_pct"]
+    assert np.isnan(var[0]) and np.isnan(var[2])   # nuevo / sin base: sin variación
+    assert var[1] == 100.0 and var[3] == -100.0
+    assert r["margen_var_pct"][1] == pytest.approx((120 - 60) / 60 * 100)
+
+
+@pytest.mark.parametrize("anio, m, esperado", [
+    (2024, 12, (dt.date(2024, 12, 1), dt.date(2024, 12, 31))),
+    (2024, 2, (dt.date(2024, 2, 1), dt.date(2024, 2, 29))),
+    (2023, 2, (dt.date(2023, 2, 1), dt.date(2023, 2, 28))),
+    (2024, 1, (dt.date(2024, 1, 1), dt.date(2024, 1, 31))),
+    (2024, 4, (dt.date(2024, 4, 1), dt.date(2024, 4, 30))),
+])
+def test_mes(anio, m, esperado):
+    assert reportes.mes(anio, m) == esperado
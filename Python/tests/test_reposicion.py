@@ -0,0 +1,145 @@
+import datetime as dt
+import json
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("pyodbc")
+
+import reportes
+import reposicion
+
+N = reposicion.HISTORIA_DIAS
+HOY = dt.date(2024, 6, 30)
+
+
+class _Ventas:
+    """VentasDiaProducto de mentira: {(fecha, producto): cantidad} y las consultas de reposicion."""
+
+    def __init__(self, ventas=None, lotes=()):
+        self.ventas = dict(ventas or {})
+        self.lotes = list(lotes)        # (producto, dias, stock) en orden FEFO
+        self.dias_leidos = []
+
+    def __call__(self, sql, params, nombres, tipos):
+        if sql == reposicion._SQL_HUELLAS:
+            desde, hasta = params
+            dias = sorted({f for f, _ in self.ventas if desde <= f <= hasta})
+            filas = [(f, len(v), sum(v), hash(tuple(v)) & 0xFFFFFF)
+                     for f in dias for v in [[c for (g, _), c in sorted(self.ventas.items()) if g == f]]]
+        elif sql == reposicion._SQL_DIAS:
+            fechas = {dt.date.fromisoformat(f) for f in json.loads(params[0])}
+            self.dias_leidos.extend(sorted(fechas))
+            filas = [(f, p, c) for (f, p), c in sorted(self.ventas.items()) if f in fechas]
+        elif sql == reposicion._SQL_LOTES:
+            filas = self.lotes
+        else:
+            raise AssertionError(sql)
+        cols = list(zip(*filas)) if filas else [[] for _ in nombres]
+        return {n: np.array(c, dtype=t) for n, c, t in zip(nombres, cols, tipos)}
+
+
+@pytest.fixture
+def bd(monkeypatch):
+    v = _Ventas()
+    monkeypatch.setattr(reportes, "_fetch_columnas", v)
+    return v
+
+
+def _dia(n_atras):
+    return HOY - dt.timedelta(days=n_atras)
+
+
+def _fila(c, producto):
+    return c["cant"][list(c["productos"]).index(producto)]
+
+
+def test_alinear_corre_la_ventana():
+    inicio = np.datetime64("2024-01-01")
+    c = reposicion._cache_vacia(inicio)
+    c["productos"] = np.array([5, 9], np.int32)
+    c["cant"] = np.tile(np.arange(N, dtype=np.int32), (2, 1))
+    c["huellas"] = np.tile(np.arange(N, dtype=np.int64)[:, None], (1, 3))
+
+    a = reposicion._alinear(c, inicio + 3)
+    assert a["inicio"] == inicio + 3
+    assert a["cant"][0, :N - 3].tolist() == list(range(3, N))
+    assert a["cant"][:, N - 3:].tolist() == [[0, 0, 0], [0, 0, 0]]
+    assert a["huellas"][:N - 3, 0].tolist() == list(range(3, N))
+    assert (a["huellas"][N - 3:] == -1).all()          # días nuevos: sin huella, se van a leer
+    assert a["productos"].tolist() == [5, 9]
+
+
+@pytest.mark.parametrize("corr", [-1, N, N + 5])
+def test_alinear_fuera_de_rango_empieza_de_cero(corr):
+    inicio = np.datetime64("2024-01-01")
+    c = reposicion._cache_vacia(inicio)
+    c["productos"], c["cant"] = np.array([5], np.int32), np.ones((1, N), np.int32)
+    a = reposicion._alinear(c, inicio + corr)
+    assert len(a["productos"]) == 0 and a["cant"].shape == (0, N)
+    assert reposicion._alinear(None, inicio)["cant"].shape == (0, N)
+
+
+def test_historia_lee_solo_los_dias_cambiados(bd, tmp_path):
+    ruta = str(tmp_path / "cache.npz")
+    bd.ventas = {(_dia(0), 2): 4, (_dia(1), 1): 3, (_dia(1), 2): 1, (_dia(10), 1): 7}
+    c, releidos = reposicion.historia(HOY, ruta)
+    assert releidos == N                                # sin caché: una sola consulta por todos los días
+    assert bd.dias_leidos[0] == _dia(N - 1) and bd.dias_leidos[-1] == HOY
+    assert c["productos"].tolist() == [1, 2]
+    assert _fila(c, 1)[-1] == 0 and _fila(c, 1)[-2] == 3 and _fila(c, 1)[-11] == 7
+    assert _fila(c, 2)[-1] == 4 and _fila(c, 2)[-2] == 1
+    assert c["cant"].sum() == 15
+
+    bd.dias_leidos.clear()
+    c2, releidos = reposicion.historia(HOY, ruta)   # nada cambió: todo sale de la caché
+    assert releidos == 0 and bd.dias_leidos == []
+    assert (c2["cant"] == c["cant"]).all()
+
+
+def test_historia_caché_corrida_producto_nuevo_y_dia_anulado(bd, tmp_path):
+    ruta = str(tmp_path / "cache.npz")
+    bd.ventas = {(_dia(1), 1): 3, (_dia(1), 2): 1, (_dia(5), 2): 6}
+    reposicion.historia(HOY, ruta)
+
+    # al día siguiente: aparece el producto 3 y se anula la venta del producto 2 de ayer
+    manana = HOY + dt.timedelta(days=1)
+    del bd.ventas[(_dia(1), 2)]
+    bd.ventas[(manana, 3)] = 2
+    bd.dias_leidos.clear()
+    c, releidos = reposicion.historia(manana, ruta)
+    assert releidos == 2 and sorted(bd.dias_leidos) == [_dia(1), manana]
+    assert c["inicio"] == np.datetime64(manana) - (N - 1)
+    assert c["productos"].tolist() == [1, 2, 3]
+    assert _fila(c, 1)[-3] == 3                        # corrido un día
+    assert _fila(c, 2)[-3] == 0 and _fila(c, 2)[-7] == 6
+    assert _fila(c, 3)[-1] == 2 and _fila(c, 3)[:-1].sum() == 0
+
+
+def test_historia_dia_que_sale_de_la_ventana(bd, tmp_path):
+    ruta = str(tmp_path / "cache.npz")
+    bd.ventas = {(_dia(N - 1), 4): 9, (_dia(0), 1): 1}
+    c, _ = reposicion.historia(HOY, ruta)
+    assert _fila(c, 4)[0] == 9
+    c, releidos = reposicion.historia(HOY + dt.timedelta(days=1), ruta)
+    assert releidos == 1 and bd.dias_leidos[-1] == HOY + dt.timedelta(days=1)   # solo el día que entra
+    assert _fila(c, 4).sum() == 0 and _fila(c, 1)[-2] == 1
+
+
+def test_perdida_vencimiento(bd):
+    catalogo = np.array([1, 2, 3, 4], np.int32)
+    vel = np.array([1.0, 2.0, 2.0, 5.0])
+    bd.lotes = [
+        (1, 5, 10),                   # vende 5 antes de vencer: se pierden 5
+        (2, 2, 3), (2, 10, 30),       # varios lotes: el primero se vende entero, del segundo sobran 13
+        (3, -1, 4),                   # ya vencido: se pierde todo
+    ]                                 # el 4 no tiene lotes por vencer
+    perdida = reposicion._perdida_vencimiento(catalogo, vel, HOY, 17)
+    assert perdida.tolist() == [5.0, 13.0, 4.0, 0.0]
+
+
+def test_perdida_vencimiento_sin_lotes_ni_exceso(bd):
+    catalogo = np.array([1, 2], np.int32)
+    assert reposicion._perdida_vencimiento(catalogo, np.ones(2), HOY, 17).tolist() == [0.0, 0.0]
+    bd.lotes = [(2, 9, 3), (2, 12, 2)]    # se vende todo antes de vencer
+    assert reposicion._perdida_vencimiento(catalogo, np.ones(2), HOY, 17).tolist() == [0.0, 0.0]
@@ -0,0 +1,207 @@
+import datetime as dt
+import os
+import re
+import sqlite3
+import uuid
+
+import pytest
+
+pytest.importorskip("pyodbc")
+
+import db
+import sincronizacion as sync
+
+
+# ===================== Filtro de exportación sobre SQLite =====================
+# Se evalúa el WHERE real de _filtro en SQLite (RowVer como entero) y se aplica el resultado
+# a una réplica con claves foráneas activas, en el mismo orden que usa importar().
+
+def _crear(cnx, con_rowver: bool):
+    for tabla, clave, columnas, _ in sync._TABLAS:
+        refs = dict(sync._REFERENCIAS.get(tabla, []))
+        defs = [f"{c} INTEGER PRIMARY KEY" if c == clave else
+                f"{c} REFERENCES {refs[c]}({next(t[1] for t in sync._TABLAS if t[0] == refs[c])})" if c in refs else c
+                for c in columnas]
+        if con_rowver:
+            defs.append("RowVer INTEGER NOT NULL")
+        cnx.execute(f"CREATE TABLE {tabla}({', '.join(defs)});")
+
+
+def _fila(tabla: str, **valores):
+    columnas = next(t[2] for t in sync._TABLAS if t[0] == tabla)
+    return tuple(valores.get(c) for c in columnas)
+
+
+def _exportar_sqlite(origen, desde: int, hasta: int):
+    params = {"hasta": hasta, **{f"d_{t[0]}": desde for t in sync._TABLAS}}
+    salida = {}
+    for tabla, _, columnas, _ in sync._TABLAS:
+        where = re.sub(r"@(\w+)", r":\1", sync._filtro(tabla)).replace("dbo.", "")
+        salida[tabla] = origen.execute(f"SELECT {', '.join(f't.{c}' for c in columnas)} FROM {tabla} t WHERE {where};",
+                                       params).fetchall()
+    return salida
+
+
+def _importar_sqlite(replica, exportado):
+    for tabla, clave, columnas, _ in sync._TABLAS:
+        otras = [c for c in columnas if c != clave]
+        replica.executemany(
+            f"INSERT INTO {tabla}({', '.join(columnas)}) VALUES ({', '.join('?' * len(columnas))}) "
+            f"ON CONFLICT({clave}) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in otras)};",
+            exportado[tabla])
+        replica.commit()
+
+
+@pytest.fixture
+def bases():
+    origen = sqlite3.connect(":memory:")
+    replica = sqlite3.connect(":memory:")
+    replica.execute("PRAGMA foreign_keys = ON;")
+    _crear(origen, con_rowver=True)
+    _crear(replica, con_rowver=False)
+    yield origen, replica
+    origen.close()
+    replica.close()
+
+
+def _insertar(cnx, tabla, rowver=None, **valores):
+    fila = _fila(tabla, **valores)
+    extra = (rowver,) if rowver is not None else ()
+    cnx.execute(f"INSERT INTO {tabla} VALUES ({', '.join('?' * (len(fila) + len(extra)))});", fila + extra)
+
+
+def test_cabecera_tocada_durante_la_exportacion_viaja_con_sus_detalles(bases):
+    origen, replica = bases
+    # ya exportado en la corrida anterior (marca 5)
+    for cnx, rv in ((origen, 1), (replica, None)):
+        _insertar(cnx, "Usuarios", rv, IdUsuario=1, Usuario="caja", RolId=1, Activo=1)
+        _insertar(cnx, "Proveedores", rv, IdProveedor=1, RazonSocial="Droguería")
+    replica.commit()
+    # compra de un producto nuevo (RowVer 6..9); después, con otra transacción abierta en 13
+    # (hasta = 13), una venta sube el RowVer del producto, del lote y de la compra
+    _insertar(origen, "Productos", 14, IdProducto=10, Codigo="P10", Stock=4)
+    _insertar(origen, "Compras", 17, IdCompra=20, IdProveedor=1, UsuarioId=1)
+    _insertar(origen, "CompraDetalle", 8, IdDet=30, IdCompra=20, IdProducto=10, Cantidad=5)
+    _insertar(origen, "Lotes", 16, IdLote=40, IdProducto=10, Lote="L1", StockLote=4)
+    _insertar(origen, "Ventas", 10, IdVenta=50, UsuarioId=1)
+    _insertar(origen, "VentaDetalle", 11, IdDet=60, IdVenta=50, IdProducto=10, IdLote=40, Cantidad=1)
+    _insertar(origen, "Productos", 18, IdProducto=11, Codigo="P11")   # posterior y sin referencias
+
+    exportado = _exportar_sqlite(origen, desde=5, hasta=13)
+    _importar_sqlite(replica, exportado)   # con el filtro viejo: IntegrityError (FOREIGN KEY)
+
+    assert [r[0] for r in exportado["Productos"]] == [10]
+    assert [r[0] for r in exportado["Lotes"]] == [40]
+    assert [r[0] for r in exportado["Compras"]] == [20]
+    assert replica.execute("SELECT COUNT(*) FROM VentaDetalle;").fetchone()[0] == 1
+    assert replica.execute("PRAGMA foreign_key_check;").fetchall() == []
+
+
+def test_sin_cambios_concurrentes_exporta_solo_el_rango(bases):
+    origen, _ = bases
+    _insertar(origen, "Productos", 3, IdProducto=1, Codigo="A")
+    _insertar(origen, "Productos", 7, IdProducto=2, Codigo="B")
+    _insertar(origen, "Productos", 20, IdProducto=3, Codigo="C")
+    assert [r[0] for r in _exportar_sqlite(origen, desde=5, hasta=13)["Productos"]] == [2]
+
+
+# ===================== Una sola transacción SNAPSHOT =====================
+
+class _Cursor:
+    def __init__(self, log):
+        self.log = log
+        self.description = None
+        self._filas = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=()):
+        self.log.append(" ".join(sql.split())[:60])
+        self._filas = [(13,)] if "MIN_ACTIVE_ROWVERSION" in sql else []
+        self.description = [("c", int)]
+
+    def fetchone(self):
+        return self._filas.pop(0) if self._filas else None
+
+    def fetchmany(self, n):
+        filas, self._filas = self._filas[:n], self._filas[n:]
+        return filas
+
+
+class _Conexion:
+    def __init__(self, log):
+        self.log = log
+
+    def cursor(self):
+        return _Cursor(self.log)
+
+    def commit(self):
+        self.log.append("COMMIT")
+
+    def rollback(self):
+        self.log.append("ROLLBACK")
+
+    def close(self):
+        pass
+
+
+def test_exportar_lee_todo_en_una_transaccion_snapshot(tmp_path, monkeypatch):
+    log = []
+    monkeypatch.setattr(db, "conectar", lambda: _Conexion(log))
+    sync.exportar(str(tmp_path), origen="suc1")
+
+    ini = log.index("SET TRANSACTION ISOLATION LEVEL SNAPSHOT;")
+    fin = next(i for i, s in enumerate(log) if s.startswith("SET TRANSACTION ISOLATION LEVEL READ COMMITTED"))
+    lecturas = [i for i, s in enumerate(log) if "MIN_ACTIVE_ROWVERSION" in s or s.startswith("SET NOCOUNT ON; DECLARE")]
+    assert len(lecturas) == 1 + len(sync._TABLAS)
+    assert ini < min(lecturas) and max(lecturas) < fin
+    assert log[ini:fin].count("COMMIT") == 1 and log[fin - 1] == "COMMIT"
+    assert "ROLLBACK" not in log
+
+
+# ===================== Importación real (SQL Server + réplica) =====================
+
+def test_sqlserver_importar_producto_tocado_durante_la_exportacion(sqlserver, tmp_path, monkeypatch):
+    replica = os.environ.get("FARMACIA_TEST_REPLICA")
+    if not replica:
+        pytest.skip("sin base réplica de pruebas (FARMACIA_TEST_REPLICA=<base>)")
+    prov = db.proveedores_listar()
+    if not prov:
+        pytest.skip("se necesita un proveedor")
+    codigo = "TEST-SYNC-" + uuid.uuid4().hex[:8]
+    vence = (dt.date.today() + dt.timedelta(days=90)).isoformat()
+    db.compra_crear(1, prov[0][0], [{"codigo": codigo, "desc": "prueba sync", "cant": 5, "punit": 10, "vence": vence}])
+
+    # una transacción abierta fija MIN_ACTIVE_ROWVERSION; la venta posterior sube el RowVer del
+    # producto y del lote por encima de `hasta`, pero el detalle de la compra queda por debajo
+    fija = db._conectar_directo()
+    try:
+        with fija.cursor() as cur:
+            cur.execute("INSERT INTO dbo.Clientes(Documento, Nombre) VALUES (?, 'fija sync');", (uuid.uuid4().hex[:12],))
+        db.venta_crear(1, None, [{"codigo": codigo, "cant": 1, "punit": 10}])
+        sync.exportar(str(tmp_path))
+    finally:
+        fija.rollback()
+        fija.close()
+
+    monkeypatch.setattr(db, "DATABASE", replica)
+    db.configurar_pool()
+    try:
+        sync.importar(str(tmp_path))
+        cnx = db.conectar()
+        try:
+            with cnx.cursor() as cur:
+                cur.execute("""
+                    SELECT COUNT(*) FROM dbo.Productos p JOIN dbo.Lotes l ON l.IdProducto = p.IdProducto
+                    WHERE p.Codigo = ?;
+                """, (codigo,))
+                assert cur.fetchone()[0] == 1
+        finally:
+            cnx.close()
+    finally:
+        monkeypatch.undo()
+        db.configurar_pool()
@@ -0,0 +1,88 @@
+import datetime as dt
+import uuid
+
+import pytest
+
+pytest.importorskip("pyodbc")   # db_local usa las excepciones de db.py
+
+import db_local
+
+
+@pytest.fixture
+def bd():
+    b = db_local.BDLocal()
+    yield b
+    b.cerrar(borrar=True)
+
+
+def _producto_con_lotes(bd, stock_vencido: int, stock_vigente: int, sin_lote: int = 0):
+    hoy = dt.date.today()
+    bd.cargar_masivo("Productos", ("Codigo", "Descripcion", "Precio", "Stock"),
+                     [("P1", "Producto", 100.0, stock_vencido + stock_vigente + sin_lote)])
+    bd.cargar_masivo("Lotes", ("IdProducto", "Lote", "Vence", "StockLote"),
+                     [(1, "VENCIDO", (hoy - dt.timedelta(days=1)).isoformat(), stock_vencido),
+                      (1, "VIGENTE", (hoy + dt.timedelta(days=30)).isoformat(), stock_vigente)])
+
+
+def _lotes(bd):
+    return dict(bd.consultar("SELECT Lote, StockLote FROM Lotes ORDER BY IdLote;"))
+
+
+def test_fefo_saltea_lote_vencido(bd):
+    _producto_con_lotes(bd, stock_vencido=5, stock_vigente=5)
+    idv = bd.venta_crear(1, None, [{"codigo": "P1", "cant": 3, "punit": 100}])
+    det = bd.consultar("SELECT l.Lote, d.Cantidad FROM VentaDetalle d JOIN Lotes l ON l.IdLote = d.IdLote "
+                       "WHERE d.IdVenta = ?;", (idv,))
+    assert det == [("VIGENTE", 3)]
+    assert _lotes(bd) == {"VENCIDO": 5, "VIGENTE": 2}
+
+
+def test_fefo_resto_sin_lote_cuando_solo_queda_vencido(bd):
+    _producto_con_lotes(bd, stock_vencido=5, stock_vigente=2, sin_lote=4)
+    idv = bd.venta_crear(1, None, [{"codigo": "P1", "cant": 6, "punit": 100}])
+    det = sorted(bd.consultar("SELECT IdLote, Cantidad FROM VentaDetalle WHERE IdVenta = ?;", (idv,)),
+                 key=lambda r: (r[0] is None, r[0]))
+    assert det == [(2, 2), (None, 4)]
+    assert _lotes(bd) == {"VENCIDO": 5, "VIGENTE": 0}
+
+
+def test_sqlserver_fefo_saltea_lote_vencido(sqlserver):
+    db = sqlserver
+    prov = db.proveedores_listar()
+    if not prov:
+        pytest.skip("se necesita un proveedor")
+    hoy = dt.date.today()
+    codigo = "TEST-FEFO-" + uuid.uuid4().hex[:8]
+    db.compra_crear(1, prov[0][0], [
+        {"codigo": codigo, "desc": "prueba FEFO", "cant": 5, "punit": 10, "vence": (hoy - dt.timedelta(days=1)).isoformat()},
+        {"codigo": codigo, "desc": "prueba FEFO", "cant": 5, "punit": 10, "vence": (hoy + dt.timedelta(days=30)).isoformat()},
+    ])
+    idv = db.venta_crear(1, None, [{"codigo": codigo, "cant": 3, "punit": 10}])
+    cnx = db.conectar()
+    try:
+        with cnx.cursor() as cur:
+            cur.execute("""
+                SELECT l.Vence, d.Cantidad FROM dbo.VentaDetalle d JOIN dbo.Lotes l ON l.IdLote = d.IdLote
+                WHERE d.IdVenta = ?;
+            """, (idv,))
+            filas = [(r[0], int(r[1])) for r in cur.fetchall()]
+    finally:
+        cnx.close()
+    assert len(filas) == 1 and filas[0][1] == 3 and filas[0][0] >= hoy
+
+
+def test_faltantes_con_el_error_de_db(bd):
+    import db
+    _producto_con_lotes(bd, stock_vencido=0, stock_vigente=2)
+    with pytest.raises(db.StockInsuficiente) as e:
+        bd.venta_crear(1, None, [{"codigo": "P1", "cant": 5, "punit": 100},
+                                 {"codigo": "NOEXISTE", "cant": 1, "punit": 10}])
+    assert e.value.faltantes == [("NOEXISTE", None, 1), ("P1", 2, 5)]   # en orden de Codigo, como db.py
+    assert "Disponible: 2, pedido: 5" in str(e.value)
+    assert bd.consultar("SELECT COUNT(*) FROM Ventas;") == [(0,)]
+
+
+def test_compra_con_fecha_real(bd):
+    cuando = dt.datetime(2024, 3, 1, 9, 30)
+    idc = bd.compra_crear(1, 1, [{"codigo": "P9", "cant": 1, "punit": 5}], clave="k1", fecha=cuando)
+    assert bd.consultar("SELECT Fecha FROM Compras WHERE IdCompra = ?;", (idc,)) == [("2024-03-01 09:30:00",)]
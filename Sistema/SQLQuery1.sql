@@ -585,3 +585,560 @@ GO
 SELECT TOP 3 * FROM dbo.VentaDetalle ORDER BY IdDet DESC;
 SELECT TOP 3 * FROM dbo.Lotes ORDER BY Vence ASC;
 SELECT Usuario, CONVERT(VARCHAR(64), ClaveHash, 2) AS HashHex FROM dbo.Usuarios ORDER BY Usuario;
+
+
+/* ============================================================
+   12) NUMERACIN DE COMPROBANTES (SEQUENCE, reserva por bloques)
+   db.py reserva rangos con sys.sp_sequence_get_range (hi/lo)
+   ============================================================ */
+IF OBJECT_ID('dbo.seq_nro_venta', 'SO') IS NULL
+BEGIN
+    DECLARE @iniVenta BIGINT = (SELECT ISNULL(MAX(IdVenta),0)+1 FROM dbo.Ventas);
+    EXEC('CREATE SEQUENCE dbo.seq_nro_venta AS BIGINT START WITH ' + CONVERT(VARCHAR(20), @iniVenta) + ' INCREMENT BY 1 CACHE 50;');
+END
+GO
+IF OBJECT_ID('dbo.seq_nro_compra', 'SO') IS NULL
+BEGIN
+    DECLARE @iniCompra BIGINT = (SELECT ISNULL(MAX(IdCompra),0)+1 FROM dbo.Compras);
+    EXEC('CREATE SEQUENCE dbo.seq_nro_compra AS BIGINT START WITH ' + CONVERT(VARCHAR(20), @iniCompra) + ' INCREMENT BY 1 CACHE 50;');
+END
+GO
+
+
+/* ============================================================
+   13) ROWVERSION EN PRODUCTOS (sincronizacin incremental del catlogo)
+   ============================================================ */
+IF COL_LENGTH('dbo.Productos', 'RowVer') IS NULL
+BEGIN
+    ALTER TABLE dbo.Productos ADD RowVer ROWVERSION NOT NULL;
+END
+GO
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name='IX_Productos_RowVer' AND object_id=OBJECT_ID('dbo.Productos'))
+BEGIN
+    CREATE INDEX IX_Productos_RowVer ON dbo.Productos(RowVer);
+END
+GO
+
+
+/* ============================================================
+   14) BSQUEDA POR TRIGRAMAS (reemplaza LIKE '%term%')
+   ============================================================ */
+
+-- 14.1 ndice de trigramas por producto (Codigo + Descripcion normalizados)
+IF OBJECT_ID('dbo.ProductoTrigramas') IS NULL
+BEGIN
+  CREATE TABLE dbo.ProductoTrigramas(
+    Trigrama   NCHAR(3) NOT NULL,
+    IdProducto INT NOT NULL,
+    CONSTRAINT PK_ProductoTrigramas PRIMARY KEY (Trigrama, IdProducto)
+  );
+END
+GO
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name='IX_ProductoTrigramas_Producto' AND object_id=OBJECT_ID('dbo.ProductoTrigramas'))
+  CREATE INDEX IX_ProductoTrigramas_Producto ON dbo.ProductoTrigramas(IdProducto);
+GO
+
+-- 14.2 Normalizacin: minsculas y sin tildes (nombres en espaol)
+IF OBJECT_ID('dbo.fn_trigramas', 'IF') IS NOT NULL
+    DROP FUNCTION dbo.fn_trigramas;
+GO
+IF OBJECT_ID('dbo.fn_normalizar', 'FN') IS NOT NULL
+    DROP FUNCTION dbo.fn_normalizar;
+GO
+CREATE FUNCTION dbo.fn_normalizar(@s NVARCHAR(400))
+RETURNS NVARCHAR(400)
+AS
+BEGIN
+    RETURN TRANSLATE(LOWER(LTRIM(RTRIM(@s))), N'', N'aaaaeeeeiiiioooouuuunc');
+END
+GO
+
+-- 14.3 Trigramas de un texto (con dos espacios al inicio para favorecer prefijos)
+CREATE FUNCTION dbo.fn_trigramas(@texto NVARCHAR(400))
+RETURNS TABLE
+AS
+RETURN
+    WITH t AS (SELECT N'  ' + dbo.fn_normalizar(@texto) AS s),
+         n AS (SELECT TOP (400) ROW_NUMBER() OVER (ORDER BY (SELECT NULL)) AS i FROM sys.all_objects)
+    SELECT DISTINCT CAST(SUBSTRING(t.s, n.i, 3) AS NCHAR(3)) AS Trigrama
+    FROM t JOIN n ON n.i <= LEN(t.s) - 2;
+GO
+
+-- 14.4 Mantener el ndice al dar de alta o renombrar productos (no al mover stock/precio)
+IF OBJECT_ID('dbo.tr_Productos_Trigramas', 'TR') IS NOT NULL
+    DROP TRIGGER dbo.tr_Productos_Trigramas;
+GO
+CREATE TRIGGER dbo.tr_Productos_Trigramas ON dbo.Productos
+AFTER INSERT, UPDATE, DELETE
+AS
+BEGIN
+    SET NOCOUNT ON;
+    IF EXISTS (SELECT 1 FROM inserted) AND NOT (UPDATE(Codigo) OR UPDATE(Descripcion))
+        RETURN;
+
+    DELETE t
+    FROM dbo.ProductoTrigramas t
+    WHERE t.IdProducto IN (SELECT IdProducto FROM deleted UNION SELECT IdProducto FROM inserted);
+
+    INSERT INTO dbo.ProductoTrigramas(Trigrama, IdProducto)
+    SELECT DISTINCT g.Trigrama, i.IdProducto
+    FROM inserted i
+    CROSS APPLY dbo.fn_trigramas(i.Codigo + N' ' + i.Descripcion) g;
+END
+GO
+
+-- 14.5 Carga inicial
+IF NOT EXISTS (SELECT 1 FROM dbo.ProductoTrigramas)
+  INSERT INTO dbo.ProductoTrigramas(Trigrama, IdProducto)
+  SELECT DISTINCT g.Trigrama, p.IdProducto
+  FROM dbo.Productos p
+  CROSS APPLY dbo.fn_trigramas(p.Codigo + N' ' + p.Descripcion) g;
+GO
+
+-- 14.6 Productos que comparten al menos la mitad de los trigramas del trmino (tolera errores de tipeo)
+IF OBJECT_ID('dbo.fn_productos_coinciden', 'IF') IS NOT NULL
+    DROP FUNCTION dbo.fn_productos_coinciden;
+GO
+CREATE FUNCTION dbo.fn_productos_coinciden(@term NVARCHAR(100))
+RETURNS TABLE
+AS
+RETURN
+    WITH q  AS (SELECT Trigrama FROM dbo.fn_trigramas(@term)),
+         nq AS (SELECT COUNT(*) AS n FROM q)
+    SELECT t.IdProducto, CAST(COUNT(*) AS FLOAT) / MAX(nq.n) AS Score
+    FROM q
+    JOIN dbo.ProductoTrigramas t ON t.Trigrama = q.Trigrama
+    CROSS JOIN nq
+    GROUP BY t.IdProducto
+    HAVING COUNT(*) * 2 >= MAX(nq.n);
+GO
+
+-- 14.7 Top-k ordenado: cdigo que empieza con el trmino, similitud, descripcin ms corta
+IF OBJECT_ID('dbo.sp_productos_buscar', 'P') IS NOT NULL
+    DROP PROCEDURE dbo.sp_productos_buscar;
+GO
+CREATE PROCEDURE dbo.sp_productos_buscar
+    @term NVARCHAR(100),
+    @top  INT = 10
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SELECT TOP (@top)
+           p.Codigo, p.Descripcion, p.Precio, p.Stock, c.Score
+    FROM dbo.fn_productos_coinciden(@term) c
+    JOIN dbo.Productos p ON p.IdProducto = c.IdProducto
+    ORDER BY
+        CASE WHEN p.Codigo LIKE @term + '%' THEN 0 ELSE 1 END,
+        c.Score DESC,
+        LEN(p.Descripcion),
+        p.Descripcion;
+END
+GO
+
+-- 14.8 El autocompletado de la seccin 9 pasa a usar el ndice de trigramas
+IF OBJECT_ID('dbo.sp_productos_sugerir', 'P') IS NOT NULL
+    DROP PROCEDURE dbo.sp_productos_sugerir;
+GO
+CREATE PROCEDURE dbo.sp_productos_sugerir
+    @term NVARCHAR(100)
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SELECT TOP (10)
+           p.Codigo, p.Descripcion, p.Precio, p.Stock
+    FROM dbo.fn_productos_coinciden(@term) c
+    JOIN dbo.Productos p ON p.IdProducto = c.IdProducto
+    ORDER BY
+        CASE WHEN p.Codigo LIKE @term + '%' THEN 0 ELSE 1 END,
+        c.Score DESC,
+        p.Descripcion;
+END
+GO
+
+
+/* ============================================================
+   15) ALERTAS DE VENCIMIENTO (conjunto precalculado e incremental)
+   LotesAlerta = lotes con stock que vencen dentro de 'dias_vencimiento_alerta'
+   Estado: 'P' prximo a vencer, 'V' vencido con stock
+   ============================================================ */
+IF OBJECT_ID('dbo.LotesAlerta') IS NULL
+BEGIN
+  CREATE TABLE dbo.LotesAlerta(
+    IdLote     INT NOT NULL CONSTRAINT PK_LotesAlerta PRIMARY KEY,
+    IdProducto INT NOT NULL,
+    Vence      DATE NOT NULL,
+    StockLote  INT NOT NULL,
+    Estado     CHAR(1) NOT NULL CONSTRAINT CK_LotesAlerta_Estado CHECK (Estado IN ('P','V'))
+  );
+END
+GO
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name='IX_LotesAlerta_Estado_Vence' AND object_id=OBJECT_ID('dbo.LotesAlerta'))
+  CREATE INDEX IX_LotesAlerta_Estado_Vence ON dbo.LotesAlerta(Estado, Vence);
+GO
+
+-- 15.1 Mantener el conjunto cuando compras crean lotes y ventas descuentan StockLote
+IF OBJECT_ID('dbo.tr_Lotes_Alerta', 'TR') IS NOT NULL
+    DROP TRIGGER dbo.tr_Lotes_Alerta;
+GO
+CREATE TRIGGER dbo.tr_Lotes_Alerta ON dbo.Lotes
+AFTER INSERT, UPDATE, DELETE
+AS
+BEGIN
+    SET NOCOUNT ON;
+    IF EXISTS (SELECT 1 FROM inserted) AND NOT (UPDATE(StockLote) OR UPDATE(Vence) OR UPDATE(IdProducto))
+        RETURN;
+
+    DECLARE @dias INT = ISNULL(TRY_CAST((SELECT Valor FROM dbo.Parametros WHERE Clave='dias_vencimiento_alerta') AS INT), 30);
+    DECLARE @hoy DATE = CAST(GETDATE() AS DATE);
+
+    DELETE a
+    FROM dbo.LotesAlerta a
+    WHERE a.IdLote IN (SELECT IdLote FROM deleted UNION SELECT IdLote FROM inserted);
+
+    INSERT INTO dbo.LotesAlerta(IdLote, IdProducto, Vence, StockLote, Estado)
+    SELECT i.IdLote, i.IdProducto, i.Vence, i.StockLote, CASE WHEN i.Vence < @hoy THEN 'V' ELSE 'P' END
+    FROM inserted i
+    WHERE i.StockLote > 0
+      AND i.Vence <= DATEADD(DAY, @dias, @hoy);
+END
+GO
+
+-- 15.2 Barrido diario: solo procesa el cambio de da (lotes que entran a la ventana y
+--      prximos que pasan a vencidos). Reconstruye todo si cambi el parmetro de das.
+IF OBJECT_ID('dbo.sp_alertas_vencimiento_barrido', 'P') IS NOT NULL
+    DROP PROCEDURE dbo.sp_alertas_vencimiento_barrido;
+GO
+CREATE PROCEDURE dbo.sp_alertas_vencimiento_barrido
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+    DECLARE @dias INT = ISNULL(TRY_CAST((SELECT Valor FROM dbo.Parametros WHERE Clave='dias_vencimiento_alerta') AS INT), 30);
+    DECLARE @hoy DATE = CAST(GETDATE() AS DATE);
+
+    BEGIN TRAN;
+        DECLARE @ultimo DATE =
+          TRY_CAST((SELECT Valor FROM dbo.Parametros WITH (UPDLOCK, ROWLOCK) WHERE Clave='alerta_venc_barrido') AS DATE);
+        DECLARE @diasUsados INT =
+          TRY_CAST((SELECT Valor FROM dbo.Parametros WHERE Clave='alerta_venc_dias') AS INT);
+
+        IF @ultimo IS NULL OR @diasUsados IS NULL OR @diasUsados <> @dias
+        BEGIN
+            DELETE FROM dbo.LotesAlerta;
+            INSERT INTO dbo.LotesAlerta(IdLote, IdProducto, Vence, StockLote, Estado)
+            SELECT l.IdLote, l.IdProducto, l.Vence, l.StockLote, CASE WHEN l.Vence < @hoy THEN 'V' ELSE 'P' END
+            FROM dbo.Lotes l
+            WHERE l.StockLote > 0
+              AND l.Vence <= DATEADD(DAY, @dias, @hoy);
+        END
+        ELSE IF @ultimo < @hoy
+        BEGIN
+            INSERT INTO dbo.LotesAlerta(IdLote, IdProducto, Vence, StockLote, Estado)
+            SELECT l.IdLote, l.IdProducto, l.Vence, l.StockLote, 'P'
+            FROM dbo.Lotes l
+            WHERE l.Vence >  DATEADD(DAY, @dias, @ultimo)
+              AND l.Vence <= DATEADD(DAY, @dias, @hoy)
+              AND l.StockLote > 0
+              AND NOT EXISTS (SELECT 1 FROM dbo.LotesAlerta a WHERE a.IdLote = l.IdLote);
+
+            UPDATE dbo.LotesAlerta SET Estado = 'V'
+            WHERE Estado = 'P' AND Vence < @hoy;
+        END
+
+        MERGE dbo.Parametros AS T
+        USING (SELECT 'alerta_venc_barrido' AS Clave, CONVERT(NVARCHAR(10), @hoy, 23) AS Valor
+               UNION ALL
+               SELECT 'alerta_venc_dias', CONVERT(NVARCHAR(10), @dias)) AS S
+        ON T.Clave = S.Clave
+        WHEN MATCHED THEN UPDATE SET T.Valor = S.Valor
+        WHEN NOT MATCHED THEN INSERT(Clave, Valor) VALUES(S.Clave, S.Valor);
+    COMMIT TRAN;
+
+    SELECT ISNULL(SUM(CASE WHEN Estado='P' THEN 1 ELSE 0 END), 0) AS Proximos,
+           ISNULL(SUM(CASE WHEN Estado='V' THEN 1 ELSE 0 END), 0) AS Vencidos,
+           ISNULL(SUM(CASE WHEN Estado='V' THEN StockLote ELSE 0 END), 0) AS UnidadesVencidas
+    FROM dbo.LotesAlerta;
+END
+GO
+EXEC dbo.sp_alertas_vencimiento_barrido;
+GO
+
+
+/* ============================================================
+   16) ACUMULADOS PARA REPORTES (se actualizan en venta_crear/compra_crear)
+   ============================================================ */
+
+-- 16.1 Costo promedio ponderado de compra por producto (para mrgenes)
+IF OBJECT_ID('dbo.ProductoCosto') IS NULL
+BEGIN
+  CREATE TABLE dbo.ProductoCosto(
+    IdProducto   INT NOT NULL CONSTRAINT PK_ProductoCosto PRIMARY KEY,
+    CostoProm    DECIMAL(18,4) NOT NULL,
+    CantComprada BIGINT NOT NULL
+  );
+END
+GO
+
+-- 16.2 Ventas por da / producto / usuario
+IF OBJECT_ID('dbo.VentasDiaProducto') IS NULL
+BEGIN
+  CREATE TABLE dbo.VentasDiaProducto(
+    Fecha      DATE NOT NULL,
+    IdProducto INT NOT NULL,
+    UsuarioId  INT NOT NULL,
+    Cantidad   INT NOT NULL,
+    Importe    DECIMAL(18,2) NOT NULL,
+    Costo      DECIMAL(18,2) NOT NULL,
+    Tickets    INT NOT NULL,    -- ventas que incluyen el producto
+    CONSTRAINT PK_VentasDiaProducto PRIMARY KEY (Fecha, IdProducto, UsuarioId)
+  );
+END
+GO
+
+-- 16.3 Ventas por da / usuario (cantidad de tickets y total cobrado)
+IF OBJECT_ID('dbo.VentasDiaUsuario') IS NULL
+BEGIN
+  CREATE TABLE dbo.VentasDiaUsuario(
+    Fecha     DATE NOT NULL,
+    UsuarioId INT NOT NULL,
+    Tickets   INT NOT NULL,
+    Total     DECIMAL(18,2) NOT NULL,
+    CONSTRAINT PK_VentasDiaUsuario PRIMARY KEY (Fecha, UsuarioId)
+  );
+END
+GO
+
+-- 16.4 Carga inicial desde el historial (solo si estn vacas)
+IF NOT EXISTS (SELECT 1 FROM dbo.ProductoCosto)
+  INSERT INTO dbo.ProductoCosto(IdProducto, CostoProm, CantComprada)
+  SELECT IdProducto, SUM(Subtotal) / SUM(Cantidad), SUM(Cantidad)
+  FROM dbo.CompraDetalle
+  GROUP BY IdProducto;
+
+IF NOT EXISTS (SELECT 1 FROM dbo.VentasDiaProducto)
+  INSERT INTO dbo.VentasDiaProducto(Fecha, IdProducto, UsuarioId, Cantidad, Importe, Costo, Tickets)
+  SELECT CAST(v.Fecha AS DATE), d.IdProducto, v.UsuarioId,
+         SUM(d.Cantidad), SUM(d.Subtotal), SUM(d.Cantidad * ISNULL(c.CostoProm, 0)), COUNT(DISTINCT v.IdVenta)
+  FROM dbo.Ventas v
+  JOIN dbo.VentaDetalle d ON d.IdVenta = v.IdVenta
+  LEFT JOIN dbo.ProductoCosto c ON c.IdProducto = d.IdProducto
+  GROUP BY CAST(v.Fecha AS DATE), d.IdProducto, v.UsuarioId;
+
+IF NOT EXISTS (SELECT 1 FROM dbo.VentasDiaUsuario)
+  INSERT INTO dbo.VentasDiaUsuario(Fecha, UsuarioId, Tickets, Total)
+  SELECT CAST(Fecha AS DATE), UsuarioId, COUNT(*), SUM(Total)
+  FROM dbo.Ventas
+  GROUP BY CAST(Fecha AS DATE), UsuarioId;
+GO
+
+
+/* ============================================================
+   17) CAJA: saldo corriente por apertura
+   Saldo = MontoInicial + ING + VEN - EGR - COM (lo mantiene el trigger de CajaMov)
+   ============================================================ */
+IF COL_LENGTH('dbo.CajaAperturas', 'Saldo') IS NULL
+BEGIN
+    ALTER TABLE dbo.CajaAperturas ADD
+        Saldo       DECIMAL(18,2) NOT NULL CONSTRAINT DF_CajaAperturas_Saldo DEFAULT (0),
+        Movimientos INT NOT NULL CONSTRAINT DF_CajaAperturas_Movimientos DEFAULT (0);
+END
+GO
+IF NOT EXISTS (SELECT 1 FROM sys.check_constraints WHERE name='CK_CajaMov_Tipo')
+  ALTER TABLE dbo.CajaMov ADD CONSTRAINT CK_CajaMov_Tipo CHECK (Tipo IN ('ING','EGR','VEN','COM'));
+GO
+-- una sola caja abierta por usuario
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name='UX_CajaAperturas_Abierta' AND object_id=OBJECT_ID('dbo.CajaAperturas'))
+  CREATE UNIQUE INDEX UX_CajaAperturas_Abierta ON dbo.CajaAperturas(UsuarioId) WHERE Estado = 'A';
+GO
+
+-- 17.1 Saldo y cantidad de movimientos al da desde el historial
+UPDATE a SET
+    Saldo = a.MontoInicial + ISNULL(m.Neto, 0),
+    Movimientos = ISNULL(m.Cant, 0)
+FROM dbo.CajaAperturas a
+LEFT JOIN (
+    SELECT IdApertura,
+           SUM(CASE WHEN Tipo IN ('EGR','COM') THEN -Monto ELSE Monto END) AS Neto,
+           COUNT(*) AS Cant
+    FROM dbo.CajaMov
+    GROUP BY IdApertura
+) m ON m.IdApertura = a.IdApertura;
+GO
+
+-- 17.2 Cada movimiento actualiza el saldo de su apertura
+IF OBJECT_ID('dbo.tr_CajaMov_Saldo', 'TR') IS NOT NULL
+    DROP TRIGGER dbo.tr_CajaMov_Saldo;
+GO
+CREATE TRIGGER dbo.tr_CajaMov_Saldo ON dbo.CajaMov
+AFTER INSERT
+AS
+BEGIN
+    SET NOCOUNT ON;
+    IF EXISTS (SELECT 1 FROM inserted i JOIN dbo.CajaAperturas a ON a.IdApertura = i.IdApertura WHERE a.Estado <> 'A')
+        THROW 50020, 'La caja est cerrada.', 1;
+
+    UPDATE a SET
+        Saldo = a.Saldo + i.Neto,
+        Movimientos = a.Movimientos + i.Cant
+    FROM dbo.CajaAperturas a
+    JOIN (
+        SELECT IdApertura,
+               SUM(CASE WHEN Tipo IN ('EGR','COM') THEN -Monto ELSE Monto END) AS Neto,
+               COUNT(*) AS Cant
+        FROM inserted
+        GROUP BY IdApertura
+    ) i ON i.IdApertura = a.IdApertura;
+END
+GO
+
+
+/* ============================================================
+   18) IMGENES: bsqueda de la imagen de cada producto sin leer el blob
+   ============================================================ */
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name='IX_producto_imagenes_producto' AND object_id=OBJECT_ID('dbo.producto_imagenes'))
+  CREATE INDEX IX_producto_imagenes_producto ON dbo.producto_imagenes(id_producto, id_imagen) INCLUDE (creado_en);
+GO
+
+
+/* ============================================================
+   19) DIARIO LOCAL: idempotencia de operaciones reenviadas y ajustes de stock
+   ============================================================ */
+IF OBJECT_ID('dbo.OperacionesAplicadas') IS NULL
+BEGIN
+  CREATE TABLE dbo.OperacionesAplicadas(
+    Clave     VARCHAR(40) NOT NULL CONSTRAINT PK_OperacionesAplicadas PRIMARY KEY,
+    Tipo      CHAR(3)     NOT NULL,          -- VEN / COM / AJU (ajuste de faltantes del diario)
+    IdRemoto  INT         NOT NULL,          -- IdVenta / IdCompra / productos ajustados
+    Fecha     DATETIME2   NOT NULL
+  );
+END
+GO
+
+IF OBJECT_ID('dbo.AjustesStock') IS NULL
+BEGIN
+  CREATE TABLE dbo.AjustesStock(
+    IdAjuste   INT IDENTITY(1,1) CONSTRAINT PK_AjustesStock PRIMARY KEY,
+    Fecha      DATETIME2    NOT NULL,
+    IdProducto INT          NOT NULL CONSTRAINT FK_AjustesStock_Productos REFERENCES dbo.Productos(IdProducto),
+    Cantidad   INT          NOT NULL,
+    Motivo     VARCHAR(200) NOT NULL,
+    UsuarioId  INT          NOT NULL
+  );
+END
+GO
+
+
+/* ============================================================
+   20) CONCILIACIN DE STOCK: checksum por tramo de IdProducto (ver conciliacion.py)
+   ============================================================ */
+IF OBJECT_ID('dbo.ConciliacionRangos') IS NULL
+BEGIN
+  CREATE TABLE dbo.ConciliacionRangos(
+    Tam          INT       NOT NULL,          -- productos por tramo con que se calcul
+    Rango        INT       NOT NULL,          -- IdProducto / Tam
+    ChkProductos INT       NOT NULL,          -- CHECKSUM_AGG de (IdProducto, Stock)
+    ChkLotes     INT       NOT NULL,          -- CHECKSUM_AGG de (IdLote, IdProducto, StockLote)
+    Revisado     DATETIME2 NOT NULL,
+    Diferencias  INT       NOT NULL,          -- productos con exceso en lotes al revisarlo
+    CONSTRAINT PK_ConciliacionRangos PRIMARY KEY (Tam, Rango)
+  );
+END
+GO
+
+
+/* ============================================================
+   21) ROWVERSION PARA LA EXPORTACIN INCREMENTAL A CASA CENTRAL (ver sincronizacion.py)
+   Productos ya lo tiene (seccin 13). La primera vez reescribe cada tabla: correr fuera de horario.
+   ============================================================ */
+IF COL_LENGTH('dbo.Clientes', 'RowVer') IS NULL
+BEGIN
+    ALTER TABLE dbo.Clientes ADD RowVer ROWVERSION NOT NULL;
+END
+GO
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name='IX_Clientes_RowVer' AND object_id=OBJECT_ID('dbo.Clientes'))
+BEGIN
+    CREATE INDEX IX_Clientes_RowVer ON dbo.Clientes(RowVer);
+END
+GO
+IF COL_LENGTH('dbo.Proveedores', 'RowVer') IS NULL
+BEGIN
+    ALTER TABLE dbo.Proveedores ADD RowVer ROWVERSION NOT NULL;
+END
+GO
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name='IX_Proveedores_RowVer' AND object_id=OBJECT_ID('dbo.Proveedores'))
+BEGIN
+    CREATE INDEX IX_Proveedores_RowVer ON dbo.Proveedores(RowVer);
+END
+GO
+IF COL_LENGTH('dbo.Usuarios', 'RowVer') IS NULL
+BEGIN
+    ALTER TABLE dbo.Usuarios ADD RowVer ROWVERSION NOT NULL;
+END
+GO
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name='IX_Usuarios_RowVer' AND object_id=OBJECT_ID('dbo.Usuarios'))
+BEGIN
+    CREATE INDEX IX_Usuarios_RowVer ON dbo.Usuarios(RowVer);
+END
+GO
+IF COL_LENGTH('dbo.Lotes', 'RowVer') IS NULL
+BEGIN
+    ALTER TABLE dbo.Lotes ADD RowVer ROWVERSION NOT NULL;
+END
+GO
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name='IX_Lotes_RowVer' AND object_id=OBJECT_ID('dbo.Lotes'))
+BEGIN
+    CREATE INDEX IX_Lotes_RowVer ON dbo.Lotes(RowVer);
+END
+GO
+IF COL_LENGTH('dbo.Compras', 'RowVer') IS NULL
+BEGIN
+    ALTER TABLE dbo.Compras ADD RowVer ROWVERSION NOT NULL;
+END
+GO
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name='IX_Compras_RowVer' AND object_id=OBJECT_ID('dbo.Compras'))
+BEGIN
+    CREATE INDEX IX_Compras_RowVer ON dbo.Compras(RowVer);
+END
+GO
+IF COL_LENGTH('dbo.CompraDetalle', 'RowVer') IS NULL
+BEGIN
+    ALTER TABLE dbo.CompraDetalle ADD RowVer ROWVERSION NOT NULL;
+END
+GO
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name='IX_CompraDetalle_RowVer' AND object_id=OBJECT_ID('dbo.CompraDetalle'))
+BEGIN
+    CREATE INDEX IX_CompraDetalle_RowVer ON dbo.CompraDetalle(RowVer);
+END
+GO
+IF COL_LENGTH('dbo.Ventas', 'RowVer') IS NULL
+BEGIN
+    ALTER TABLE dbo.Ventas ADD RowVer ROWVERSION NOT NULL;
+END
+GO
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name='IX_Ventas_RowVer' AND object_id=OBJECT_ID('dbo.Ventas'))
+BEGIN
+    CREATE INDEX IX_Ventas_RowVer ON dbo.Ventas(RowVer);
+END
+GO
+IF COL_LENGTH('dbo.VentaDetalle', 'RowVer') IS NULL
+BEGIN
+    ALTER TABLE dbo.VentaDetalle ADD RowVer ROWVERSION NOT NULL;
+END
+GO
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name='IX_VentaDetalle_RowVer' AND object_id=OBJECT_ID('dbo.VentaDetalle'))
+BEGIN
+    CREATE INDEX IX_VentaDetalle_RowVer ON dbo.VentaDetalle(RowVer);
+END
+GO
+
+
+/* ============================================================
+   22) AISLAMIENTO SNAPSHOT PARA LA EXPORTACIN (ver sincronizacion.py)
+   La exportacin lee todas las tablas en una sola transaccin SNAPSHOT para que cabeceras y
+   detalles salgan del mismo instante. No cambia el comportamiento de las dems conexiones.
+   ============================================================ */
+IF NOT EXISTS (SELECT 1 FROM sys.databases WHERE database_id = DB_ID() AND snapshot_isolation_state = 1)
+BEGIN
+    ALTER DATABASE CURRENT SET ALLOW_SNAPSHOT_ISOLATION ON;
+END
+GO